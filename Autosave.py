@@ -0,0 +1,100 @@
+import os
+import threading
+from colorama import Fore, Style
+import Events
+
+# Write data to path so that a crash leaves either the old file or the new one,
+# never half of each
+def write_atomic(path, data):
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+    # Make the rename itself durable
+    if hasattr(os, "O_DIRECTORY"):
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+# This class saves the GUI in the background every few seconds. It follows the
+# model events, so a save is skipped entirely when nothing has changed. The GUI
+# is serialized to memory first (pickled unless another serialize function is
+# given) and only the slow disk write runs off the critical path, so menus and
+# scheduled operations are never held up by it.
+class Autosave():
+    def __init__(self, gui, path="data.pkl", interval=30, retries=3, serialize=None):
+        self.gui = gui
+        self.serialize = serialize if serialize is not None else gui.snapshot
+        self.path = path
+        self.interval = interval
+        self.retries = retries
+        self.saves = 0
+        self.skipped = 0
+        self._generation = 1
+        self._saved_generation = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # Magic Methods
+    def __str__(self):
+        return f"Autosave: {self.path} every {self.interval}s ({self.saves} saves, {self.skipped} skipped)"
+    def __repr__(self):
+        return f"Autosave(path={self.path}, interval={self.interval}, dirty={self.dirty})"
+
+    @property
+    def dirty(self):
+        return self._generation != self._saved_generation
+
+    # Start following changes and saving in the background
+    def start(self):
+        Events.subscribe(self._on_event)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="autosave", daemon=True)
+        self._thread.start()
+
+    # Stop the background thread and write anything that is still unsaved
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        Events.unsubscribe(self._on_event)
+        self.save()
+
+    def _on_event(self, obj, event, data):
+        self._generation += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.save()
+            except Exception as e:
+                # Pickling while another thread changes the model, or an unpicklable value, must not
+                # end the thread. The changes stay unsaved and the next interval tries again.
+                print(Fore.RED + f"✗ Autosave failed: {e}" + Style.RESET_ALL)
+
+    # Save the GUI if it changed since the last save. Returns True if a file was written.
+    def save(self):
+        with self._lock:
+            generation = self._generation
+            if generation == self._saved_generation:
+                self.skipped += 1
+                return False
+            data = self.serialize()
+            # A change made while pickling may be half in the snapshot, so try again.
+            # After a few attempts, keep this one and leave the flag dirty for the next save.
+            for _ in range(self.retries):
+                if self._generation == generation:
+                    break
+                generation = self._generation
+                data = self.serialize()
+            write_atomic(self.path, data)
+            self._saved_generation = generation
+            self.saves += 1
+            return True
@@ -0,0 +1,225 @@
+import argparse
+import contextlib
+import gc
+import json
+import os
+import pickle
+import platform
+import threading
+import time
+import tracemalloc
+from colorama import Fore, Style
+import Events
+import SmartDevice
+import Scheduler
+import Network
+import User
+import main
+
+# A light that records how late each scheduled call ran
+class BenchmarkLight(SmartDevice.SmartLight):
+    lateness = []
+
+    def record_fire(self, due_time):
+        BenchmarkLight.lateness.append(time.monotonic() - due_time)
+
+
+# Stands in for a device as it was before the model used __slots__, with its attributes in a __dict__
+class DictDevice():
+    pass
+
+# Device types the memory benchmark measures, with the arguments to make one
+DEVICE_TYPES = ((SmartDevice.SmartLight, ()), (SmartDevice.SmartThermostat, ()), (SmartDevice.SmartCamera, ()),
+                (SmartDevice.SmartAppliance, ("Washing Machine",)), (SmartDevice.SmartSpeaker, ()), (SmartDevice.SmartLock, ()),
+                (SmartDevice.SmartDoorbell, ()), (SmartDevice.SmartDoor, ()))
+
+
+# Value at a percentile of an already sorted list
+def percentile(values, pct):
+    if not values:
+        return None
+    idx = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[idx]
+
+def summarise(values, scale=1000.0):
+    values = sorted(values)
+    return {
+        "count": len(values),
+        "p50_ms": percentile(values, 50) * scale if values else None,
+        "p90_ms": percentile(values, 90) * scale if values else None,
+        "p99_ms": percentile(values, 99) * scale if values else None,
+        "max_ms": values[-1] * scale if values else None,
+    }
+
+# Start every run from an empty registry and a fresh scheduler
+def reset_state():
+    SmartDevice.SmartDevice.get_scheduler().shutdown(wait=False)
+    SmartDevice.SmartDevice.set_scheduler(Scheduler.Scheduler())
+    SmartDevice.SmartDevice.set_scheduled_operations([])
+    BenchmarkLight.lateness = []
+    gc.collect()
+
+# Build a GUI with the devices spread over M networks and their homes
+def build_fleet(devices, networks, homes_per_network):
+    gui = main.GUI()
+    homes = []
+    for n in range(networks):
+        network = Network.Network(str(n + 1))
+        gui.add_network(network)
+        for h in range(homes_per_network):
+            homes.append(User.SmartHome(network, f"Home {n + 1}-{h + 1}"))
+    fleet = []
+    for i in range(devices):
+        device = BenchmarkLight(f"Light {i}")
+        homes[i % len(homes)].add_smart_device(device)
+        fleet.append(device)
+    return gui, fleet
+
+# Arm K operations, recording arm latency, memory per pending operation and thread count
+def bench_arm(fleet, operations, recurring_fraction, delay):
+    recurring_count = int(operations * recurring_fraction)
+    latencies = []
+    gc.collect()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    for i in range(operations):
+        device = fleet[i % len(fleet)]
+        recurring = i < recurring_count
+        start = time.perf_counter()
+        if recurring:
+            operation = SmartDevice.ScheduledOperation(device.serial_number, "turn_on", 3600, True)
+        else:
+            operation = SmartDevice.ScheduledOperation(device.serial_number, "record_fire", delay, False, time.monotonic() + delay)
+        operation.load(device)
+        latencies.append(time.perf_counter() - start)
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "operations": operations,
+        "recurring": recurring_count,
+        "one_shot": operations - recurring_count,
+        "arm_latency": summarise(latencies),
+        "bytes_per_pending_operation": (after - before) / operations if operations else None,
+        "threads_after_arm": threading.active_count(),
+    }
+
+# Wait for the one-shot operations to fire and report how late they ran
+def bench_fire(expected, timeout):
+    deadline = time.monotonic() + timeout
+    max_threads = threading.active_count()
+    while len(BenchmarkLight.lateness) < expected and time.monotonic() < deadline:
+        max_threads = max(max_threads, threading.active_count())
+        time.sleep(0.01)
+    return {
+        "fired": len(BenchmarkLight.lateness),
+        "expected": expected,
+        "lateness": summarise(BenchmarkLight.lateness),
+        "max_threads_while_firing": max_threads,
+    }
+
+# Pickle the GUI the way main.py does and time loading it back with its schedules
+def bench_restore(gui):
+    gui.scheduled_operations = list(SmartDevice.SmartDevice.get_scheduled_operations())
+    start = time.perf_counter()
+    blob = pickle.dumps(gui)
+    dump_seconds = time.perf_counter() - start
+    gui.scheduled_operations = []
+    reset_state()
+    start = time.perf_counter()
+    restored = pickle.loads(blob)
+    load_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    restored.load_scheduals()
+    schedule_seconds = time.perf_counter() - start
+    return {
+        "snapshot_bytes": len(blob),
+        "dump_seconds": dump_seconds,
+        "unpickle_seconds": load_seconds,
+        "load_scheduals_seconds": schedule_seconds,
+        "restore_seconds": load_seconds + schedule_seconds,
+        "restored_operations": len(SmartDevice.SmartDevice.get_scheduled_operations()),
+    }
+
+# Bytes tracemalloc sees for count objects made by build
+def measure(build, count):
+    gc.collect()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    objects = [build() for _ in range(count)]
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objects
+    return (after - before) / count
+
+# Bytes per device of each device type with __slots__, and with a __dict__ like before.
+# Both share the same attribute values, so only the objects themselves are measured.
+def bench_memory(count):
+    results = {}
+    for cls, args in DEVICE_TYPES:
+        template = cls("Memory", *args)
+        state = template.__getstate__()
+        # Only the template takes a device id, and it gives it back straight away
+        template.dispose(report=False)
+        def build_slots():
+            device = cls.__new__(cls)
+            # The copies share the template's serial number, so they must not adopt its id
+            Events.Observable.__setstate__(device, state)
+            return device
+        def build_dict():
+            device = DictDevice()
+            device.__dict__.update(state)
+            return device
+        dict_bytes = measure(build_dict, count)
+        slots_bytes = measure(build_slots, count)
+        results[cls.__name__] = {
+            "dict_bytes_per_device": dict_bytes,
+            "slots_bytes_per_device": slots_bytes,
+            "saved_percent": 100 * (dict_bytes - slots_bytes) / dict_bytes if dict_bytes else None,
+        }
+    return results
+
+def run(args):
+    results = {
+        "benchmark": "scheduler",
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "parameters": vars(args).copy(),
+    }
+    reset_state()
+    # The devices print every change, which would swamp the measurements
+    verbose = SmartDevice.SmartDevice.is_verbose()
+    SmartDevice.SmartDevice.set_verbose(False)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        gui, fleet = build_fleet(args.devices, args.networks, args.homes)
+        results["build_seconds"] = time.perf_counter() - start
+        results["arm"] = bench_arm(fleet, args.operations, args.recurring, args.delay)
+        results["fire"] = bench_fire(results["arm"]["one_shot"], args.delay + args.timeout)
+        results["restore"] = bench_restore(gui)
+        results["memory"] = bench_memory(args.memory_devices)
+    SmartDevice.SmartDevice.set_verbose(verbose)
+    reset_state()
+    return results
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the scheduled operation path.")
+    parser.add_argument("--devices", type=int, default=10000, help="number of devices (N)")
+    parser.add_argument("--networks", type=int, default=4, help="number of networks (M)")
+    parser.add_argument("--homes", type=int, default=25, help="smart homes per network")
+    parser.add_argument("--operations", type=int, default=20000, help="number of scheduled operations (K)")
+    parser.add_argument("--recurring", type=float, default=0.5, help="fraction of operations that recur")
+    parser.add_argument("--delay", type=int, default=2, help="seconds until the one-shot operations fire")
+    parser.add_argument("--timeout", type=float, default=30, help="extra seconds to wait for one-shot operations")
+    parser.add_argument("--memory-devices", type=int, default=10000, help="devices of each type for the memory benchmark")
+    parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = run(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(Fore.GREEN + f"✓ Benchmark results written to {args.output}" + Style.RESET_ALL)
+    else:
+        print(json.dumps(results, indent=2))
@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+import threading
+import time as time_module
+
+# This class is the real clock used by the scheduler. time() is a monotonic
+# count of seconds used for due times, now() is the wall clock datetime used
+# for "HH:MM" and other recurrence expressions.
+class SystemClock():
+    realtime = True
+
+    # Magic Methods
+    def __str__(self):
+        return f"SystemClock: {self.now():%Y-%m-%d %H:%M:%S}"
+    def __repr__(self):
+        return "SystemClock()"
+
+    def time(self):
+        return time_module.monotonic()
+
+    def now(self):
+        return datetime.now()
+
+
+# This class is a simulated clock. It only moves when advanced, and a scheduler
+# using it jumps straight from one due operation to the next, so a week of
+# schedules can be replayed in seconds.
+class VirtualClock():
+    realtime = False
+
+    def __init__(self, start=None):
+        self.start = start if start is not None else datetime.now()
+        self._time = 0.0
+        self._lock = threading.Lock()
+
+    # Magic Methods
+    def __str__(self):
+        return f"VirtualClock: {self.now():%Y-%m-%d %H:%M:%S}"
+    def __repr__(self):
+        return f"VirtualClock(start={self.start}, elapsed={self._time})"
+
+    def time(self):
+        return self._time
+
+    def now(self):
+        return self.start + timedelta(seconds=self._time)
+
+    # Move the clock forward by a number of seconds
+    def advance(self, seconds):
+        if seconds < 0:
+            raise ValueError("A virtual clock cannot go backwards.")
+        with self._lock:
+            self._time += seconds
+        return self._time
+
+    # Move the clock forward to a time on its own scale, never backwards
+    def set_time(self, value):
+        with self._lock:
+            self._time = max(self._time, value)
+        return self._time
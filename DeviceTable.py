@@ -0,0 +1,288 @@
+import heapq
+import threading
+import weakref
+import Events
+import Network
+import SmartDevice
+import User
+
+# NumPy is optional, the device table is only available when it is installed
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Device types that count towards a home's security score
+SECURE_TYPES = Network.SECURE_TYPES
+
+_table = None
+
+
+# This class numbers the homes or the networks of a device table. It only holds
+# them weakly, so the table never keeps a removed home or network alive, and a
+# number given back by remove() is handed out again, so the numbers stay dense.
+class _Numbering():
+    def __init__(self):
+        self._numbers = weakref.WeakKeyDictionary()
+        self._free = []
+        self.size = 0
+
+    # Magic Methods
+    def __str__(self):
+        return f"_Numbering: {len(self)} numbered"
+    def __repr__(self):
+        return f"_Numbering(numbered={len(self)}, size={self.size})"
+    def __len__(self):
+        return len(self._numbers)
+
+    def get(self, obj, default=None):
+        return self._numbers.get(obj, default)
+
+    # The number of an object, giving it one if it has none
+    def number(self, obj):
+        number = self._numbers.get(obj)
+        if number is None:
+            if self._free:
+                number = heapq.heappop(self._free)
+            else:
+                number = self.size
+                self.size += 1
+            self._numbers[obj] = number
+        return number
+
+    def remove(self, obj):
+        number = self._numbers.pop(obj, None)
+        if number is not None:
+            heapq.heappush(self._free, number)
+
+    def items(self):
+        return list(self._numbers.items())
+
+
+
+# This class keeps the state the fleet-wide reports need in NumPy columns,
+# one row per device: is_on, energy_consumption, an encoded device_type and
+# the index of the device's home and network. A device's row is its device
+# id, and the table follows the model events, so each change updates one
+# cell. Energy totals, active counts and security scores over a
+# home, a network or the whole fleet are then a few vectorized operations.
+class DeviceTable():
+    def __init__(self, capacity=1024):
+        if np is None:
+            raise ImportError("The device table needs NumPy (pip install numpy).")
+        self.size = 0
+        self.is_on = np.zeros(capacity, dtype=bool)
+        self.energy = np.zeros(capacity, dtype=np.float64)
+        self.type_code = np.full(capacity, -1, dtype=np.int32)
+        self.home_index = np.full(capacity, -1, dtype=np.int32)
+        self.network_index = np.full(capacity, -1, dtype=np.int32)
+        self.devices = np.empty(capacity, dtype=object)
+        self.types = {}
+        self.secure = np.zeros(0, dtype=bool)
+        self.homes = _Numbering()
+        self.networks = _Numbering()
+        self._count = 0
+        self._lock = threading.RLock()
+
+    # Magic Methods
+    def __str__(self):
+        return f"DeviceTable: {len(self)} devices in {len(self.homes)} homes"
+    def __repr__(self):
+        return f"DeviceTable(size={self.size}, capacity={len(self.is_on)}, devices={self._count})"
+    def __len__(self):
+        return self._count
+
+    # Rows
+
+    def _grow(self, needed):
+        capacity = max(len(self.is_on) * 2, needed)
+        for name in ("is_on", "energy", "type_code", "home_index", "network_index", "devices"):
+            column = getattr(self, name)
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[:len(column)] = column
+            if name in ("type_code", "home_index", "network_index"):
+                grown[len(column):] = -1
+            elif name != "devices":
+                grown[len(column):] = 0
+            setattr(self, name, grown)
+
+    def _code(self, device_type):
+        code = self.types.get(device_type)
+        if code is None:
+            code = self.types[device_type] = len(self.types)
+            self.secure = np.append(self.secure, device_type in SECURE_TYPES)
+        return code
+
+    # Row of a device in this table, or None. Another device that had the same id does not count.
+    def row_of(self, device):
+        row = getattr(device, "device_id", None)
+        if row is not None and row < self.size and self.devices[row] is device:
+            return row
+        return None
+
+    # Add a device to the table, or update its row if it is already in it
+    def add(self, device, home=None):
+        with self._lock:
+            row = getattr(device, "device_id", None)
+            if row is None:
+                # Only devices with a DEV-n serial number have an id
+                return None
+            if row >= len(self.is_on):
+                self._grow(row + 1)
+            self.size = max(self.size, row + 1)
+            if self.devices[row] is not device:
+                if self.devices[row] is None:
+                    self._count += 1
+                self.devices[row] = device
+            home = home if home is not None else getattr(device, "home", None)
+            self.is_on[row] = bool(device.is_on)
+            self.energy[row] = device.energy_consumption
+            self.type_code[row] = self._code(device.device_type)
+            self._place(row, home)
+            return row
+
+    def _place(self, row, home):
+        if home is None:
+            self.home_index[row] = self.network_index[row] = -1
+            return
+        self.home_index[row] = self.homes.number(home)
+        network = getattr(home, "network", None)
+        self.network_index[row] = self.networks.number(network) if network is not None else -1
+
+    def remove(self, device):
+        with self._lock:
+            row = self.row_of(device)
+            if row is None:
+                return
+            self.devices[row] = None
+            self.is_on[row] = False
+            self.energy[row] = 0.0
+            self.type_code[row] = self.home_index[row] = self.network_index[row] = -1
+            self._count -= 1
+
+    def add_home(self, home):
+        for device in home.smart_devices:
+            self.add(device, home)
+
+    def remove_home(self, home):
+        for device in home.smart_devices:
+            self.remove(device)
+        with self._lock:
+            self.homes.remove(home)
+
+    def add_network(self, network):
+        for home in network.smart_homes:
+            self.add_home(home)
+
+    def remove_network(self, network):
+        for home in network.smart_homes:
+            self.remove_home(home)
+        with self._lock:
+            self.networks.remove(network)
+
+    # Keeping Up With Changes
+    def _on_event(self, obj, event, data):
+        if event == "set":
+            if not isinstance(obj, SmartDevice.SmartDevice):
+                return
+            row = self.row_of(obj)
+            if row is None:
+                return
+            name = data["name"]
+            with self._lock:
+                if name == "is_on":
+                    self.is_on[row] = bool(data["value"])
+                elif name == "energy_consumption":
+                    self.energy[row] = data["value"]
+                elif name == "device_type":
+                    self.type_code[row] = self._code(data["value"])
+        elif event == "add_smart_device":
+            self.add(data["device"], obj)
+        elif event == "remove_smart_device":
+            self.remove(data["device"])
+        elif event == "add_smart_home":
+            self.add_home(data["home"])
+        elif event == "remove_smart_home":
+            self.remove_home(data["home"])
+        elif event == "dispose":
+            if isinstance(obj, SmartDevice.SmartDevice):
+                self.remove(obj)
+            elif isinstance(obj, Network.Network):
+                if obj.is_loaded:
+                    self.remove_network(obj)
+            elif isinstance(obj, User.SmartHome):
+                self.remove_home(obj)
+
+    # Queries
+
+    # Rows of the devices in a home, a network, or the whole fleet
+    def _mask(self, home=None, network=None):
+        size = self.size
+        if home is not None:
+            return self.home_index[:size] == self.homes.get(home, -2)
+        if network is not None:
+            return self.network_index[:size] == self.networks.get(network, -2)
+        return self.home_index[:size] >= 0
+
+    def device_count(self, home=None, network=None):
+        with self._lock:
+            return int(np.count_nonzero(self._mask(home, network)))
+
+    def active_count(self, home=None, network=None):
+        with self._lock:
+            return int(np.count_nonzero(self._mask(home, network) & self.is_on[:self.size]))
+
+    # Total consumption of the devices that are on
+    def energy_consumption(self, home=None, network=None):
+        with self._lock:
+            mask = self._mask(home, network) & self.is_on[:self.size]
+            # A dot product with the mask is faster than selecting the rows and summing them
+            return float(self.energy[:self.size] @ mask)
+
+    # Security devices, active security devices and points, scored like SmartHome.secure_home
+    def security(self, home=None, network=None):
+        with self._lock:
+            size = self.size
+            mask = self._mask(home, network) & (self.type_code[:size] >= 0)
+            secure = np.zeros(size, dtype=bool)
+            secure[mask] = self.secure[self.type_code[:size][mask]]
+            devices = int(np.count_nonzero(secure))
+            active = int(np.count_nonzero(secure & self.is_on[:size]))
+            return devices, active, devices + active
+
+    # Consumption of every home at once, as {home: kWh}
+    def energy_by_home(self):
+        with self._lock:
+            size = self.size
+            mask = (self.home_index[:size] >= 0) & self.is_on[:size]
+            totals = np.bincount(self.home_index[:size][mask], weights=self.energy[:size][mask], minlength=self.homes.size)
+            return {home: float(totals[index]) for home, index in self.homes.items()}
+
+    # The devices in a home or network, in table order
+    def select(self, home=None, network=None):
+        with self._lock:
+            return list(self.devices[:self.size][self._mask(home, network)])
+
+
+# Build a table for the given networks and keep it up to date until uninstall()
+def install(networks=(), capacity=1024):
+    global _table
+    uninstall()
+    table = DeviceTable(capacity)
+    for network in networks:
+        # Networks that are not loaded yet are added by the store when they are
+        if getattr(network, "is_loaded", True):
+            table.add_network(network)
+    Events.subscribe(table._on_event)
+    _table = table
+    return table
+
+def uninstall():
+    global _table
+    if _table is not None:
+        Events.unsubscribe(_table._on_event)
+        _table = None
+
+# The installed table, or None if reports should walk the devices
+def current():
+    return _table
@@ -0,0 +1,127 @@
+from bisect import bisect_left, insort
+import Events
+
+# This class ranks the devices and homes of a network by the kWh they use
+# while on. Both rankings are lists of (-kWh, id, object id) keys kept in
+# order with bisect, holding only devices that are on and homes that use
+# something, so the top k are simply the first k keys. The network updates
+# a device's key whenever its is_on, energy_consumption or home changes,
+# and the key of its home with it, so queries never walk the fleet and
+# print nothing.
+class EnergyRanking():
+    # The network owns its ranking, so the ranking only points back to it weakly
+    network = Events.WeakAttribute("_network")
+
+    def __init__(self, network):
+        self.network = network
+        self._source = None
+        self._devices = []
+        self._homes = []
+        self._keys = {}
+        self._objects = {}
+        self.rebuild()
+
+    # Magic Methods
+    def __str__(self):
+        return f"EnergyRanking: {len(self._devices)} active devices in {len(self._homes)} homes of network {self.network.ip_address}"
+    def __repr__(self):
+        return f"EnergyRanking(network={self.network.ip_address}, devices={len(self._devices)}, homes={len(self._homes)})"
+
+    # Rank every device and home of the network from scratch
+    def rebuild(self):
+        smart_homes = self.network.smart_homes
+        self._source = smart_homes
+        self._keys = {}
+        self._objects = {}
+        devices = []
+        homes = []
+        for smart_home in smart_homes:
+            key = self._home_key(smart_home)
+            if key is not None:
+                homes.append(key)
+                self._keys[id(smart_home)] = key
+                self._objects[id(smart_home)] = smart_home
+            for smart_device in smart_home.smart_devices:
+                key = self._device_key(smart_device)
+                if key is not None:
+                    devices.append(key)
+                    self._keys[id(smart_device)] = key
+                    self._objects[id(smart_device)] = smart_device
+        # One sort is much faster than inserting the keys one at a time
+        devices.sort()
+        homes.sort()
+        self._devices = devices
+        self._homes = homes
+
+    @staticmethod
+    def _device_key(smart_device):
+        if not smart_device.is_on or not smart_device.energy_consumption:
+            return None
+        device_id = getattr(smart_device, "device_id", None)
+        return (-smart_device.energy_consumption, device_id if device_id is not None else -1, id(smart_device))
+
+    @staticmethod
+    def _home_key(smart_home):
+        energy = smart_home.get_totals().active_energy
+        if not energy:
+            return None
+        return (-energy, smart_home.home_id, id(smart_home))
+
+    def _remove(self, ranking, obj):
+        key = self._keys.pop(id(obj), None)
+        if key is None:
+            return
+        del self._objects[id(obj)]
+        del ranking[bisect_left(ranking, key)]
+
+    def _insert(self, ranking, obj, key):
+        if key is None:
+            return
+        self._keys[id(obj)] = key
+        self._objects[id(obj)] = obj
+        insort(ranking, key)
+
+    # Keeping Up With Changes
+
+    # Rank a device and its home again. Called by the network with sign=-1 before a device
+    # changes or leaves a home, and with sign=1 once it has changed or joined one.
+    def update(self, smart_home, smart_device, sign):
+        self._remove(self._devices, smart_device)
+        self._remove(self._homes, smart_home)
+        # A home removed from the network can still see its devices change
+        if self.network.get_home(smart_home.home_id) is not smart_home:
+            return
+        if sign > 0 and smart_device.home is smart_home:
+            self._insert(self._devices, smart_device, self._device_key(smart_device))
+        self._insert(self._homes, smart_home, self._home_key(smart_home))
+
+    def add_home(self, smart_home):
+        for smart_device in smart_home.smart_devices:
+            self._remove(self._devices, smart_device)
+            self._insert(self._devices, smart_device, self._device_key(smart_device))
+        self._remove(self._homes, smart_home)
+        self._insert(self._homes, smart_home, self._home_key(smart_home))
+
+    def remove_home(self, smart_home):
+        for smart_device in smart_home.smart_devices:
+            self._remove(self._devices, smart_device)
+        self._remove(self._homes, smart_home)
+
+    def _refresh(self):
+        if self.network.smart_homes is not self._source:
+            # The homes were loaded again, e.g. after the network was evicted
+            self.rebuild()
+
+    # Queries
+
+    # The k devices using the most kWh while on, as (device, kWh) pairs
+    def top_devices(self, k):
+        self._refresh()
+        objects = self._objects
+        return [(objects[key[2]], -key[0]) for key in self._devices[:k]]
+
+    # The k homes whose devices use the most kWh, as (home, kWh) pairs
+    def top_homes(self, k):
+        self._refresh()
+        objects = self._objects
+        return [(objects[key[2]], -key[0]) for key in self._homes[:k]]
@@ -0,0 +1,131 @@
+import weakref
+
+# This module lets storage layers follow changes to users, networks, homes,
+# devices and scheduled operations without the model knowing about them.
+# Listeners are called as listener(obj, event, data).
+_listeners = []
+
+# Add and Remove Listeners
+def subscribe(listener):
+    _listeners.append(listener)
+
+def unsubscribe(listener):
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+# Tell every listener that something changed
+def emit(obj, event, **data):
+    for listener in _listeners:
+        listener(obj, event, data)
+
+
+# Names of the slots of a class and all of its bases
+_slot_names = {}
+
+def slot_names(cls):
+    names = _slot_names.get(cls)
+    if names is None:
+        names = tuple(name for klass in reversed(cls.__mro__) for name in klass.__dict__.get("__slots__", ())
+                      if name not in ("__weakref__", "__dict__"))
+        _slot_names[cls] = names
+    return names
+
+
+# An attribute that refers to an owner, like the home of a device, through a
+# weak reference kept in a private slot. Owners hold their children, and the
+# children only point back weakly, so the model has no reference cycles and a
+# dropped network is freed straight away by reference counting. Python hands
+# out the same plain weak reference to an owner every time, so all of its
+# children share one. Reads give None once the owner is gone.
+class WeakAttribute():
+    def __init__(self, slot):
+        self.slot = slot
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        ref = object.__getattribute__(obj, self.slot)
+        return ref() if ref is not None else None
+
+    def __set__(self, obj, value):
+        object.__setattr__(obj, self.slot, weakref.ref(value) if value is not None else None)
+
+    def __delete__(self, obj):
+        object.__delattr__(obj, self.slot)
+
+# Names of the weak attributes of a class and all of its bases
+_weak_names = {}
+
+def weak_names(cls):
+    names = _weak_names.get(cls)
+    if names is None:
+        names = tuple(name for klass in reversed(cls.__mro__) for name, value in klass.__dict__.items()
+                      if isinstance(value, WeakAttribute))
+        _weak_names[cls] = names
+    return names
+
+
+# Base class for model objects. Every assignment to a public attribute is
+# reported as a "set" event, except for the ones named in _transient.
+# Model objects keep their attributes in __slots__ instead of a __dict__;
+# __getstate__ and __setstate__ read and write them all at once, without
+# events, for pickling and the storage layers. Objects are taken apart with
+# dispose(), directly or by leaving a with block, never by a finalizer.
+class Observable():
+    __slots__ = ("__weakref__",)
+    _transient = ()
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if _listeners and name[0] != "_" and name not in self._transient:
+            emit(self, "set", name=name, value=value)
+
+    # Every attribute that is set, as a dict
+    def __getstate__(self):
+        state = {}
+        for name in slot_names(type(self)):
+            # Private slots only hold runtime state, like the loader of a lazily loaded network
+            if name[0] == "_":
+                continue
+            try:
+                state[name] = object.__getattribute__(self, name)
+            except AttributeError:
+                pass
+        # Weak attributes are saved as the object they refer to
+        for name in weak_names(type(self)):
+            try:
+                state[name] = getattr(self, name)
+            except AttributeError:
+                pass
+        # Subclasses without __slots__ of their own keep extra attributes in a __dict__
+        try:
+            state.update(object.__getattribute__(self, "__dict__"))
+        except AttributeError:
+            pass
+        return state
+
+    # Set attributes from a dict. Also takes the (dict, slots) pair Python pickles slotted objects
+    # as, and the plain __dict__ of objects pickled before the model used __slots__.
+    def __setstate__(self, state):
+        if isinstance(state, tuple):
+            state = {**(state[0] or {}), **(state[1] or {})}
+        for name, value in state.items():
+            try:
+                object.__setattr__(self, name, value)
+            except AttributeError:
+                # An attribute the class no longer has
+                pass
+
+    # Take the object apart for good. Subclasses release what they own.
+    def dispose(self):
+        pass
+
+    # Using an object in a with block disposes of it at the end
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.dispose()
+        return False
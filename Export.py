@@ -0,0 +1,138 @@
+import argparse
+import bz2
+import gzip
+import lzma
+import os
+import pickle
+from colorama import Fore, Style
+import Autosave
+import SmartDevice
+import Snapshot
+import Storage
+import main
+
+# zstd is optional, gzip and lzma come with Python
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# File extension and magic bytes of each compression
+COMPRESSIONS = {
+    "gzip": (".gz", b"\x1f\x8b"),
+    "lzma": (".xz", b"\xfd7zXZ\x00"),
+    "bz2": (".bz2", b"BZh"),
+    "zstd": (".zst", b"\x28\xb5\x2f\xfd"),
+}
+
+
+# Guess the compression of a file from its extension, or None for an uncompressed file
+def compression_for(path):
+    for name, (extension, _) in COMPRESSIONS.items():
+        if path.endswith(extension):
+            return name
+    return None
+
+# Guess the compression of an existing file from its first bytes
+def detect_compression(path):
+    with open(path, "rb") as f:
+        start = f.read(8)
+    for name, (_, magic) in COMPRESSIONS.items():
+        if start.startswith(magic):
+            return name
+    return None
+
+# Open a file through a compressing or decompressing stream, so it is never held in memory whole
+def open_compressed(path, mode, compression=None, level=None):
+    if compression is None:
+        compression = compression_for(path) if "w" in mode else detect_compression(path)
+    if compression is None:
+        return open(path, mode)
+    if compression == "gzip":
+        return gzip.open(path, mode, compresslevel=level if level is not None else 6)
+    if compression == "lzma":
+        return lzma.open(path, mode, preset=level)
+    if compression == "bz2":
+        return bz2.open(path, mode, compresslevel=level if level is not None else 9)
+    if compression == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd compression needs the zstandard package (pip install zstandard).")
+        raw = open(path, mode)
+        if "w" in mode:
+            return zstandard.ZstdCompressor(level=level if level is not None else 3).stream_writer(raw, closefd=True)
+        return zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+    raise ValueError(f"Unknown compression '{compression}', choose from {', '.join(COMPRESSIONS)}.")
+
+
+# Write the whole GUI to path in the binary snapshot format, one network at a time.
+# The file is written next to path and renamed over it at the end.
+def export(gui, path, compression=None, level=None):
+    if compression is None:
+        compression = compression_for(path)
+    temp_path = path + ".tmp"
+    with open_compressed(temp_path, "wb", compression, level) as f:
+        Snapshot.dump(gui, f)
+    os.replace(temp_path, path)
+    return os.path.getsize(path)
+
+# Read a snapshot written by export into the GUI, ready for gui.load_scheduals()
+def import_snapshot(path, gui):
+    with open_compressed(path, "rb") as f:
+        return Snapshot.load(f, gui)
+
+
+# Load a GUI from any of the places the program keeps its data
+def load_source(path):
+    gui = main.GUI()
+    if os.path.isdir(path):
+        store = Storage.ShardedStore(path)
+        try:
+            store.load(gui)
+        finally:
+            store.close()
+    elif path.endswith(".db"):
+        store = Storage.SQLiteStore(path)
+        try:
+            store.load(gui)
+        finally:
+            store.close()
+    elif path.endswith(".pkl"):
+        # Only use this for data.pkl files you created yourself, unpickling runs code from the file
+        with open(path, "rb") as f:
+            gui = pickle.load(f)
+    else:
+        import_snapshot(path, gui)
+    # The operations are only copied, not armed, so nothing runs while converting
+    SmartDevice.SmartDevice.set_scheduled_operations(gui.scheduled_operations)
+    gui.scheduled_operations = []
+    return gui
+
+# Save a GUI to data.pkl, an SQLite database or a shard directory
+def save_destination(gui, path):
+    if path.endswith(".pkl"):
+        Autosave.write_atomic(path, gui.snapshot())
+        return
+    store = Storage.SQLiteStore(path) if path.endswith(".db") else Storage.ShardedStore(path)
+    try:
+        store.save_all(gui)
+    finally:
+        store.close()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Export the smart home data to a compressed snapshot, or import one.")
+    parser.add_argument("command", choices=("export", "import"))
+    parser.add_argument("source", help="data.pkl, data.db, a shard directory or a snapshot file")
+    parser.add_argument("destination", help="snapshot file for export (.gz, .xz, .bz2 or .zst to compress), data.pkl, data.db or a directory for import")
+    parser.add_argument("--compression", choices=tuple(COMPRESSIONS), help="compression to use instead of guessing from the file name")
+    parser.add_argument("--level", type=int, help="compression level")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    gui = load_source(args.source)
+    if args.command == "export":
+        size = export(gui, args.destination, args.compression, args.level)
+        print(Fore.GREEN + f"✓ Exported {len(gui.networks)} networks to {args.destination} ({size} bytes)" + Style.RESET_ALL)
+    else:
+        save_destination(gui, args.destination)
+        print(Fore.GREEN + f"✓ Imported {args.source} into {args.destination}" + Style.RESET_ALL)
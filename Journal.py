@@ -0,0 +1,304 @@
+import json
+import os
+import pickle
+import threading
+from colorama import Fore, Style
+import Autosave
+import Events
+import Network
+import SmartDevice
+import User
+
+# This class records every change to the model as one compact JSON line in an
+# append-only journal next to the snapshot file. Each change costs one small
+# write instead of a full pickle.dump of the GUI. compact() writes a new
+# snapshot and empties the journal, and load() reads the latest snapshot and
+# replays the journal on top of it.
+class Journal():
+    def __init__(self, path="data.journal", snapshot_path="data.pkl", compact_every=10000, fsync=False):
+        self.path = path
+        self.snapshot_path = snapshot_path
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self.records = 0
+        self.gui = None
+        self._file = None
+        self._lock = threading.RLock()
+        self._replaying = False
+
+    # Magic Methods
+    def __str__(self):
+        return f"Journal: {self.path} ({self.records} records since the last snapshot)"
+    def __repr__(self):
+        return f"Journal(path={self.path}, snapshot_path={self.snapshot_path}, records={self.records})"
+
+    # Start recording changes to the GUI
+    def attach(self, gui):
+        self.gui = gui
+        self._file = open(self.path, "a", encoding="utf-8")
+        Events.subscribe(self._on_event)
+
+    def close(self):
+        Events.unsubscribe(self._on_event)
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    # Recording
+
+    def _on_event(self, obj, event, data):
+        if self._replaying or self._file is None:
+            return
+        record = self._to_record(obj, event, data)
+        if record is None:
+            return
+        line = json.dumps(record, separators=(",", ":"))
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self.records += 1
+
+    # Turn an event into a journal record, or None if there is nothing to replay
+    def _to_record(self, obj, event, data):
+        if event == "set":
+            target = self._reference(obj)
+            if target is None:
+                # Objects are recorded in full when they are added, so earlier changes are not needed
+                return None
+            return ["set", target, data["name"], self._encode(data["value"])]
+        if event == "add_smart_device":
+            return ["add_smart_device", obj.home_id, self._state(data["device"])]
+        if event == "remove_smart_device":
+            return ["remove_smart_device", obj.home_id, data["device"].serial_number]
+        if event == "add_smart_home":
+            home = data["home"]
+            return ["add_smart_home", obj.ip_address, home.home_id, home.name, [self._state(device) for device in home.smart_devices]]
+        if event == "remove_smart_home":
+            return ["remove_smart_home", obj.ip_address, data["home"].home_id]
+        if event == "add_scheduled_operation":
+            return ["add_scheduled_operation", self._state(obj)]
+        if event == "remove_scheduled_operation":
+            return ["remove_scheduled_operation", obj.operation_id]
+        if event == "add_user":
+            # A user is often connected to a network before it is added, when its changes are not recorded yet
+            network = obj.network.ip_address if obj.network is not None else None
+            return ["add_user", obj.user_id, obj.username, network]
+        if event == "add_network":
+            return ["add_network", obj.ip_address]
+        return None
+
+    # A reference to an object that is part of the graph, e.g. ["device", "DEV-3"]
+    @staticmethod
+    def _reference(obj):
+        if isinstance(obj, SmartDevice.SmartDevice):
+            if getattr(obj, "home", None) is None:
+                return None
+            return ["device", obj.serial_number]
+        if isinstance(obj, SmartDevice.ScheduledOperation):
+            if obj not in SmartDevice.SmartDevice.get_scheduled_operations():
+                return None
+            return ["operation", obj.operation_id]
+        if isinstance(obj, User.SmartHome):
+            if not hasattr(obj, "home_id"):
+                return None
+            return ["home", obj.home_id]
+        if isinstance(obj, User.User):
+            if not hasattr(obj, "user_id"):
+                return None
+            return ["user", obj.user_id]
+        if isinstance(obj, Network.Network):
+            return ["network", obj.ip_address]
+        return None
+
+    def _encode(self, value):
+        if isinstance(value, (SmartDevice.SmartDevice, SmartDevice.ScheduledOperation, User.SmartHome, User.User, Network.Network)):
+            return {"$ref": self._reference(value)}
+        if isinstance(value, (list, tuple)):
+            return [self._encode(item) for item in value]
+        if isinstance(value, dict):
+            return {key: self._encode(item) for key, item in value.items()}
+        return value
+
+    def _state(self, obj):
+        state = {key: self._encode(value) for key, value in obj.__getstate__().items()
+                 if not key.startswith("_") and key not in obj._transient}
+        return {"class": type(obj).__name__, "state": state}
+
+    # Compaction
+
+    # Write a new snapshot once enough records have piled up
+    def maybe_compact(self):
+        if self.records >= self.compact_every:
+            self.compact()
+
+    # Write the GUI to the snapshot file and start an empty journal
+    def compact(self):
+        with self._lock:
+            Autosave.write_atomic(self.snapshot_path, self.gui.snapshot())
+            self._file.close()
+            self._file = open(self.path, "w", encoding="utf-8")
+            self.records = 0
+        print(Fore.GREEN + f"✓ Snapshot written to {self.snapshot_path}, journal compacted" + Style.RESET_ALL)
+
+    # Loading
+
+    # Load the latest snapshot and replay the journal on top of it. Returns None if there is neither.
+    def load(self, gui_factory):
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "rb") as f:
+                gui = pickle.load(f)
+        elif os.path.exists(self.path):
+            gui = gui_factory()
+        else:
+            return None
+        if os.path.exists(self.path):
+            self.replay(gui)
+        return gui
+
+    # Apply every record in the journal to the GUI
+    def replay(self, gui):
+        self._replaying = True
+        try:
+            index = _ReplayIndex(gui)
+            applied = 0
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A crash can leave half a line at the end of the journal
+                        print(Fore.YELLOW + "⚠ Ignoring a damaged journal record." + Style.RESET_ALL)
+                        continue
+                    index.apply(record)
+                    applied += 1
+            gui.scheduled_operations = list(index.operations.values())
+            # The records changed the homes and devices without going through the indexes
+            for network in gui.networks:
+                network.reindex()
+            self.records = applied
+        finally:
+            self._replaying = False
+        print(Fore.GREEN + f"✓ Replayed {applied} journal records from {self.path}" + Style.RESET_ALL)
+        return applied
+
+
+# Lookups used while replaying a journal, so each record is applied in O(1)
+class _ReplayIndex():
+    def __init__(self, gui):
+        self.gui = gui
+        self.networks = {network.ip_address: network for network in gui.networks}
+        self.users = {user.user_id: user for user in gui.users}
+        self.homes = {}
+        self.devices = {}
+        for network in gui.networks:
+            for home in network.smart_homes:
+                self._index_home(home)
+        self.operations = {operation.operation_id: operation for operation in gui.scheduled_operations
+                           if getattr(operation, "operation_id", None) is not None}
+
+    def _index_home(self, home):
+        self.homes[home.home_id] = home
+        for device in home.smart_devices:
+            self.devices[device.serial_number] = device
+
+    def resolve(self, reference):
+        kind, key = reference
+        table = {"device": self.devices, "home": self.homes, "user": self.users,
+                 "network": self.networks, "operation": self.operations}[kind]
+        return table.get(key)
+
+    def decode(self, value):
+        if isinstance(value, dict):
+            if "$ref" in value:
+                return self.resolve(value["$ref"]) if value["$ref"] is not None else None
+            return {key: self.decode(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self.decode(item) for item in value]
+        return value
+
+    # Build an object from its recorded state without running its __init__
+    def build(self, module, recorded, base):
+        cls = getattr(module, recorded["class"], base)
+        if not (isinstance(cls, type) and issubclass(cls, base)):
+            cls = base
+        obj = cls.__new__(cls)
+        obj.__setstate__({key: self.decode(value) for key, value in recorded["state"].items()})
+        return obj
+
+    def build_device(self, recorded, home):
+        device = self.build(SmartDevice, recorded, SmartDevice.SmartDevice)
+        device.__setstate__({"home": home})
+        return device
+
+    # A removed device gives its id back, so a new device can take it
+    @staticmethod
+    def release_device(device):
+        device_id = getattr(device, "device_id", None)
+        if device_id is not None:
+            SmartDevice.SmartDevice.get_device_ids().release(device, device_id)
+
+    def apply(self, record):
+        kind = record[0]
+        if kind == "set":
+            _, reference, name, value = record
+            target = self.resolve(reference)
+            if target is not None:
+                target.__setstate__({name: self.decode(value)})
+        elif kind == "add_smart_device":
+            _, home_id, recorded = record
+            home = self.homes.get(home_id)
+            if home is not None:
+                device = self.build_device(recorded, home)
+                home.smart_devices.append(device)
+                self.devices[device.serial_number] = device
+        elif kind == "remove_smart_device":
+            _, home_id, serial = record
+            home, device = self.homes.get(home_id), self.devices.pop(serial, None)
+            if home is not None and device in home.smart_devices:
+                home.smart_devices.remove(device)
+                self.release_device(device)
+        elif kind == "add_smart_home":
+            _, ip_address, home_id, name, devices = record
+            network = self.networks.get(ip_address)
+            if network is not None:
+                home = User.SmartHome.__new__(User.SmartHome)
+                home.__setstate__(dict(smart_devices=[], network=network, name=name, home_id=home_id))
+                home.smart_devices.extend(self.build_device(recorded, home) for recorded in devices)
+                network.smart_homes.append(home)
+                self._index_home(home)
+                User.SmartHome._home_count = max(User.SmartHome._home_count, home_id + 1)
+        elif kind == "remove_smart_home":
+            _, ip_address, home_id = record
+            network, home = self.networks.get(ip_address), self.homes.pop(home_id, None)
+            if network is not None and home in network.smart_homes:
+                network.smart_homes.remove(home)
+                for device in home.smart_devices:
+                    self.devices.pop(device.serial_number, None)
+                    self.release_device(device)
+        elif kind == "add_scheduled_operation":
+            operation = self.build(SmartDevice, record[1], SmartDevice.ScheduledOperation)
+            operation.__setstate__({"args": tuple(operation.args), "handle": None})
+            self.operations[operation.operation_id] = operation
+        elif kind == "remove_scheduled_operation":
+            self.operations.pop(record[1], None)
+        elif kind == "add_user":
+            # Journals written before the network was recorded have only three fields
+            user_id, username = record[1], record[2]
+            network = self.networks.get(record[3]) if len(record) > 3 else None
+            user = User.User.__new__(User.User)
+            user.__setstate__(dict(username=username, network=network, user_id=user_id))
+            self.gui.users.append(user)
+            self.users[user_id] = user
+            User.User._Users = max(User.User._Users, user_id + 1)
+        elif kind == "add_network":
+            if record[1] not in self.networks:
+                network = Network.Network.__new__(Network.Network)
+                network.__setstate__(dict(ip_address=record[1], smart_homes=[]))
+                self.gui.networks.append(network)
+                self.networks[record[1]] = network
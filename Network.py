@@ -1,35 +1,351 @@
+import EnergyRanking
+import Events
+import SecurityAudit
+
+# Device types that count towards a home's security score
+SECURE_TYPES = frozenset(("Lock", "Security Camera", "Doorbell", "Door"))
+
+
+# This class indexes the homes and devices of a network by id, name, serial
+# number and device type, so looking one up never walks every home. Each
+# lookup key maps to a dict keyed by home id or serial number, which keeps
+# insertion order and makes removing an entry O(1).
+class NetworkIndex():
+    def __init__(self, smart_homes):
+        self.source = smart_homes
+        self.homes_by_id = {}
+        self.homes_by_name = {}
+        self.devices_by_serial = {}
+        self.devices_by_name = {}
+        self.devices_by_type = {}
+        for smart_home in smart_homes:
+            self.add_home(smart_home)
+
+    # Magic Methods
+    def __str__(self):
+        return f"NetworkIndex: {len(self.homes_by_id)} homes, {len(self.devices_by_serial)} devices"
+    def __repr__(self):
+        return f"NetworkIndex(homes={len(self.homes_by_id)}, devices={len(self.devices_by_serial)})"
+
+    # Add and Remove Entries
+    def add_home(self, smart_home):
+        self.homes_by_id[smart_home.home_id] = smart_home
+        self.add_home_name(smart_home)
+        for smart_device in smart_home.smart_devices:
+            self.add_device(smart_device)
+
+    def remove_home(self, smart_home):
+        if self.homes_by_id.get(smart_home.home_id) is smart_home:
+            del self.homes_by_id[smart_home.home_id]
+        self.remove_home_name(smart_home)
+        for smart_device in smart_home.smart_devices:
+            self.remove_device(smart_device)
+
+    # Only the name entry of a home, which is all a rename changes
+    def add_home_name(self, smart_home):
+        self.homes_by_name.setdefault(smart_home.name, {})[smart_home.home_id] = smart_home
+
+    def remove_home_name(self, smart_home):
+        _discard(self.homes_by_name, smart_home.name, smart_home.home_id, smart_home)
+
+    def add_device(self, smart_device):
+        serial_number = smart_device.serial_number
+        self.devices_by_serial[serial_number] = smart_device
+        self.devices_by_name.setdefault(smart_device.name, {})[serial_number] = smart_device
+        self.devices_by_type.setdefault(smart_device.device_type, {})[serial_number] = smart_device
+
+    def remove_device(self, smart_device):
+        serial_number = smart_device.serial_number
+        if self.devices_by_serial.get(serial_number) is smart_device:
+            del self.devices_by_serial[serial_number]
+        _discard(self.devices_by_name, smart_device.name, serial_number, smart_device)
+        _discard(self.devices_by_type, smart_device.device_type, serial_number, smart_device)
+
+# This class keeps running totals over a set of devices: how many there are,
+# how many are on, the kWh of the ones that are on, how many there are of
+# each device type, and how many security devices there are and are on. A device is counted with apply(device, 1) and taken out
+# again with apply(device, -1), so a change to one device costs O(1) whatever
+# the size of the home or network.
+class EnergyTotals():
+    def __init__(self, source=None):
+        self.source = source
+        self.device_count = 0
+        self.active_count = 0
+        self.active_energy = 0.0
+        self.type_counts = {}
+        self.secure_count = 0
+        self.secure_active = 0
+
+    # Magic Methods
+    def __str__(self):
+        return f"EnergyTotals: {self.active_count}/{self.device_count} devices on, {self.active_energy:.2f} kWh"
+    def __repr__(self):
+        return f"EnergyTotals(device_count={self.device_count}, active_count={self.active_count}, active_energy={self.active_energy})"
+
+    # Count a device in (sign=1) or out (sign=-1) with its current state
+    def apply(self, smart_device, sign):
+        self.device_count += sign
+        device_type = smart_device.device_type
+        count = self.type_counts.get(device_type, 0) + sign
+        if count:
+            self.type_counts[device_type] = count
+        else:
+            self.type_counts.pop(device_type, None)
+        secure = device_type in SECURE_TYPES
+        if secure:
+            self.secure_count += sign
+        if smart_device.is_on:
+            if secure:
+                self.secure_active += sign
+            self.active_count += sign
+            self.active_energy += sign * smart_device.energy_consumption
+            if not self.active_count:
+                # Adding and subtracting floats leaves rounding errors behind, start again from exactly 0
+                self.active_energy = 0.0
+
+    # Add (sign=1) or subtract (sign=-1) the totals of a part, e.g. a home of a network
+    def merge(self, other, sign):
+        self.device_count += sign * other.device_count
+        self.active_count += sign * other.active_count
+        self.active_energy += sign * other.active_energy
+        self.secure_count += sign * other.secure_count
+        self.secure_active += sign * other.secure_active
+        if not self.active_count:
+            self.active_energy = 0.0
+        for device_type, count in other.type_counts.items():
+            count = self.type_counts.get(device_type, 0) + sign * count
+            if count:
+                self.type_counts[device_type] = count
+            else:
+                self.type_counts.pop(device_type, None)
+
+    def count_by_type(self, device_type):
+        return self.type_counts.get(device_type, 0)
+
+    # A point for every security device and one more for each that is on, as in SmartHome.secure_home
+    @property
+    def security_points(self):
+        return self.secure_count + self.secure_active
+
+
+# Remove obj from the bucket of an index, dropping the bucket once it is empty
+def _discard(index, key, entry, obj):
+    bucket = index.get(key)
+    if bucket is not None and bucket.get(entry) is obj:
+        del bucket[entry]
+        if not bucket:
+            del index[key]
 
 ## This code defines a Network class that manages smart homes and their devices.
-class Network:
+class Network(Events.Observable):
+    __slots__ = ("ip_address", "smart_homes", "_loader", "_index", "_totals", "_audit", "_ranking")
+    _transient = ("smart_homes",)
     def __init__(self, ip_address):
         self.ip_address = ip_address
         self.smart_homes = []
+        self._clear_caches()
     # Magic Methods
     def __str__(self):
         return f"Network: {self.ip_address}"
     def __repr__(self):
         return f"Network(ip_address={self.ip_address}, smart_homes={self.smart_homes})"
-    def __del__(self):
-        print(f"Network {self.ip_address} has been removed from the system")
-        print(f"  └─ Removing {len(self.smart_homes)} smart homes...")
-        for smart_home in self.smart_homes:
-            smart_home.__del__()
-        self.smart_homes.clear()
+
+    # A network read back from a save starts without an index or totals
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        self._clear_caches()
+
+    # The index, totals, audit and ranking are built when first needed. Holding None until
+    # then keeps every device change from raising and catching an AttributeError for each.
+    def _clear_caches(self):
+        self._index = None
+        self._totals = None
+        self._audit = None
+        self._ranking = None
+
+    # Remove the network and all of its homes for good. A lazily loaded network is loaded
+    # first, so the store sees every home and device go.
+    def dispose(self, report=True):
+        smart_homes = self.smart_homes
+        # The stores and the journal delete a home and its devices when it is removed
+        for smart_home in smart_homes:
+            Events.emit(self, "remove_smart_home", home=smart_home)
+        Events.emit(self, "dispose")
+        if report:
+            print(f"Network {self.ip_address} has been removed from the system")
+            print(f"  └─ Removing {len(smart_homes)} smart homes...")
+        self.smart_homes = []
+        self.reindex()
+        for smart_home in smart_homes:
+            object.__setattr__(smart_home, "network", None)
+            smart_home.dispose(report=False)
+
+    # A network loaded lazily reads its homes from the store the first time they are used
+    def __getattr__(self, name):
+        if name == "smart_homes":
+            loader = getattr(self, "_loader", None)
+            if loader is not None:
+                loader(self)
+                return object.__getattribute__(self, "smart_homes")
+        raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+
+    # Check whether the homes of the network are in memory
+    @property
+    def is_loaded(self):
+        try:
+            object.__getattribute__(self, "smart_homes")
+        except AttributeError:
+            return False
+        return True
+
+    # The index of the homes and devices, built the first time it is needed. A new
+    # smart_homes list, e.g. after the network was loaded again, gets a new index.
+    def _get_index(self):
+        smart_homes = self.smart_homes
+        index = getattr(self, "_index", None)
+        if index is None or index.source is not smart_homes:
+            index = self._index = NetworkIndex(smart_homes)
+        return index
+
+    # Drop the index and the totals, e.g. after changing smart_homes or smart_devices without the methods below
+    def reindex(self):
+        self._clear_caches()
+        if self.is_loaded:
+            for smart_home in self.smart_homes:
+                smart_home.reset_totals()
+
+    # Keep a built index up to date, without building one just for this
+    def _indexed(self):
+        index = getattr(self, "_index", None)
+        if index is not None and self.is_loaded and index.source is self.smart_homes:
+            return index
+        return None
+
+    # Called by SmartHome when a device is added to or removed from one of the homes
+    def index_device(self, smart_device):
+        index = self._indexed()
+        if index is not None:
+            index.add_device(smart_device)
+    def unindex_device(self, smart_device):
+        index = self._indexed()
+        if index is not None:
+            index.remove_device(smart_device)
+
+    # Called by SmartHome before and after its name changes
+    def index_home_name(self, smart_home):
+        index = self._indexed()
+        if index is not None and index.homes_by_id.get(smart_home.home_id) is smart_home:
+            index.add_home_name(smart_home)
+    def unindex_home_name(self, smart_home):
+        index = self._indexed()
+        if index is not None:
+            index.remove_home_name(smart_home)
+
+    # Running totals over every device of the network, built from the totals of the homes the first time they are needed
+    def get_totals(self):
+        smart_homes = self.smart_homes
+        totals = getattr(self, "_totals", None)
+        if totals is None or totals.source is not smart_homes:
+            totals = EnergyTotals(smart_homes)
+            for smart_home in smart_homes:
+                totals.merge(smart_home.get_totals(), 1)
+            self._totals = totals
+        return totals
+
+    # Called by SmartHome with a device it counts in or out of its own totals
+    def update_totals(self, smart_home, smart_device, sign):
+        totals = getattr(self, "_totals", None)
+        if totals is not None and self.is_loaded and totals.source is self.smart_homes:
+            totals.apply(smart_device, sign)
+        audit = getattr(self, "_audit", None)
+        if audit is not None:
+            audit.mark(smart_home)
+        ranking = getattr(self, "_ranking", None)
+        if ranking is not None:
+            ranking.update(smart_home, smart_device, sign)
+
+    def _merge_totals(self, smart_home, sign):
+        totals = getattr(self, "_totals", None)
+        if totals is not None and self.is_loaded and totals.source is self.smart_homes:
+            totals.merge(smart_home.get_totals(), sign)
+
+    # Total kWh of the devices that are on, across every home
+    def get_energy_consumption(self):
+        return self.get_totals().active_energy
+
+    # The security audit of the homes, created the first time it is needed and kept up to date after that
+    def get_security_audit(self):
+        audit = getattr(self, "_audit", None)
+        if audit is None:
+            audit = self._audit = SecurityAudit.SecurityAudit(self)
+        return audit
+
+    # The ranking of devices and homes by consumption, created the first time it is needed
+    def get_energy_ranking(self):
+        ranking = getattr(self, "_ranking", None)
+        if ranking is None:
+            ranking = self._ranking = EnergyRanking.EnergyRanking(self)
+        return ranking
+
+    # The k biggest consumers, as (home or device, kWh) pairs, without printing anything
+    def top_homes(self, k=10):
+        return self.get_energy_ranking().top_homes(k)
+    def top_devices(self, k=10):
+        return self.get_energy_ranking().top_devices(k)
 
     # Add and Remove Smart Homes
     def add_smart_home(self, smart_home):
         self.smart_homes.append(smart_home)
+        index = self._indexed()
+        if index is not None:
+            index.add_home(smart_home)
+        self._merge_totals(smart_home, 1)
+        audit = getattr(self, "_audit", None)
+        if audit is not None:
+            audit.add_home(smart_home)
+        ranking = getattr(self, "_ranking", None)
+        if ranking is not None:
+            ranking.add_home(smart_home)
+        Events.emit(self, "add_smart_home", home=smart_home)
         print(f"{smart_home.name} has been added to the network {self.ip_address}.")
     def remove_smart_home(self, smart_home):
         self.smart_homes.remove(smart_home)
+        index = self._indexed()
+        if index is not None:
+            index.remove_home(smart_home)
+        self._merge_totals(smart_home, -1)
+        audit = getattr(self, "_audit", None)
+        if audit is not None:
+            audit.remove_home(smart_home)
+        ranking = getattr(self, "_ranking", None)
+        if ranking is not None:
+            ranking.remove_home(smart_home)
+        for smart_device in smart_home.smart_devices:
+            smart_device.cancel_scheduled_operations()
+        Events.emit(self, "remove_smart_home", home=smart_home)
         print(f"{smart_home.name} has been removed from the network {self.ip_address}.")
 
+    # Lookups
+    def get_home(self, home_id):
+        return self._get_index().homes_by_id.get(home_id)
+
+    def get_home_by_name(self, name):
+        homes = self._get_index().homes_by_name.get(name)
+        return next(iter(homes.values())) if homes else None
+
+    def get_device(self, serial_number):
+        return self._get_index().devices_by_serial.get(serial_number)
+
+    def get_devices_by_name(self, name):
+        return list(self._get_index().devices_by_name.get(name, {}).values())
+
+    def get_devices_by_type(self, device_type):
+        return list(self._get_index().devices_by_type.get(device_type, {}).values())
+
     # List Smart Devices
     def list_smart_devices(self):
-        devices = []
-        for smart_home in self.smart_homes:
-            devices.extend(smart_home.list_smart_devices())
-        return devices
+        # Home by home, in the order the devices were added to each home
+        return [smart_device for smart_home in self.smart_homes for smart_device in smart_home.smart_devices]
 
     # List Smart Homes
     def list_smart_homes(self):
@@ -0,0 +1,221 @@
+from abc import ABC, abstractmethod
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+# Names accepted for days of the week, mapped to datetime.weekday() numbers
+WEEKDAYS = {"mon": 0, "tue": 1, "wed": 2, "thu": 3, "fri": 4, "sat": 5, "sun": 6}
+DAY_GROUPS = {"daily": range(7), "weekdays": range(5), "weekends": range(5, 7)}
+UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+# This is the base class for a parsed recurrence expression. Expressions are
+# parsed once by parse() and the result is cached, so working out the next
+# fire time never re-parses the original string.
+class Recurrence(ABC):
+    def __init__(self, expression):
+        self.expression = expression
+
+    # Magic Methods
+    def __str__(self):
+        return f"Recurrence: {self.expression}"
+    def __repr__(self):
+        return f"{type(self).__name__}(expression={self.expression!r})"
+
+    # Next fire time strictly after the given datetime
+    @abstractmethod
+    def next_after(self, after, anchor=None):
+        pass
+
+    # Number of fire times from start (itself a fire time) up to and including end
+    def count_between(self, start, end, anchor=None, limit=None):
+        count = 0
+        while start <= end and (limit is None or count < limit):
+            count += 1
+            start = self.next_after(start, anchor)
+        return count
+
+    # The next few fire times after the given datetime
+    def upcoming(self, after, count, anchor=None):
+        times = []
+        for _ in range(count):
+            after = self.next_after(after, anchor)
+            times.append(after)
+        return times
+
+
+# Fires every fixed number of seconds. The times are counted from the anchor
+# (the first fire time), not from when the last run finished, so they never drift.
+class IntervalRecurrence(Recurrence):
+    def __init__(self, expression, seconds):
+        super().__init__(expression)
+        if seconds <= 0:
+            raise ValueError("Interval must be a positive number of seconds.")
+        self.seconds = seconds
+
+    def next_after(self, after, anchor=None):
+        if anchor is None:
+            return after + timedelta(seconds=self.seconds)
+        if after < anchor:
+            return anchor
+        periods = int((after - anchor).total_seconds() // self.seconds) + 1
+        return anchor + timedelta(seconds=periods * self.seconds)
+
+    def count_between(self, start, end, anchor=None, limit=None):
+        if start > end:
+            return 0
+        count = int((end - start).total_seconds() // self.seconds) + 1
+        return count if limit is None else min(count, limit)
+
+
+# Fires at one or more times of day, optionally only on some days of the week
+class DailyRecurrence(Recurrence):
+    def __init__(self, expression, minutes, weekdays=range(7)):
+        super().__init__(expression)
+        self.minutes = sorted(set(minutes))
+        self.weekdays = frozenset(weekdays)
+        if not self.minutes or not self.weekdays:
+            raise ValueError("A daily schedule needs at least one time and one day.")
+
+    def next_after(self, after, anchor=None):
+        day = after.replace(hour=0, minute=0, second=0, microsecond=0)
+        after_minutes = (after - day).total_seconds() / 60
+        idx = bisect_right(self.minutes, after_minutes)
+        for offset in range(8):
+            date = day + timedelta(days=offset)
+            if date.weekday() in self.weekdays and idx < len(self.minutes):
+                return date + timedelta(minutes=self.minutes[idx])
+            # Every time on the following days is in the future
+            idx = 0
+        raise ValueError(f"No fire time found for '{self.expression}'.")
+
+
+# Fires on a standard five field cron expression: minute hour day month weekday
+class CronRecurrence(Recurrence):
+    def __init__(self, expression, minutes, hours, days, months, weekdays, any_day, any_weekday):
+        super().__init__(expression)
+        self.minutes = sorted(minutes)
+        self.hours = sorted(hours)
+        self.days = frozenset(days)
+        self.months = frozenset(months)
+        self.weekdays = frozenset(weekdays)
+        self.any_day = any_day
+        self.any_weekday = any_weekday
+
+    # Cron matches either the day of month or the weekday when both are restricted
+    def _day_matches(self, date):
+        day_match = date.day in self.days
+        weekday_match = date.weekday() in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day_match and weekday_match
+        return day_match or weekday_match
+
+    def next_after(self, after, anchor=None):
+        candidate = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=366 * 5)
+        while candidate <= limit:
+            if candidate.month not in self.months or not self._day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+            idx = bisect_left(self.hours, candidate.hour)
+            if idx == len(self.hours):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+            if self.hours[idx] != candidate.hour:
+                candidate = candidate.replace(hour=self.hours[idx], minute=0)
+            idx = bisect_left(self.minutes, candidate.minute)
+            if idx == len(self.minutes):
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+                continue
+            return candidate.replace(minute=self.minutes[idx])
+        raise ValueError(f"No fire time found for '{self.expression}'.")
+
+
+# Parse one cron field such as "*", "*/15", "1-5", "mon-fri" or "0,30"
+def _parse_field(field, low, high, names=None):
+    values = set()
+    for part in field.split(","):
+        step = 1
+        if "/" in part:
+            part, step = part.split("/")
+            step = int(step)
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start, end = (_parse_value(value, names) for value in part.split("-"))
+        else:
+            start = _parse_value(part, names)
+            end = high if step > 1 else start
+        if step < 1 or start < low or end > high or start > end:
+            raise ValueError(f"Invalid cron field '{field}'.")
+        values.update(range(start, end + 1, step))
+    return values
+
+def _parse_value(value, names):
+    if names and value in names:
+        return names[value]
+    return int(value)
+
+# Parse a "HH:MM" time into minutes since midnight
+def _parse_time(value):
+    hour, minute = map(int, value.split(":"))
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        raise ValueError(f"Invalid time '{value}'.")
+    return hour * 60 + minute
+
+# Parse a day list such as "daily", "weekdays", "mon-fri" or "sat,sun"
+def _parse_days(value):
+    if value in DAY_GROUPS:
+        return set(DAY_GROUPS[value])
+    days = set()
+    for part in value.split(","):
+        if "-" in part:
+            start, end = (WEEKDAYS[day] for day in part.split("-"))
+            days.update(range(start, end + 1))
+        else:
+            days.add(WEEKDAYS[part])
+    return days
+
+# Parse a recurrence expression. Supported forms are an int number of seconds,
+# "every 15m", "HH:MM", "07:00,19:30", "mon-fri 07:00" and five field cron.
+@lru_cache(maxsize=1024)
+def parse(expression):
+    if isinstance(expression, int):
+        return IntervalRecurrence(expression, expression)
+    if not isinstance(expression, str):
+        raise TypeError("Recurrence must be an int number of seconds or a string.")
+    text = expression.strip().lower()
+    parts = text.split()
+    try:
+        if len(parts) == 2 and parts[0] == "every":
+            unit = parts[1][-1]
+            if unit in UNITS:
+                return IntervalRecurrence(expression, int(parts[1][:-1]) * UNITS[unit])
+            return IntervalRecurrence(expression, int(parts[1]))
+        if len(parts) == 5:
+            cron_weekdays = {name: (number + 1) % 7 for name, number in WEEKDAYS.items()}
+            weekdays = _parse_field(parts[4], 0, 7, cron_weekdays)
+            return CronRecurrence(
+                expression,
+                _parse_field(parts[0], 0, 59),
+                _parse_field(parts[1], 0, 23),
+                _parse_field(parts[2], 1, 31),
+                _parse_field(parts[3], 1, 12),
+                # Cron counts weekdays from Sunday, datetime from Monday
+                {(day - 1) % 7 for day in weekdays},
+                parts[2] == "*",
+                parts[4] == "*",
+            )
+        if len(parts) == 2:
+            return DailyRecurrence(expression, [_parse_time(value) for value in parts[1].split(",")], _parse_days(parts[0]))
+        if len(parts) == 1:
+            return DailyRecurrence(expression, [_parse_time(value) for value in parts[0].split(",")])
+    except (KeyError, ValueError) as e:
+        raise ValueError(f"Invalid recurrence '{expression}': {e}")
+    raise ValueError(f"Invalid recurrence '{expression}'.")
+
+# Seconds from now until the next fire time of an expression
+def seconds_until(expression, now=None):
+    if isinstance(expression, int):
+        return expression
+    now = now if now is not None else datetime.now()
+    return (parse(expression).next_after(now) - now).total_seconds()
@@ -0,0 +1,382 @@
+import asyncio
+import heapq
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import math
+import threading
+import time as time_module
+import weakref
+from colorama import Fore, Style
+import Clock
+
+# This class is a pending callback in a scheduler. Cancelling it drops the
+# callback straight away, so nothing it references is kept alive.
+class Timer():
+    def __init__(self, scheduler, due_time, callback, group=None):
+        self.scheduler = scheduler
+        self.due_time = due_time
+        self.callback = callback
+        self.group = group
+        self.cancelled = False
+        self._handle = None
+
+    # Magic Methods
+    def __str__(self):
+        return f"Timer: due in {self.delay():.1f} seconds{' (cancelled)' if self.cancelled else ''}"
+    def __repr__(self):
+        return f"Timer(due_time={self.due_time}, cancelled={self.cancelled})"
+
+    # Check whether the timer is still waiting to fire
+    @property
+    def active(self):
+        return not self.cancelled and self.callback is not None
+
+    # Seconds left until the timer fires
+    def delay(self):
+        return self.due_time - self.scheduler.time()
+
+    # Wall clock timestamp of when the timer fires
+    def when(self):
+        return self.scheduler.clock.now().timestamp() + self.delay()
+
+    # Cancel the timer, returns False if it already fired or was cancelled
+    def cancel(self):
+        if not self.active:
+            return False
+        self.scheduler._cancel(self)
+        return True
+
+
+# This class runs every scheduled operation from a single dispatcher thread.
+# Pending operations are kept in a min-heap ordered by their due time, so the
+# thread count stays fixed no matter how many operations are waiting.
+# Operations falling due in the same tick are grouped by their home or network
+# and each group runs as one batch under a single lock acquisition.
+# Batches run on a bounded worker pool: at most max_per_group batches of one
+# group run at once and at most max_queue batches are in flight, after which
+# the dispatcher waits for the workers to catch up.
+# With a VirtualClock no dispatcher thread is started; run_until() and
+# run_for() jump the clock from one due batch to the next instead.
+class Scheduler():
+    def __init__(self, tick=0.01, max_workers=4, max_queue=1000, max_per_group=1, executor=None, clock=None):
+        if max_queue < 1 or max_per_group < 1:
+            raise ValueError("max_queue and max_per_group must be at least 1.")
+        self.clock = clock if clock is not None else Clock.SystemClock()
+        self.tick = tick
+        self.max_per_group = max_per_group
+        self._queue = []
+        self._cancelled = 0
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopped = False
+        self._lock = threading.Lock()
+        self._default_slots = threading.Semaphore(max_per_group)
+        # Model objects are held weakly, so a deleted home or network drops its lock.
+        # Groups that cannot be weakly referenced, e.g. names, are held in a plain dict.
+        self._group_slots = weakref.WeakKeyDictionary()
+        self._named_slots = {}
+        self._listeners = []
+        self._executor = executor if executor is not None else ThreadPoolExecutor(max_workers, thread_name_prefix="SchedulerWorker")
+        self._in_flight = threading.BoundedSemaphore(max_queue)
+        self._group_active = {}
+        self._group_backlog = {}
+
+    # Magic Methods
+    def __str__(self):
+        return f"Scheduler: {len(self)} pending operations"
+    def __repr__(self):
+        return f"Scheduler(pending={len(self)})"
+    def __len__(self):
+        return len(self._queue) - self._cancelled
+
+    # Current time on the scheduler's clock
+    def time(self):
+        return self.clock.time()
+
+    # Add a callback to be run after a delay in seconds, batched with others in the same group
+    def schedule(self, delay_seconds, callback, group=None):
+        timer = Timer(self, self._bucket(self.time() + max(delay_seconds, 0)), callback, group)
+        entry = (timer.due_time, next(self._counter), timer)
+        with self._condition:
+            heapq.heappush(self._queue, entry)
+            if self.clock.realtime:
+                self._start()
+            # Only wake the dispatcher if the new entry is now the earliest one
+            if self._queue[0] is entry:
+                self._condition.notify()
+        return timer
+
+    # Round a due time up to the end of its tick, so operations falling due in the same
+    # tick share one due time and run as one batch, late by less than a tick but never early
+    def _bucket(self, due_time):
+        if self.tick <= 0:
+            return due_time
+        bucket = math.ceil(due_time / self.tick) * self.tick
+        return bucket if bucket >= due_time else bucket + self.tick
+
+    # Cancelled timers stay in the heap until popped, unless they make up most of it
+    def _cancel(self, timer):
+        with self._condition:
+            # The dispatcher may have popped the timer since the caller checked it
+            if not timer.active:
+                return
+            timer.cancelled = True
+            timer.callback = timer.group = None
+            self._cancelled += 1
+            if self._cancelled > len(self._queue) // 2:
+                self._queue = [entry for entry in self._queue if not entry[2].cancelled]
+                heapq.heapify(self._queue)
+                self._cancelled = 0
+            self._condition.notify()
+
+    # Start the dispatcher thread if it is not already running
+    def _start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="SchedulerDispatcher")
+            self._thread.daemon = True
+            self._thread.start()
+
+    # Call a listener once per dispatched batch with the group and the number of operations run
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self._listeners.remove(listener)
+
+    # Semaphore held while a batch for the group runs, shared with anything else
+    # changing the group. With the default max_per_group of 1 it is a plain lock.
+    def group_lock(self, group):
+        if group is None:
+            return self._default_slots
+        with self._lock:
+            try:
+                table = self._group_slots
+                slots = table.get(group)
+            except TypeError:
+                table = self._named_slots
+                slots = table.get(group)
+            if slots is None:
+                slots = table[group] = threading.Semaphore(self.max_per_group)
+            return slots
+
+    # Run every operation due up to a time on the virtual clock, jumping the clock
+    # straight to each due batch. Batches run on the calling thread, in order.
+    def run_until(self, until):
+        if self.clock.realtime:
+            raise RuntimeError("run_until needs a scheduler with a virtual clock.")
+        count = 0
+        while True:
+            with self._condition:
+                while self._queue and self._queue[0][2].cancelled:
+                    heapq.heappop(self._queue)
+                    self._cancelled -= 1
+                if not self._queue or self._queue[0][0] > until:
+                    break
+                self.clock.set_time(self._queue[0][0])
+                batches = self._pop_due()
+            for group, callbacks in batches.items():
+                self._dispatch(group, callbacks)
+                count += len(callbacks)
+        self.clock.set_time(until)
+        return count
+
+    def run_for(self, seconds):
+        return self.run_until(self.time() + seconds)
+
+    # Stop the dispatcher and wait for running batches to finish
+    def shutdown(self, wait=True):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self._executor.shutdown(wait=wait)
+
+    # Wait for the next due operations and hand them to the workers in batches
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                due_time, _, timer = self._queue[0]
+                if timer.cancelled:
+                    heapq.heappop(self._queue)
+                    self._cancelled -= 1
+                    continue
+                remaining = due_time - self.time()
+                if remaining > 0:
+                    self._condition.wait(remaining)
+                    continue
+                batches = self._pop_due()
+            for group, callbacks in batches.items():
+                self._submit(group, callbacks)
+
+    # Pop every operation that is due, grouped by home or network
+    def _pop_due(self):
+        batches = {}
+        now = self.time()
+        while self._queue and self._queue[0][0] <= now:
+            _, _, timer = heapq.heappop(self._queue)
+            if timer.cancelled:
+                self._cancelled -= 1
+                continue
+            batches.setdefault(timer.group, []).append(timer.callback)
+            timer.callback = timer.group = None
+        return batches
+
+    # Queue a batch for the workers. Blocks while too many batches are in flight,
+    # and holds the batch back if its group is already running max_per_group batches.
+    def _submit(self, group, callbacks):
+        self._in_flight.acquire()
+        with self._lock:
+            active = self._group_active.get(group, 0)
+            if active >= self.max_per_group:
+                self._group_backlog.setdefault(group, deque()).append(callbacks)
+                return
+            self._group_active[group] = active + 1
+        try:
+            self._executor.submit(self._work, group, callbacks)
+        except RuntimeError:
+            # The executor was shut down
+            self._in_flight.release()
+
+    # Run a batch on a worker, then any batches of the same group that were held back.
+    # Nothing is waiting on the worker's future, so a failed batch is reported here.
+    def _work(self, group, callbacks):
+        while callbacks is not None:
+            try:
+                self._dispatch(group, callbacks)
+            except Exception as e:
+                print(Fore.RED + f"Error dispatching scheduled operations: {e}" + Style.RESET_ALL)
+            finally:
+                self._in_flight.release()
+                callbacks = self._next_batch(group)
+
+    # The next held back batch of a group, or None once the group has no more to run
+    def _next_batch(self, group):
+        with self._lock:
+            backlog = self._group_backlog.get(group)
+            if backlog:
+                callbacks = backlog.popleft()
+                if not backlog:
+                    del self._group_backlog[group]
+                return callbacks
+            self._group_active[group] -= 1
+            if not self._group_active[group]:
+                del self._group_active[group]
+            return None
+
+    # Run one batch under the group's lock and notify listeners once
+    def _dispatch(self, group, callbacks):
+        with self.group_lock(group):
+            for callback in callbacks:
+                try:
+                    callback()
+                except Exception as e:
+                    print(Fore.RED + f"Error in scheduled operation: {e}" + Style.RESET_ALL)
+        for listener in self._listeners:
+            try:
+                listener(group, len(callbacks))
+            except Exception as e:
+                print(Fore.RED + f"Error in scheduler listener: {e}" + Style.RESET_ALL)
+
+
+# This class is the asyncio backend for scheduled operations. Each pending
+# operation is a timer handle on one event loop instead of an OS thread, so a
+# service can embed the scheduler in its own loop and await it.
+class AsyncScheduler():
+    def __init__(self, loop=None, clock=None):
+        self.clock = clock if clock is not None else Clock.SystemClock()
+        # Timers run on the event loop's own clock, which a virtual clock cannot move
+        if not self.clock.realtime:
+            raise ValueError("AsyncScheduler needs a real time clock, use Scheduler for a VirtualClock.")
+        self._loop = loop
+        self._pending = 0
+        self._idle = None
+
+    # Magic Methods
+    def __str__(self):
+        return f"AsyncScheduler: {self._pending} pending operations"
+    def __repr__(self):
+        return f"AsyncScheduler(pending={self._pending})"
+    def __len__(self):
+        return self._pending
+
+    # Bind the scheduler to an event loop, defaulting to the running one
+    def attach(self, loop=None):
+        self._loop = loop if loop is not None else asyncio.get_running_loop()
+        return self._loop
+
+    # Current time on the event loop's clock
+    def time(self):
+        return self._loop.time() if self._loop is not None else time_module.monotonic()
+
+    # Check whether the caller is running on the scheduler's event loop
+    def _in_loop(self):
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    # Add a callback to be run after a delay in seconds. The event loop runs
+    # everything on one thread, so the group needs no lock here.
+    def schedule(self, delay_seconds, callback, group=None):
+        if self._loop is None:
+            self.attach()
+        timer = Timer(self, self.time() + max(delay_seconds, 0), callback, group)
+        if self._in_loop():
+            self._arm(timer)
+        else:
+            # Called from another thread, so hand the timer over to the loop thread
+            self._loop.call_soon_threadsafe(self._arm, timer)
+        return timer
+
+    # Create the timer handle on the event loop thread
+    def _arm(self, timer):
+        if not timer.active:
+            return
+        self._pending += 1
+        timer._handle = self._loop.call_at(timer.due_time, self._fire, timer)
+
+    def _cancel(self, timer):
+        timer.cancelled = True
+        timer.callback = timer.group = None
+        if self._in_loop():
+            self._disarm(timer)
+        else:
+            self._loop.call_soon_threadsafe(self._disarm, timer)
+
+    # Drop the timer handle on the event loop thread
+    def _disarm(self, timer):
+        if timer._handle is None:
+            return
+        timer._handle.cancel()
+        timer._handle = None
+        self._done()
+
+    # Run a due callback and wake anyone waiting for the scheduler to drain
+    def _fire(self, timer):
+        callback, timer.callback = timer.callback, None
+        timer._handle = timer.group = None
+        try:
+            callback()
+        except Exception as e:
+            print(Fore.RED + f"Error in scheduled operation: {e}" + Style.RESET_ALL)
+        finally:
+            self._done()
+
+    def _done(self):
+        self._pending -= 1
+        if self._pending == 0 and self._idle is not None:
+            self._idle.set()
+
+    # Wait until there are no pending operations left
+    async def wait_idle(self):
+        if self._loop is None:
+            self.attach()
+        while self._pending:
+            if self._idle is None or self._idle.is_set():
+                self._idle = asyncio.Event()
+            await self._idle.wait()
@@ -0,0 +1,115 @@
+from colorama import Fore, Style
+import Events
+
+# This class audits the security of every home in a network. Each home's
+# score comes from its running totals, scored like SmartHome.secure_home, and
+# homes are kept in a bucket queue: one bucket per score, holding the homes
+# with that score. The network marks a home whenever one of its devices is
+# added, removed, toggled or changes type, and only marked homes are scored
+# again, so queries never rescan the fleet. Homes below a threshold or the k
+# least secure homes are read from the lowest buckets up.
+class SecurityAudit():
+    # The network owns its audit, so the audit only points back to it weakly
+    network = Events.WeakAttribute("_network")
+
+    def __init__(self, network, threshold=6):
+        self.network = network
+        self.threshold = threshold
+        self._source = None
+        self._buckets = []
+        self._scores = {}
+        self._dirty = set()
+        self.rebuild()
+
+    # Magic Methods
+    def __str__(self):
+        return f"SecurityAudit: {len(self._scores)} homes in network {self.network.ip_address}"
+    def __repr__(self):
+        return f"SecurityAudit(network={self.network.ip_address}, threshold={self.threshold}, homes={len(self._scores)})"
+    def __len__(self):
+        return len(self._scores)
+
+    # Score every home of the network from scratch
+    def rebuild(self):
+        smart_homes = self.network.smart_homes
+        self._source = smart_homes
+        self._buckets = []
+        self._scores = {}
+        self._dirty = set()
+        for smart_home in smart_homes:
+            self._place(smart_home)
+
+    def _place(self, smart_home):
+        score = smart_home.get_totals().security_points
+        while len(self._buckets) <= score:
+            self._buckets.append({})
+        # A dict keeps the homes of a bucket in the order they were scored
+        self._buckets[score][smart_home] = None
+        self._scores[smart_home] = score
+
+    def _unplace(self, smart_home):
+        score = self._scores.pop(smart_home, None)
+        if score is not None:
+            del self._buckets[score][smart_home]
+
+    # Keeping Up With Changes
+
+    # Score a home again before the next query. Called while a device is changing, so nothing is read yet.
+    def mark(self, smart_home):
+        if smart_home in self._scores:
+            self._dirty.add(smart_home)
+
+    def add_home(self, smart_home):
+        self._unplace(smart_home)
+        self._place(smart_home)
+
+    def remove_home(self, smart_home):
+        self._unplace(smart_home)
+        self._dirty.discard(smart_home)
+
+    def _refresh(self):
+        if self.network.smart_homes is not self._source:
+            # The homes were loaded again, e.g. after the network was evicted
+            self.rebuild()
+            return
+        dirty, self._dirty = self._dirty, set()
+        for smart_home in dirty:
+            if smart_home in self._scores:
+                self._unplace(smart_home)
+                self._place(smart_home)
+
+    # Queries
+    def score(self, smart_home):
+        self._refresh()
+        return self._scores.get(smart_home)
+
+    # Every home scoring below the threshold, lowest score first, as (home, score) pairs
+    def below_threshold(self, threshold=None):
+        self._refresh()
+        threshold = self.threshold if threshold is None else threshold
+        return [(smart_home, score) for score in range(min(threshold, len(self._buckets)))
+                for smart_home in self._buckets[score]]
+
+    # The k least secure homes, lowest score first, as (home, score) pairs
+    def least_secure(self, k):
+        self._refresh()
+        homes = []
+        for score, bucket in enumerate(self._buckets):
+            for smart_home in bucket:
+                if len(homes) == k:
+                    return homes
+                homes.append((smart_home, score))
+        return homes
+
+    # Print the homes that are not secure
+    def report(self, threshold=None):
+        threshold = self.threshold if threshold is None else threshold
+        homes = self.below_threshold(threshold)
+        print(f"\n🛡️ Security audit for network {self.network.ip_address}:")
+        print(f"  ├─ Homes audited: {len(self._scores)}")
+        print(f"  └─ Homes below {threshold}/10: {len(homes)}")
+        for smart_home, score in homes:
+            print(Fore.YELLOW + f"     ⚠️ '{smart_home.name}': {score}/10" + Style.RESET_ALL)
+        if not homes:
+            print(f"  ✅ Every home in network {self.network.ip_address} is secure.")
+        return homes
@@ -1,8 +1,17 @@
 from datetime import datetime, timedelta
+import heapq
+import threading
 from colorama import Fore, Style
+import Events
 import Network
-import time as time_module
-import threading
+import Recurrence
+import Scheduler
+
+# Print a status message. Simulations and benchmarks that fire thousands of
+# operations turn these off with SmartDevice.set_verbose(False); errors are always printed.
+def say(message):
+    if SmartDevice._verbose:
+        print(message)
 
 # Decorator to check if the device is ON before performing an operation
 def is_on_check(func):
@@ -18,14 +27,36 @@ def is_on_check(func):
     return wrapper
 
 # This class represents a scheduled operation for a smart device.
-class ScheduledOperation():
+class ScheduledOperation(Events.Observable):
+    __slots__ = ("operation_id", "recurring", "operation", "target_time", "device_serial_number", "args", "kwargs",
+                 "handle", "misfire_policy", "next_fire_at", "anchor_at")
+    _operation_count = 0
+    _transient = ("handle",)
+
+    # What to do on restore when the saved next fire time has already passed
+    FIRE_ONCE = "fire_once"
+    FIRE_ALL = "fire_all"
+    SKIP = "skip"
+    GRACE = "grace"
+    MISFIRE_POLICIES = (FIRE_ONCE, FIRE_ALL, SKIP, GRACE)
+    default_misfire_policy = GRACE
+    misfire_grace_seconds = 3600
+    max_catch_up_runs = 1000
+
     def __init__(self, device_serial_number, operation, target_time, recurring, *args, **kwargs):
+        self.operation_id = ScheduledOperation._operation_count
+        ScheduledOperation._operation_count += 1
         self.recurring = recurring
         self.operation = operation
         self.target_time = target_time
         self.device_serial_number = device_serial_number
         self.args = args
         self.kwargs = kwargs
+        self.handle = None
+        self.misfire_policy = None
+        # Saved with the operation so a restart can pick up where it left off
+        self.next_fire_at = None
+        self.anchor_at = None
         SmartDevice.add_scheduled_operation(self)
 
     # Magic Methods
@@ -33,12 +64,23 @@ class ScheduledOperation():
         return f"ScheduledOperation(device={self.device_serial_number}, operation={self.operation}, target_time={self.target_time}, recurring={self.recurring})"
     def __repr__(self):
         return f"ScheduledOperation(device={self.device_serial_number}, operation={self.operation}, target_time={self.target_time}, recurring={self.recurring})"
-    def __del__(self):
-        print(Fore.RED + f"Scheduled operation for {self.device_serial_number} has been removed." + Style.RESET_ALL)
-        try:
-            SmartDevice._scheduled_operations.remove(self)
-        except ValueError:
-            print(Fore.YELLOW + f"Scheduled operation for {self.device_serial_number} was not found in the list." + Style.RESET_ALL)
+
+    # Remove the operation from the schedule and stop its pending run
+    def dispose(self):
+        SmartDevice.remove_scheduled_operation(self)
+
+    # The running timer is not saved, load() arms a new one
+    def __getstate__(self):
+        state = super().__getstate__()
+        state["handle"] = None
+        return state
+
+    # Cancel the pending run of this operation
+    def cancel(self):
+        handle = getattr(self, "handle", None)
+        if handle is not None:
+            return handle.cancel()
+        return False
 
     # Load the scheduled operation for a specific device
     def load(self, device):
@@ -46,17 +88,350 @@ class ScheduledOperation():
             if not isinstance(device, SmartDevice):
                 raise TypeError("Can only load scheduled operation for a SmartDevice instance.")
             else:
-                print(f"Loading scheduled operation {self.operation} for {device.name} with serial number {device.serial_number}.")
-            device.schedule_operation(self.operation, self.target_time, self.recurring, self, *self.args, **self.kwargs)
+                say(f"Loading scheduled operation {self.operation} for {device.name} with serial number {device.serial_number}.")
+            return device.schedule_operation(self.operation, self.target_time, self.recurring, self, *self.args, **self.kwargs)
             #print(f"✓ Loaded scheduled operation {self.operation} for {device.name} at {self.target_time}.")
         except Exception as e:
             print(Fore.RED + f"Error loading scheduled operation: {e}" + Style.RESET_ALL)
 
+    # Re-arm the operation after a restart from its saved next fire time, applying
+    # the misfire policy if that time has already passed. Returns what was done.
+    def restore(self, device, now, policy=None, grace_seconds=None):
+        next_fire_at = getattr(self, "next_fire_at", None)
+        if next_fire_at is None:
+            # Saved before fire times were kept, so schedule it from scratch
+            self.load(device)
+            return "loaded"
+        fire_at = datetime.fromtimestamp(next_fire_at)
+        anchor_at = getattr(self, "anchor_at", None)
+        anchor = datetime.fromtimestamp(anchor_at) if anchor_at is not None else fire_at
+        if fire_at > now:
+            device.resume_operation(self, fire_at, anchor, 1)
+            return "resumed"
+
+        policy = policy or getattr(self, "misfire_policy", None) or ScheduledOperation.default_misfire_policy
+        if policy not in ScheduledOperation.MISFIRE_POLICIES:
+            raise ValueError(f"Unknown misfire policy '{policy}'.")
+        if policy == ScheduledOperation.GRACE:
+            grace_seconds = grace_seconds if grace_seconds is not None else ScheduledOperation.misfire_grace_seconds
+            late = (now - fire_at).total_seconds() <= grace_seconds
+            policy = ScheduledOperation.FIRE_ONCE if late else ScheduledOperation.SKIP
+        if policy == ScheduledOperation.FIRE_ALL and self.recurring:
+            recurrence = Recurrence.parse(self.target_time)
+            runs = recurrence.count_between(fire_at, now, anchor, ScheduledOperation.max_catch_up_runs)
+        elif policy == ScheduledOperation.SKIP:
+            runs = 0
+        else:
+            runs = 1
+
+        if runs:
+            # Due straight away, so every catch-up lands in the same dispatcher batch
+            device.resume_operation(self, fire_at, anchor, runs)
+            return "caught_up"
+        if not self.recurring:
+            say(f"Skipping missed operation {self.operation} for {device.name}.")
+            SmartDevice.remove_scheduled_operation(self)
+            return "skipped"
+        recurrence = Recurrence.parse(self.target_time)
+        device.resume_operation(self, recurrence.next_after(now, anchor), anchor, 1)
+        return "skipped"
+
+
+# This class is returned by SmartDevice.schedule_operation and controls one
+# scheduled operation. It stays the same across the runs of a recurring
+# operation, and cancelling it drops the timer and every reference it holds.
+class OperationHandle():
+    def __init__(self, device, operation, target_time, recurring, sch_class, *args, **kwargs):
+        self.device = device
+        self.operation = operation
+        self.target_time = target_time
+        self.recurring = recurring
+        self.sch_class = sch_class
+        self.args = args
+        self.kwargs = kwargs
+        # Only a recurring operation needs its next fire times, a one-shot may have a delay of 0
+        self.recurrence = Recurrence.parse(target_time) if recurring else None
+        self.anchor = None
+        self.fire_at = None
+        self.runs = 1
+        self.timer = None
+        self.cancelled = False
+
+    # Magic Methods
+    def __str__(self):
+        return f"OperationHandle(operation={self.operation}, next_fire_time={self.next_fire_time}, cancelled={self.cancelled})"
+    def __repr__(self):
+        return f"OperationHandle(operation={self.operation}, target_time={self.target_time}, recurring={self.recurring}, cancelled={self.cancelled})"
+
+    # When the operation will run next, or None if it is not pending
+    @property
+    def next_fire_time(self):
+        if self.timer is None or not self.timer.active:
+            return None
+        return self.fire_at
+
+    # Start the timer, replacing any timer that is still pending. The fire time
+    # becomes the anchor that recurring runs are counted from.
+    def arm(self, delay_seconds):
+        fire_at = SmartDevice.get_clock().now() + timedelta(seconds=delay_seconds)
+        self.arm_at(fire_at, fire_at)
+
+    # Start the timer for a planned fire time, running the operation `runs` times when it is due
+    def arm_at(self, fire_at, anchor=None, runs=1):
+        self.fire_at = fire_at
+        self.anchor = anchor if anchor is not None else fire_at
+        self.runs = runs
+        self._start_timer((fire_at - SmartDevice.get_clock().now()).total_seconds())
+
+    def _start_timer(self, delay_seconds):
+        if self.timer is not None:
+            self.timer.cancel()
+        if self.sch_class is not None:
+            self.sch_class.next_fire_at = self.fire_at.timestamp()
+            self.sch_class.anchor_at = self.anchor.timestamp()
+        # Operations of the same home run as one batch when they fall due together
+        self.timer = SmartDevice._scheduler.schedule(delay_seconds, self._fire, self.device.get_group())
+
+    # Arm the next run of a recurring operation. It is worked out from the planned
+    # fire time rather than from when the run finished, so the schedule never drifts.
+    def _advance(self):
+        now = SmartDevice.get_clock().now()
+        self.fire_at = self.recurrence.next_after(max(self.fire_at, now), self.anchor)
+        self._start_timer((self.fire_at - now).total_seconds())
+
+    # Cancel the operation and free the timer straight away
+    def cancel(self):
+        if self.cancelled:
+            return False
+        self.cancelled = True
+        if self.timer is not None:
+            self.timer.cancel()
+        sch_class = self.sch_class
+        self.device = self.sch_class = self.timer = None
+        self.args, self.kwargs = (), {}
+        if sch_class is not None:
+            sch_class.handle = None
+            if sch_class in SmartDevice._scheduled_operations:
+                SmartDevice.remove_scheduled_operation(sch_class)
+        return True
+
+    # Move the operation to a new time, given as an int delay in seconds or a recurrence expression
+    def reschedule(self, new_time):
+        if self.cancelled:
+            raise ValueError("Cannot reschedule a cancelled operation.")
+        delay_seconds = SmartDevice.get_delay_seconds(new_time)
+        self.target_time = new_time
+        self.recurrence = Recurrence.parse(new_time) if self.recurring else None
+        if self.sch_class is not None:
+            self.sch_class.target_time = new_time
+        self.arm(delay_seconds)
+        say(f"Rescheduled {self.operation} for {self.device.name} at {new_time} (in {delay_seconds:.1f} seconds)")
+
+    # Run the operation once it is due
+    def _fire(self):
+        device = self.device
+        if device is None:
+            return
+        self.timer = None
+        runs, self.runs = self.runs, 1
+        # Checked once, so a quiet run does not even format the messages
+        verbose = SmartDevice._verbose
+        for _ in range(runs):
+            try:
+                getattr(device, self.operation)(*self.args, **self.kwargs)
+                if verbose:
+                    print(f"{self.operation} completed for {device.name}.")
+            except Exception as e:
+                print(f"Error during {self.operation} for {device.name}: {e}")
+        if self.cancelled or self.timer is not None:
+            # The operation was cancelled or rescheduled while it was running
+            return
+        if not self.recurring:
+            if verbose:
+                print(f"Removing scheduled operation {self.operation} for {device.name}.")
+            # If not recurring, remove the operation from scheduled operations
+            self.cancel()
+        else:
+            # If recurring, re-arm the same handle for the next planned time
+            self._advance()
+            if verbose:
+                print(f"Rescheduling {self.operation} for {device.name} ({self.target_time}), next run at {self.fire_at:%Y-%m-%d %H:%M:%S}.")
+
+
+# This class indexes scheduled operations by id and by device serial number,
+# so adding, removing and looking up the operations of one device never scans
+# the whole list of scheduled operations.
+class ScheduleRegistry():
+    def __init__(self, operations=None):
+        self._by_id = {}
+        self._by_device = {}
+        for operation in operations or []:
+            self.add(operation)
+
+    # Magic Methods
+    def __str__(self):
+        return f"ScheduleRegistry: {len(self._by_id)} operations"
+    def __repr__(self):
+        return f"ScheduleRegistry(operations={list(self._by_id.values())})"
+    def __len__(self):
+        return len(self._by_id)
+    def __iter__(self):
+        return iter(list(self._by_id.values()))
+    def __contains__(self, operation):
+        return self._by_id.get(getattr(operation, "operation_id", None)) is operation
+
+    # Add and Remove Scheduled Operations
+    def add(self, operation):
+        # Operations saved before ids existed get one when they are restored
+        if getattr(operation, "operation_id", None) is None:
+            operation.operation_id = ScheduledOperation._operation_count
+            ScheduledOperation._operation_count += 1
+        ScheduledOperation._operation_count = max(ScheduledOperation._operation_count, operation.operation_id + 1)
+        self._by_id[operation.operation_id] = operation
+        self._by_device.setdefault(operation.device_serial_number, {})[operation.operation_id] = operation
+
+    def remove(self, operation):
+        if operation not in self:
+            raise ValueError("Scheduled operation is not in the registry.")
+        del self._by_id[operation.operation_id]
+        device_operations = self._by_device[operation.device_serial_number]
+        del device_operations[operation.operation_id]
+        if not device_operations:
+            del self._by_device[operation.device_serial_number]
+
+    # Lookups
+    def get(self, operation_id):
+        return self._by_id.get(operation_id)
+
+    def for_device(self, device_serial_number):
+        return list(self._by_device.get(device_serial_number, {}).values())
+
+
+# This class hands out the integer ids of devices. Ids are dense, starting at
+# 0, and an id freed by a deleted device is handed out again before a new one
+# is added at the end, lowest first, so arrays indexed by device id stay as
+# small as the fleet. Devices read back from a save adopt the id in their
+# serial number, and get_state()/restore() carry the next id and the free ids
+# across restarts, including the ids of devices that are saved but not loaded.
+class DeviceIdAllocator():
+    # Owner of an id whose device exists but is not loaded
+    _HELD = 0
+
+    def __init__(self):
+        # id() of the device holding each id, _HELD, or None for a free id
+        self._owners = []
+        self._free = []
+        self._live = 0
+        self._lock = threading.Lock()
+
+    # Magic Methods
+    def __str__(self):
+        return f"DeviceIdAllocator: {self._live} devices, {len(self._owners) - self._live} free ids"
+    def __repr__(self):
+        return f"DeviceIdAllocator(next_id={len(self._owners)}, live={self._live})"
+    def __len__(self):
+        return self._live
+
+    # One more than the highest id in use, the size an array indexed by device id needs
+    @property
+    def next_id(self):
+        return len(self._owners)
+
+    # Give a new device the lowest free id
+    def allocate(self, device):
+        with self._lock:
+            owners = self._owners
+            while self._free:
+                device_id = heapq.heappop(self._free)
+                # An id can be adopted by a loaded device while it is on the free list
+                if owners[device_id] is None:
+                    break
+            else:
+                device_id = len(owners)
+                owners.append(None)
+            owners[device_id] = id(device)
+            self._live += 1
+            return device_id
+
+    # Take the id of a device that was read back from a save
+    def adopt(self, device, device_id):
+        with self._lock:
+            owners = self._owners
+            if device_id >= len(owners):
+                # The ids in between belong to devices that are not loaded yet, until restore() says otherwise
+                self._live += device_id + 1 - len(owners)
+                owners.extend([self._HELD] * (device_id + 1 - len(owners)))
+            elif owners[device_id] is None:
+                self._live += 1
+            owners[device_id] = id(device)
+
+    # Take the ids of many devices read back from a save at once, under one lock. A None id is skipped.
+    def adopt_all(self, devices, device_ids):
+        with self._lock:
+            owners = self._owners
+            highest = max((device_id for device_id in device_ids if device_id is not None), default=-1)
+            if highest >= len(owners):
+                self._live += highest + 1 - len(owners)
+                owners.extend([self._HELD] * (highest + 1 - len(owners)))
+            for device, device_id in zip(devices, device_ids):
+                if device_id is not None:
+                    if owners[device_id] is None:
+                        self._live += 1
+                    owners[device_id] = id(device)
+
+    # Free the id of a deleted device. A device whose id has since been adopted by another copy keeps nothing.
+    def release(self, device, device_id):
+        with self._lock:
+            if device_id < len(self._owners) and self._owners[device_id] == id(device):
+                self._owners[device_id] = None
+                heapq.heappush(self._free, device_id)
+                self._live -= 1
+
+    # Persistence
+
+    # The next id and the free ids, as saved next to the devices
+    def get_state(self):
+        with self._lock:
+            return len(self._owners), sorted({device_id for device_id in self._free if self._owners[device_id] is None})
+
+    # Put back a saved state, before or after the devices have adopted their ids.
+    # Without a list of free ids (data saved before this allocator) every id below
+    # next_id that no loaded device holds is freed, so only pass free=None once
+    # the whole fleet is loaded.
+    def restore(self, next_id, free=None):
+        with self._lock:
+            owners = self._owners
+            if next_id > len(owners):
+                self._live += next_id - len(owners)
+                owners.extend([self._HELD] * (next_id - len(owners)))
+            candidates = range(len(owners)) if free is None else free
+            for device_id in candidates:
+                if device_id < len(owners) and owners[device_id] == self._HELD:
+                    owners[device_id] = None
+                    heapq.heappush(self._free, device_id)
+                    self._live -= 1
+
+    # Forget every id, e.g. before loading a different save
+    def reset(self):
+        with self._lock:
+            self._owners = []
+            self._free = []
+            self._live = 0
+
 
 # This code defines a SmartDevice class that represents a smart device in a smart home network.
-class SmartDevice():
-    _device_count = 0
-    _scheduled_operations = []
+class SmartDevice(Events.Observable):
+    __slots__ = ("name", "device_type", "is_on", "energy_consumption", "_network", "_home", "serial_number", "device_id")
+    # The network and home only point back weakly, they are owned by the network and home themselves
+    network = Events.WeakAttribute("_network")
+    home = Events.WeakAttribute("_home")
+    _ids = DeviceIdAllocator()
+    _transient = ("home",)
+    _counted = frozenset(("is_on", "energy_consumption", "device_type"))
+    _indexed = frozenset(("name", "device_type"))
+    _scheduled_operations = ScheduleRegistry()
+    _scheduler = Scheduler.Scheduler()
+    _verbose = True
 
     def __init__(self, name, device_type):
         self.name = name
@@ -64,25 +439,80 @@ class SmartDevice():
         self.is_on = False
         self.energy_consumption = 3.5
         self.network = None
-        self.serial_number = f"DEV-{SmartDevice._device_count}"
-        SmartDevice._device_count += 1
+        self.home = None
+        self.device_id = SmartDevice._ids.allocate(self)
+        self.serial_number = f"DEV-{self.device_id}"
 
     # Magic Methods
     def __str__(self):
         return f"{self.name} ({self.device_type}) - {'ON' if self.is_on else 'OFF'}"
     def __repr__(self):
         return f"SmartDevice(name={self.name}, device_type={self.device_type}, is_on={self.is_on})"
-    def __del__(self):
-        print(Fore.RED + f"SmartDevice {self.name} has been removed from the system" + Style.RESET_ALL)
-        SmartDevice._device_count -= 1
-        if self.network:
-            print(f"  └─ Disconnecting from network at {self.network.ip_address}.")
-            self.disconnect()
-        print(f"  └─ Removing scheduled operations for {self.name}.")
-        for operation in SmartDevice._scheduled_operations:
-            if operation.device_serial_number == self.serial_number:
-                operation.__del__()
 
+    # Remove the device for good: take it out of its home, cancel its scheduled operations
+    # and free its id for a new device. Dropping a device without this, e.g. when a
+    # network is evicted from memory, leaves it in the store.
+    def dispose(self, report=True):
+        if report:
+            print(Fore.RED + f"SmartDevice {self.name} has been removed from the system" + Style.RESET_ALL)
+        home = self.home
+        if home is not None and self in home.smart_devices:
+            home.remove_smart_device(self)
+        Events.emit(self, "dispose")
+        if report:
+            print(f"  └─ Removing scheduled operations for {self.name}.")
+        self.cancel_scheduled_operations()
+        device_id = getattr(self, "device_id", None)
+        if device_id is not None:
+            SmartDevice._ids.release(self, device_id)
+        object.__setattr__(self, "network", None)
+        object.__setattr__(self, "home", None)
+
+    # The totals of the home and network count a device by some of its attributes, and
+    # the network index looks it up by others, so it is counted and indexed out before
+    # one of them changes and back in afterwards
+    def __setattr__(self, name, value):
+        counted = name in SmartDevice._counted
+        indexed = name in SmartDevice._indexed
+        home = getattr(self, "home", None) if counted or indexed else None
+        if home is None:
+            Events.Observable.__setattr__(self, name, value)
+            return
+        network = home.network if indexed else None
+        if counted:
+            home.update_totals(self, -1)
+        if network is not None:
+            network.unindex_device(self)
+        Events.Observable.__setattr__(self, name, value)
+        if network is not None:
+            network.index_device(self)
+        if counted:
+            home.update_totals(self, 1)
+
+    # A device read back from a save takes the id in its serial number again
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        if isinstance(state, tuple):
+            state = {**(state[0] or {}), **(state[1] or {})}
+        if "serial_number" in state:
+            SmartDevice.adopt_id(self)
+
+    # Device Ids
+
+    # The id in a serial number like "DEV-12", or None for a serial that has none
+    @staticmethod
+    def id_from_serial(serial_number):
+        if isinstance(serial_number, str) and serial_number.startswith("DEV-") and serial_number[4:].isdigit():
+            return int(serial_number[4:])
+        return None
+
+    # Register a device that was built without __init__ under the id in its serial number
+    @classmethod
+    def adopt_id(cls, device):
+        device_id = cls.id_from_serial(device.serial_number)
+        object.__setattr__(device, "device_id", device_id)
+        if device_id is not None:
+            cls._ids.adopt(device, device_id)
 
     # Toggle the device state
     def toggle(self):
@@ -94,16 +524,16 @@ class SmartDevice():
     # Turn the device ON or OFF
     def turn_on(self):
         self.is_on = True
-        print(f"{self.name} is now ON.")
+        say(f"{self.name} is now ON.")
 
     def turn_off(self):
         self.is_on = False
-        print(f"{self.name} is now OFF.")
+        say(f"{self.name} is now OFF.")
 
     # Set and get energy consumption
     def set_energy_consumption(self, consumption):
         self.energy_consumption = consumption
-        print(f"{self.name} energy consumption set to {self.energy_consumption} kWh.")
+        say(f"{self.name} energy consumption set to {self.energy_consumption} kWh.")
     @is_on_check
     def get_energy_consumption(self):
         return self.energy_consumption
@@ -113,15 +543,20 @@ class SmartDevice():
         if not isinstance(network, Network.Network):
             raise TypeError("Can only connect to a Network instance.")
         self.network = network
-        print(f"✓ {self.name} has successfully connected to network at {network.ip_address}.")
+        say(f"✓ {self.name} has successfully connected to network at {network.ip_address}.")
 
     def disconnect(self):
         if self.network is None:
-            print(f"! {self.name} is not currently connected to any network.")
+            say(f"! {self.name} is not currently connected to any network.")
             return
         old_network = self.network.ip_address
         self.network = None
-        print(f"✓ {self.name} has disconnected from network at {old_network}.")
+        say(f"✓ {self.name} has disconnected from network at {old_network}.")
+
+    # The home, or else the network, whose scheduled operations are batched with this device's
+    def get_group(self):
+        home = getattr(self, "home", None)
+        return home if home is not None else self.network
 
     # Set a delayed operation to be executed after a specific delay
     def delay_operation(self, operation, delay_seconds, recurring, sch_class, target_time, *args, **kwargs):
@@ -129,26 +564,31 @@ class SmartDevice():
             print(f"Operation {operation} is not available for {self.name}.")
             return
 
-        def delayed_operation():
-            time_module.sleep(delay_seconds)
-            try:
-                getattr(self, operation)(*args, **kwargs)
-                print(f"{operation} completed for {self.name} after {delay_seconds} seconds.")
-            except Exception as e:
-                print(f"Error during {operation} for {self.name}: {e}")
-            if not recurring:
-                print(SmartDevice._scheduled_operations)
-                print(f"Removing scheduled operation {operation} for {self.name}.")
-                # If not recurring, remove the operation from scheduled operations
-                SmartDevice.remove_scheduled_operation(sch_class)
-            else:
-                print(f"Rescheduling {operation} for {self.name} every {target_time}.")
-                # If recurring, reschedule the operation
-                self.schedule_operation(operation, target_time, recurring, sch_class, *args, **kwargs)
-        thread = threading.Thread(target=delayed_operation)
-        thread.daemon = True
-        thread.start()
-        return thread
+        handle = self._get_handle(operation, target_time, recurring, sch_class, *args, **kwargs)
+        handle.arm(delay_seconds)
+        return handle
+
+    # Re-arm a restored scheduled operation at its saved fire time
+    def resume_operation(self, sch_class, fire_at, anchor, runs=1):
+        if not hasattr(self, sch_class.operation):
+            print(f"Operation {sch_class.operation} is not available for {self.name}.")
+            return
+        handle = self._get_handle(sch_class.operation, sch_class.target_time, sch_class.recurring, sch_class, *sch_class.args, **sch_class.kwargs)
+        handle.arm_at(fire_at, anchor, runs)
+        return handle
+
+    # Reuse the handle of an operation that is already scheduled, so loading it twice never runs it twice
+    def _get_handle(self, operation, target_time, recurring, sch_class, *args, **kwargs):
+        handle = getattr(sch_class, "handle", None)
+        if handle is None or handle.cancelled or handle.device is not self:
+            handle = OperationHandle(self, operation, target_time, recurring, sch_class, *args, **kwargs)
+            if sch_class is not None:
+                sch_class.handle = handle
+        else:
+            handle.operation, handle.target_time, handle.recurring = operation, target_time, recurring
+            handle.recurrence = Recurrence.parse(target_time) if recurring else None
+            handle.args, handle.kwargs = args, kwargs
+        return handle
 
     # Schedule an operation to run at a specific time or after a delay.
     def schedule_operation(self, operation, target_time, recurring, sch_class, *args, **kwargs):
@@ -158,43 +598,79 @@ class SmartDevice():
 
         # Parse the time string
         try:
-            # If target_time is already an int, treat it as seconds for backward compatibility
-            if isinstance(target_time, int):
-                return self.delay_operation(operation, target_time, recurring, sch_class, target_time, *args, **kwargs)
-
-            # Parse the time string (format: "HH:MM")
-            hour, minute = map(int, target_time.split(':'))
-            now = datetime.now()
-            target_datetime = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
-
-            # If the time is already past for today, schedule it for tomorrow
-            if target_datetime < now:
-                target_datetime += timedelta(days=1)
-
-            # Calculate seconds until the target time
-            delay_seconds = (target_datetime - now).total_seconds()
-            print(f"Scheduled {operation} for {self.name} at {target_time} (in {delay_seconds:.1f} seconds)")
-
+            delay_seconds = SmartDevice.get_delay_seconds(target_time)
+            if not isinstance(target_time, int):
+                say(f"Scheduled {operation} for {self.name} at {target_time} (in {delay_seconds:.1f} seconds)")
             return self.delay_operation(operation, delay_seconds, recurring, sch_class, target_time, *args, **kwargs)
         except Exception as e:
             print(f"Error scheduling {operation}: {e}")
-            print("Please provide time in HH:MM format (e.g., '14:30')")
+            print("Please provide time in HH:MM format (e.g., '14:30', 'mon-fri 07:00' or 'every 15m')")
+            # An operation that could not be armed would never run, so it is not kept
+            if sch_class is not None and sch_class in SmartDevice._scheduled_operations:
+                SmartDevice.remove_scheduled_operation(sch_class)
+
+    # Seconds until a target time, given as an int delay in seconds or a recurrence
+    # expression such as "HH:MM", "mon-fri 07:00", "every 15m" or five field cron
+    @staticmethod
+    def get_delay_seconds(target_time):
+        return Recurrence.seconds_until(target_time, SmartDevice.get_clock().now())
+
+    # Cancel every scheduled operation of this device
+    def cancel_scheduled_operations(self):
+        for operation in SmartDevice._scheduled_operations.for_device(self.serial_number):
+            SmartDevice.remove_scheduled_operation(operation)
 
     # Class methods to manage device count and scheduled operations
     @classmethod
     def get_device_count(cls):
-        return cls._device_count
+        return len(cls._ids)
+
+    @classmethod
+    def get_device_ids(cls):
+        return cls._ids
+
+    @classmethod
+    def get_scheduler(cls):
+        return cls._scheduler
+
+    # The clock all scheduling is measured against, real or virtual
+    @classmethod
+    def get_clock(cls):
+        return cls._scheduler.clock
+
+    # Swap the scheduler backend, e.g. an AsyncScheduler running in a service's event loop
+    # Turn the status messages of devices and scheduled operations on or off
+    @classmethod
+    def set_verbose(cls, verbose):
+        cls._verbose = bool(verbose)
+
+    @classmethod
+    def is_verbose(cls):
+        return cls._verbose
+
+    @classmethod
+    def set_scheduler(cls, scheduler):
+        if not isinstance(scheduler, (Scheduler.Scheduler, Scheduler.AsyncScheduler)):
+            raise TypeError("Scheduler must be a Scheduler or AsyncScheduler instance.")
+        cls._scheduler = scheduler
 
     @classmethod
     def get_scheduled_operations(cls):
         return cls._scheduled_operations
 
+    # Replace the registry, e.g. with the operations restored from data.pkl
+    @classmethod
+    def set_scheduled_operations(cls, operations):
+        cls._scheduled_operations = ScheduleRegistry(operations)
+        return cls._scheduled_operations
+
     @classmethod
     def add_scheduled_operation(cls, operation):
         if not isinstance(operation, ScheduledOperation):
             raise TypeError("Only scheduled_operation instances can be added.")
-        cls._scheduled_operations.append(operation)
-        print(f"Scheduled operation {operation} has been added for {operation.device_serial_number}.")
+        cls._scheduled_operations.add(operation)
+        Events.emit(operation, "add_scheduled_operation")
+        say(f"Scheduled operation {operation} has been added for {operation.device_serial_number}.")
 
     @classmethod
     def remove_scheduled_operation(cls, operation):
@@ -202,22 +678,42 @@ class SmartDevice():
             raise TypeError("Only scheduled_operation instances can be removed.")
         try:
             cls._scheduled_operations.remove(operation)
-            print(f"Scheduled operation {operation} has been removed.")
+            Events.emit(operation, "remove_scheduled_operation")
+            say(f"Scheduled operation {operation} has been removed.")
         except ValueError:
-            print(f"Scheduled operation {operation} was not found in the list.")
+            say(f"Scheduled operation {operation} was not found in the list.")
+        # Stop the pending run so the removed operation never fires
+        operation.cancel()
+
+    # Restore the scheduled operations of many devices at once after a restart. Operations
+    # are handled in saved fire time order so catch-up runs happen deterministically.
+    @classmethod
+    def restore_scheduled_operations(cls, devices, policy=None, grace_seconds=None):
+        now = cls.get_clock().now()
+        pending = [(operation, device) for device in devices for operation in cls._scheduled_operations.for_device(device.serial_number)]
+        pending.sort(key=lambda item: (getattr(item[0], "next_fire_at", None) or 0, item[0].operation_id))
+        results = {}
+        for operation, device in pending:
+            try:
+                result = operation.restore(device, now, policy, grace_seconds)
+            except Exception as e:
+                print(Fore.RED + f"Error restoring scheduled operation: {e}" + Style.RESET_ALL)
+                result = "failed"
+            results[result] = results.get(result, 0) + 1
+        return results
 
     @classmethod
     def load_all_scheduled_operations(cls, device):
         if not isinstance(device, SmartDevice):
             raise TypeError("Can only load scheduled operations for a SmartDevice instance.")
-        print(f"Loading all scheduled operations for {device.name} with serial number {device.serial_number}.")
-        for operation in cls._scheduled_operations:
-            if operation.device_serial_number == device.serial_number:
-                operation.load(device)
-                print(f"✓ Loaded scheduled operation {operation.operation} for {device.name} at {operation.target_time}.")
+        say(f"Loading all scheduled operations for {device.name} with serial number {device.serial_number}.")
+        for operation in cls._scheduled_operations.for_device(device.serial_number):
+            operation.load(device)
+            say(f"✓ Loaded scheduled operation {operation.operation} for {device.name} at {operation.target_time}.")
 
 # Child class for a Smart Light
 class SmartLight(SmartDevice):
+    __slots__ = ("brightness", "colour")
     def __init__(self, name, brightness=50):
         super().__init__(name, "Light")
         self.brightness = brightness
@@ -234,15 +730,16 @@ class SmartLight(SmartDevice):
     @is_on_check
     def set_brightness(self, brightness):
         self.brightness = brightness
-        print(f"{self.name} brightness set to {self.brightness}.")
+        say(f"{self.name} brightness set to {self.brightness}.")
 
     @is_on_check
     def set_colour(self, colour):
         self.colour = colour
-        print(f"{self.name} colour set to {self.colour}.")
+        say(f"{self.name} colour set to {self.colour}.")
 
 # Child class for a Smart Thermostat
 class SmartThermostat(SmartDevice):
+    __slots__ = ("temperature",)
     def __init__(self, name, temperature=22):
         super().__init__(name, "Thermostat")
         self.temperature = temperature
@@ -258,20 +755,21 @@ class SmartThermostat(SmartDevice):
     @is_on_check
     def set_temperature(self, temperature):
         self.temperature = temperature
-        print(f"{self.name} temperature set to {self.temperature}.")
+        say(f"{self.name} temperature set to {self.temperature}.")
 
     @is_on_check
     def increase_temperature(self, amount):
         self.temperature += amount
-        print(f"{self.name} temperature increased to {self.temperature}.")
+        say(f"{self.name} temperature increased to {self.temperature}.")
 
     @is_on_check
     def decrease_temperature(self, amount):
         self.temperature -= amount
-        print(f"{self.name} temperature decreased to {self.temperature}.")
+        say(f"{self.name} temperature decreased to {self.temperature}.")
 
 # Child class for a Smart Security Camera
 class SmartCamera(SmartDevice):
+    __slots__ = ("resolution", "recording")
     def __init__(self, name, resolution="1080p"):
         super().__init__(name, "Security Camera")
         self.resolution = resolution
@@ -288,23 +786,23 @@ class SmartCamera(SmartDevice):
     @is_on_check
     def set_resolution(self, resolution):
         self.resolution = resolution
-        print(f"{self.name} resolution set to {self.resolution}.")
+        say(f"{self.name} resolution set to {self.resolution}.")
 
     @is_on_check
     def record(self):
         if self.is_on:
             self.recording = True
-            print(f"{self.name} is recording.")
+            say(f"{self.name} is recording.")
         else:
-            print(f"{self.name} is OFF. Cannot record.")
+            say(f"{self.name} is OFF. Cannot record.")
 
     @is_on_check
     def stop_recording(self):
         if self.is_on:
             self.recording = False
-            print(f"{self.name} has stopped recording.")
+            say(f"{self.name} has stopped recording.")
         else:
-            print(f"{self.name} is OFF. Cannot stop recording.")
+            say(f"{self.name} is OFF. Cannot stop recording.")
 
     # Method to turn the camera OFF and stop recording
     def turn_off(self):
@@ -314,6 +812,7 @@ class SmartCamera(SmartDevice):
 
 # Child class for a Smart Appliance
 class SmartAppliance(SmartDevice):
+    __slots__ = ("appliance_type",)
     def __init__(self, name, appliance_type):
         super().__init__(name, "Appliance")
         self.appliance_type = appliance_type
@@ -328,10 +827,11 @@ class SmartAppliance(SmartDevice):
     # Methods to control the appliance
     def set_appliance_type(self, appliance_type):
         self.appliance_type = appliance_type
-        print(f"{self.name} appliance type set to {self.appliance_type}.")
+        say(f"{self.name} appliance type set to {self.appliance_type}.")
 
 # Child class for a Smart Speaker
 class SmartSpeaker(SmartDevice):
+    __slots__ = ("volume", "song_playing")
     def __init__(self, name, volume=50):
         super().__init__(name, "Speaker")
         self.volume = volume
@@ -348,27 +848,27 @@ class SmartSpeaker(SmartDevice):
     @is_on_check
     def set_volume(self, volume):
         self.volume = volume
-        print(f"{self.name} volume set to {self.volume}.")
+        say(f"{self.name} volume set to {self.volume}.")
 
     @is_on_check
     def increase_volume(self, amount):
         self.volume += amount
-        print(f"{self.name} volume increased to {self.volume}.")
+        say(f"{self.name} volume increased to {self.volume}.")
 
     @is_on_check
     def decrease_volume(self, amount):
         self.volume -= amount
-        print(f"{self.name} volume decreased to {self.volume}.")
+        say(f"{self.name} volume decreased to {self.volume}.")
 
     @is_on_check
     def play_music(self, song):
         self.song_playing = song
-        print(f"{self.name} is playing {song}.")
+        say(f"{self.name} is playing {song}.")
 
     @is_on_check
     def stop_music(self):
         self.song_playing = None
-        print(f"{self.name} has stopped playing music.")
+        say(f"{self.name} has stopped playing music.")
 
     def turn_off(self):
         self.stop_music()
@@ -376,6 +876,7 @@ class SmartSpeaker(SmartDevice):
 
 # Child class for Smart Lock
 class SmartLock(SmartDevice):
+    __slots__ = ("locked",)
     def __init__(self, name):
         super().__init__(name, "Lock")
         self.locked = True
@@ -391,15 +892,16 @@ class SmartLock(SmartDevice):
     @is_on_check
     def lock(self):
         self.locked = True
-        print(f"{self.name} is now LOCKED.")
+        say(f"{self.name} is now LOCKED.")
 
     @is_on_check
     def unlock(self):
         self.locked = False
-        print(f"{self.name} is now UNLOCKED.")
+        say(f"{self.name} is now UNLOCKED.")
 
 # Child class for Smart Doorbell
 class SmartDoorbell(SmartDevice):
+    __slots__ = ("ringing",)
     def __init__(self, name):
         super().__init__(name, "Doorbell")
         self.ringing = False
@@ -415,12 +917,12 @@ class SmartDoorbell(SmartDevice):
     @is_on_check
     def ring(self):
         self.ringing = True
-        print(f"{self.name} is now RINGING.")
+        say(f"{self.name} is now RINGING.")
 
     @is_on_check
     def stop_ringing(self):
         self.ringing = False
-        print(f"{self.name} has stopped RINGING.")
+        say(f"{self.name} has stopped RINGING.")
 
     def turn_off(self):
         self.stop_ringing()
@@ -429,6 +931,7 @@ class SmartDoorbell(SmartDevice):
 
 # Child class for Smart Door
 class SmartDoor(SmartDevice):
+    __slots__ = ("open",)
     def __init__(self, name):
         super().__init__(name, "Door")
         self.open = False
@@ -444,10 +947,10 @@ class SmartDoor(SmartDevice):
     @is_on_check
     def open_door(self):
         self.open = True
-        print(f"{self.name} is now OPEN.")
+        say(f"{self.name} is now OPEN.")
 
     @is_on_check
     def close_door(self):
         self.open = False
-        print(f"{self.name} is now CLOSED.")
+        say(f"{self.name} is now CLOSED.")
 
@@ -0,0 +1,514 @@
+from array import array
+from collections import deque
+import gc
+from itertools import repeat
+import json
+import math
+import struct
+import sys
+import weakref
+from colorama import Fore, Style
+import Events
+import Network
+import SmartDevice
+import User
+
+# Snapshot files start with MAGIC and the format version, followed by sections.
+# Each section is a one byte tag, a 4 byte length and its payload, so a file
+# is written and read one section at a time. Strings are interned in a table
+# that grows with STRINGS sections, and everything else refers to them by
+# index. Numbers are packed in fixed-width columns, one column per field.
+MAGIC = b"SDSNAP"
+FORMAT_VERSION = 2
+
+STRINGS = b"S"
+COUNTERS = b"M"
+CLASS = b"C"
+USERS = b"U"
+NETWORK = b"N"
+OPERATIONS = b"O"
+END = b"E"
+
+NONE = 0xFFFFFFFF
+
+# Attributes every device has their own column for; anything a subclass adds is described by its CLASS section
+DEVICE_FIELDS = ("name", "device_type", "is_on", "energy_consumption", "serial_number", "device_id", "network", "home")
+
+# Fields added to a device class after snapshots were written, with the value older snapshots get,
+# e.g. FIELD_DEFAULTS["SmartLight"] = {"dimmable": False}
+FIELD_DEFAULTS = {}
+# Fields renamed in a device class, old name to new name, e.g. FIELD_RENAMES["SmartSpeaker"] = {"song_playing": "track"}
+FIELD_RENAMES = {}
+
+# Column types of the device fields
+BOOL, INT, FLOAT, STRING, JSON = b"b", b"q", b"d", b"s", b"j"
+
+_header = struct.Struct("<6sH")
+_section = struct.Struct("<cI")
+_count = struct.Struct("<I")
+
+
+def _column(typecode, values):
+    column = array(typecode, values)
+    if sys.byteorder == "big":
+        column.byteswap()
+    return _count.pack(len(column)) + column.tobytes()
+
+def _read_column(typecode, payload, offset):
+    (length,) = _count.unpack_from(payload, offset)
+    offset += _count.size
+    column = array(typecode)
+    end = offset + length * column.itemsize
+    column.frombytes(payload[offset:end])
+    if sys.byteorder == "big":
+        column.byteswap()
+    return column, end
+
+def _field_type(values):
+    if all(type(value) is bool for value in values):
+        return BOOL
+    if all(type(value) is int and -2 ** 63 <= value < 2 ** 63 for value in values):
+        return INT
+    if all(type(value) is float for value in values):
+        return FLOAT
+    if all(type(value) is str for value in values):
+        return STRING
+    return JSON
+
+
+# This class writes a snapshot to a binary file object one section at a time
+class SnapshotWriter():
+    def __init__(self, file):
+        self.file = file
+        self._strings = {}
+        self._pending = []
+        self._classes = {}
+        self.file.write(_header.pack(MAGIC, FORMAT_VERSION))
+
+    # Magic Methods
+    def __str__(self):
+        return f"SnapshotWriter: {len(self._strings)} strings, {len(self._classes)} device classes"
+    def __repr__(self):
+        return f"SnapshotWriter(file={self.file!r})"
+
+    # Index of a string in the string table, adding it if it is new
+    def intern(self, value):
+        if value is None:
+            return NONE
+        index = self._strings.get(value)
+        if index is None:
+            index = self._strings[value] = len(self._strings)
+            self._pending.append(value)
+        return index
+
+    def intern_json(self, value):
+        return self.intern(json.dumps(value, separators=(",", ":")))
+
+    def _write(self, tag, payload):
+        # Strings used by a section always go out before it
+        if self._pending:
+            pending, self._pending = self._pending, []
+            if any("\0" in value for value in pending):
+                encoded = [value.encode("utf-8") for value in pending]
+                body = b"\1" + _column("I", [len(value) for value in encoded]) + b"".join(encoded)
+            else:
+                # Usually the strings are joined with NUL bytes, which is much faster to split
+                body = b"\0" + _count.pack(len(pending)) + "\0".join(pending).encode("utf-8")
+            self.file.write(_section.pack(STRINGS, len(body)) + body)
+        self.file.write(_section.pack(tag, len(payload)) + payload)
+
+    # Code of a device class with a given set of fields, writing its CLASS section the first time
+    def _class_code(self, cls, fields, types):
+        key = (cls.__name__, fields, types)
+        code = self._classes.get(key)
+        if code is None:
+            code = self._classes[key] = len(self._classes)
+            payload = struct.pack("<HIH", code, self.intern(cls.__name__), len(fields))
+            payload += b"".join(struct.pack("<Ic", self.intern(field), kind) for field, kind in zip(fields, types))
+            self._write(CLASS, payload)
+        return code
+
+    # The id counters, with the next device id and the free device ids since format 2
+    def write_counters(self):
+        next_id, free = SmartDevice.SmartDevice.get_device_ids().get_state()
+        self._write(COUNTERS, struct.pack("<qqqq", next_id, User.User.get_user_count(),
+                                          User.SmartHome.get_home_count(), SmartDevice.ScheduledOperation._operation_count) + _column("I", free))
+
+    def write_users(self, users):
+        payload = _column("q", [user.user_id for user in users])
+        payload += _column("I", [self.intern(user.username) for user in users])
+        payload += _column("I", [self.intern(user.network.ip_address) if user.network is not None else NONE for user in users])
+        self._write(USERS, payload)
+
+    # Write a network with all of its homes and devices
+    def write_network(self, network):
+        homes = network.smart_homes
+        devices = [device for home in homes for device in home.smart_devices]
+        # Group the devices by class and extra fields, so every group gets its own columns
+        groups = {}
+        for device in devices:
+            state = device.__getstate__()
+            fields = tuple(key for key in state if key not in DEVICE_FIELDS)
+            groups.setdefault((type(device), fields), []).append((device, state))
+        codes = {}
+        extra = b""
+        for (cls, fields), members in groups.items():
+            columns = [[state[field] for _, state in members] for field in fields]
+            types = tuple(_field_type(values) for values in columns)
+            code = self._class_code(cls, fields, types)
+            for device, _ in members:
+                codes[id(device)] = code
+            extra += struct.pack("<HI", code, len(members))
+            for kind, values in zip(types, columns):
+                if kind == BOOL:
+                    extra += _column("B", values)
+                elif kind == INT:
+                    extra += _column("q", values)
+                elif kind == FLOAT:
+                    extra += _column("d", values)
+                elif kind == STRING:
+                    extra += _column("I", [self.intern(value) for value in values])
+                else:
+                    extra += _column("I", [self.intern_json(value) for value in values])
+        payload = struct.pack("<IH", self.intern(network.ip_address), len(groups))
+        payload += _column("q", [home.home_id for home in homes])
+        payload += _column("I", [self.intern(home.name) for home in homes])
+        payload += _column("I", [len(home.smart_devices) for home in homes])
+        payload += _column("H", [codes[id(device)] for device in devices])
+        payload += _column("I", [self.intern(device.serial_number) for device in devices])
+        payload += _column("I", [self.intern(device.name) for device in devices])
+        payload += _column("I", [self.intern(device.device_type) for device in devices])
+        payload += _column("B", [bool(device.is_on) for device in devices])
+        payload += _column("d", [device.energy_consumption for device in devices])
+        payload += _column("B", [device.network is not None for device in devices])
+        self._write(NETWORK, payload + extra)
+
+    def write_operations(self, operations):
+        def optional_float(value):
+            return float("nan") if value is None else value
+        payload = _column("q", [operation.operation_id for operation in operations])
+        payload += _column("I", [self.intern(operation.device_serial_number) for operation in operations])
+        payload += _column("I", [self.intern(operation.operation) for operation in operations])
+        payload += _column("I", [self.intern_json(operation.target_time) for operation in operations])
+        payload += _column("B", [bool(operation.recurring) for operation in operations])
+        payload += _column("I", [self.intern_json(list(operation.args)) for operation in operations])
+        payload += _column("I", [self.intern_json(operation.kwargs) for operation in operations])
+        payload += _column("I", [self.intern(getattr(operation, "misfire_policy", None)) for operation in operations])
+        payload += _column("d", [optional_float(getattr(operation, "next_fire_at", None)) for operation in operations])
+        payload += _column("d", [optional_float(getattr(operation, "anchor_at", None)) for operation in operations])
+        self._write(OPERATIONS, payload)
+
+    def close(self):
+        self._write(END, b"")
+
+
+# This class reads a snapshot from a binary file object one section at a time
+class SnapshotReader():
+    def __init__(self, file):
+        self.file = file
+        self.strings = []
+        self.classes = {}
+        header = self._read(_header.size)
+        if len(header) < _header.size or header[:len(MAGIC)] != MAGIC:
+            raise ValueError("Not a snapshot file.")
+        _, self.version = _header.unpack(header)
+        if self.version > FORMAT_VERSION:
+            raise ValueError(f"Snapshot format {self.version} is newer than this program supports ({FORMAT_VERSION}).")
+
+    # Magic Methods
+    def __str__(self):
+        return f"SnapshotReader: format {self.version}, {len(self.strings)} strings"
+    def __repr__(self):
+        return f"SnapshotReader(file={self.file!r}, version={self.version})"
+
+    # Read size bytes, or fewer at the end of the file. Decompressing streams can return less per read.
+    def _read(self, size):
+        data = self.file.read(size)
+        if len(data) == size or not data:
+            return data
+        chunks = [data]
+        size -= len(data)
+        while size:
+            data = self.file.read(size)
+            if not data:
+                break
+            chunks.append(data)
+            size -= len(data)
+        return b"".join(chunks)
+
+    # Yield (tag, payload) for every section except the string table and class definitions
+    def __iter__(self):
+        while True:
+            header = self._read(_section.size)
+            if len(header) < _section.size:
+                raise ValueError("Snapshot file is truncated.")
+            tag, length = _section.unpack(header)
+            payload = self._read(length)
+            if len(payload) < length:
+                raise ValueError("Snapshot file is truncated.")
+            if tag == END:
+                return
+            if tag == STRINGS:
+                self._read_strings(payload)
+            elif tag == CLASS:
+                self._read_class(payload)
+            else:
+                yield tag, payload
+
+    def _read_strings(self, payload):
+        if payload[:1] == b"\0":
+            (count,) = _count.unpack_from(payload, 1)
+            strings = payload[1 + _count.size:].decode("utf-8").split("\0") if count else []
+            if len(strings) != count:
+                raise ValueError("Snapshot string table is damaged.")
+            self.strings.extend(strings)
+            return
+        lengths, offset = _read_column("I", payload, 1)
+        data = memoryview(payload)
+        for length in lengths:
+            self.strings.append(str(data[offset:offset + length], "utf-8"))
+            offset += length
+
+    def _read_class(self, payload):
+        code, name, count = struct.unpack_from("<HIH", payload, 0)
+        offset = struct.calcsize("<HIH")
+        name = self.strings[name]
+        renames = FIELD_RENAMES.get(name, {})
+        fields = []
+        for _ in range(count):
+            field, kind = struct.unpack_from("<Ic", payload, offset)
+            offset += struct.calcsize("<Ic")
+            field = self.strings[field]
+            fields.append((renames.get(field, field), kind))
+        # Only SmartDevice classes can be created from a snapshot
+        cls = getattr(SmartDevice, name, SmartDevice.SmartDevice)
+        if not (isinstance(cls, type) and issubclass(cls, SmartDevice.SmartDevice)):
+            cls = SmartDevice.SmartDevice
+        present = {field for field, _ in fields}
+        defaults = {field: value for field, value in FIELD_DEFAULTS.get(name, {}).items() if field not in present}
+        # Fields the class no longer has are read but not set
+        if cls.__dictoffset__:
+            targets = [field for field, _ in fields]
+        else:
+            slots = set(Events.slot_names(cls)) | set(Events.weak_names(cls))
+            targets = [field if field in slots else None for field, _ in fields]
+            defaults = {field: value for field, value in defaults.items() if field in slots}
+        self.classes[code] = (cls, fields, defaults, targets)
+
+    def string(self, index):
+        return None if index == NONE else self.strings[index]
+
+    # The counters and the free device ids, or None for the ids in a format 1 file
+    def read_counters(self, payload):
+        counters = struct.unpack_from("<qqqq", payload, 0)
+        if self.version < 2:
+            return counters + (None,)
+        free, _ = _read_column("I", payload, struct.calcsize("<qqqq"))
+        return counters + (list(free),)
+
+    def read_users(self, payload, networks):
+        user_ids, offset = _read_column("q", payload, 0)
+        names, offset = _read_column("I", payload, offset)
+        network_ips, offset = _read_column("I", payload, offset)
+        strings = self.strings
+        users = []
+        for user_id, name, network_ip in zip(user_ids, names, network_ips):
+            user = User.User.__new__(User.User)
+            user.__setstate__(dict(username=strings[name], network=networks.get(self.string(network_ip)), user_id=user_id))
+            users.append(user)
+        return users
+
+    # Build a network with its homes and devices
+    def read_network(self, payload):
+        strings = self.strings
+        ip_address, group_count = struct.unpack_from("<IH", payload, 0)
+        offset = struct.calcsize("<IH")
+        home_ids, offset = _read_column("q", payload, offset)
+        home_names, offset = _read_column("I", payload, offset)
+        home_sizes, offset = _read_column("I", payload, offset)
+        codes, offset = _read_column("H", payload, offset)
+        serials, offset = _read_column("I", payload, offset)
+        names, offset = _read_column("I", payload, offset)
+        types, offset = _read_column("I", payload, offset)
+        is_on, offset = _read_column("B", payload, offset)
+        energy, offset = _read_column("d", payload, offset)
+        connected, offset = _read_column("B", payload, offset)
+        # The extra fields of each class, in the order its devices appear
+        extra = {}
+        for _ in range(group_count):
+            code, size = struct.unpack_from("<HI", payload, offset)
+            offset += struct.calcsize("<HI")
+            cls, fields, defaults, targets = self.classes[code]
+            columns = []
+            for field, kind in fields:
+                if kind == BOOL:
+                    column, offset = _read_column("B", payload, offset)
+                    column = [bool(value) for value in column]
+                elif kind == INT:
+                    column, offset = _read_column("q", payload, offset)
+                elif kind == FLOAT:
+                    column, offset = _read_column("d", payload, offset)
+                elif kind == STRING:
+                    column, offset = _read_column("I", payload, offset)
+                    column = [strings[value] for value in column]
+                else:
+                    column, offset = _read_column("I", payload, offset)
+                    column = [json.loads(strings[value]) for value in column]
+                columns.append(column)
+            extra[code] = zip(*columns) if columns else None
+
+        network = Network.Network.__new__(Network.Network)
+        network.__setstate__(dict(ip_address=strings[ip_address], smart_homes=[]))
+        count = len(codes)
+        serials = [strings[value] for value in serials]
+        classes = self.classes
+        # The devices are built a column at a time. map() calls object.__setattr__ from C for
+        # every device, which skips the events and costs far less than a Python loop over the devices.
+        set_attribute = object.__setattr__
+        devices = list(map(object.__new__, [classes[code][0] for code in codes]))
+        def set_column(field, values):
+            deque(map(set_attribute, devices, repeat(field, count), values), maxlen=0)
+        set_column("name", [strings[value] for value in names])
+        set_column("device_type", [None if value == NONE else strings[value] for value in types])
+        set_column("is_on", map(bool, is_on))
+        set_column("energy_consumption", energy)
+        set_column("serial_number", serials)
+        # SmartDevice.id_from_serial, inlined for every device
+        device_ids = [int(serial[4:]) if serial.startswith("DEV-") and serial[4:].isdigit() else None for serial in serials]
+        set_column("device_id", device_ids)
+        SmartDevice.SmartDevice.get_device_ids().adopt_all(devices, device_ids)
+        # One weak reference to the network and one to each home, shared by their devices
+        network_ref = weakref.ref(network)
+        set_column("_network", [network_ref if value else None for value in connected])
+        homes = []
+        home_refs = []
+        index = 0
+        for home_id, home_name, size in zip(home_ids, home_names, home_sizes):
+            home = User.SmartHome.__new__(User.SmartHome)
+            home.__setstate__(dict(smart_devices=devices[index:index + size], network=network, name=strings[home_name], home_id=home_id))
+            homes.append(home)
+            home_refs.extend(repeat(weakref.ref(home), size))
+            index += size
+        set_column("_home", home_refs)
+        # The extra fields of each class, set on the devices of that group
+        for code, rows in extra.items():
+            cls, fields, defaults, targets = classes[code]
+            members = [device for device, device_code in zip(devices, codes) if device_code == code]
+            if rows is not None:
+                for field, values in zip(targets, zip(*rows)):
+                    if field is not None:
+                        deque(map(set_attribute, members, repeat(field, len(members)), values), maxlen=0)
+            for field, value in defaults.items():
+                deque(map(set_attribute, members, repeat(field, len(members)), repeat(value, len(members))), maxlen=0)
+        network.smart_homes.extend(homes)
+        return network
+
+    def read_operations(self, payload):
+        strings = self.strings
+        ids, offset = _read_column("q", payload, 0)
+        serials, offset = _read_column("I", payload, offset)
+        names, offset = _read_column("I", payload, offset)
+        targets, offset = _read_column("I", payload, offset)
+        recurring, offset = _read_column("B", payload, offset)
+        args, offset = _read_column("I", payload, offset)
+        kwargs, offset = _read_column("I", payload, offset)
+        policies, offset = _read_column("I", payload, offset)
+        next_fire, offset = _read_column("d", payload, offset)
+        anchors, offset = _read_column("d", payload, offset)
+        operations = []
+        for i in range(len(ids)):
+            operation = SmartDevice.ScheduledOperation.__new__(SmartDevice.ScheduledOperation)
+            operation.__setstate__(dict(operation_id=ids[i], recurring=bool(recurring[i]), operation=strings[names[i]],
+                                        target_time=json.loads(strings[targets[i]]), device_serial_number=strings[serials[i]],
+                                        args=tuple(json.loads(strings[args[i]])), kwargs=json.loads(strings[kwargs[i]]),
+                                        handle=None, misfire_policy=self.string(policies[i]),
+                                        next_fire_at=None if math.isnan(next_fire[i]) else next_fire[i],
+                                        anchor_at=None if math.isnan(anchors[i]) else anchors[i]))
+            operations.append(operation)
+        return operations
+
+
+# Write the users, networks and scheduled operations of a GUI to a binary file object
+def dump(gui, file):
+    writer = SnapshotWriter(file)
+    writer.write_counters()
+    for network in gui.networks:
+        writer.write_network(network)
+    writer.write_users(gui.users)
+    writer.write_operations(list(SmartDevice.SmartDevice.get_scheduled_operations()))
+    writer.close()
+
+# Write one network and the scheduled operations of its devices, e.g. as a shard of a larger fleet
+def dump_network(network, operations, file):
+    writer = SnapshotWriter(file)
+    writer.write_network(network)
+    writer.write_operations(operations)
+    writer.close()
+
+def _to_bytes(write, *args):
+    chunks = []
+    class _Buffer():
+        write = chunks.append
+    write(*args, _Buffer())
+    return b"".join(chunks)
+
+def dumps(gui):
+    return _to_bytes(dump, gui)
+
+def dumps_network(network, operations):
+    return _to_bytes(dump_network, network, operations)
+
+# Load a snapshot into a GUI, ready for gui.load_scheduals()
+def load(file, gui):
+    # Nothing is garbage while the objects are built, so the collector would only slow this down
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        return _load(file, gui)
+    finally:
+        if collecting:
+            gc.enable()
+
+# Read a file written by dump_network, returning the network and its scheduled operations.
+# Unlike load() this leaves the garbage collector alone, so several can run on different threads.
+def load_network(file):
+    reader = SnapshotReader(file)
+    network, operations = None, []
+    for tag, payload in reader:
+        if tag == NETWORK:
+            network = reader.read_network(payload)
+        elif tag == OPERATIONS:
+            operations = reader.read_operations(payload)
+    if network is None:
+        raise ValueError("Snapshot file has no network.")
+    return network, operations
+
+def _load(file, gui):
+    reader = SnapshotReader(file)
+    networks = {}
+    device_ids = SmartDevice.SmartDevice.get_device_ids()
+    free_device_ids = []
+    for tag, payload in reader:
+        if tag == COUNTERS:
+            next_device_id, user_count, home_count, operation_count, free_device_ids = reader.read_counters(payload)
+            device_ids.restore(next_device_id, free_device_ids)
+            User.User._Users = user_count
+            User.SmartHome._home_count = home_count
+            SmartDevice.ScheduledOperation._operation_count = operation_count
+        elif tag == NETWORK:
+            network = reader.read_network(payload)
+            networks[network.ip_address] = network
+            gui.networks.append(network)
+        elif tag == USERS:
+            gui.users.extend(reader.read_users(payload, networks))
+        elif tag == OPERATIONS:
+            gui.scheduled_operations = reader.read_operations(payload)
+    if free_device_ids is None:
+        # Format 1 files have no free ids, but every device is loaded now, so the gaps are free
+        device_ids.restore(0)
+    gui.device_ids = device_ids.get_state()
+    gui.device_count = SmartDevice.SmartDevice.get_device_count()
+    gui.user_count = User.User.get_user_count()
+    gui.home_count = User.SmartHome.get_home_count()
+    print(Fore.GREEN + f"✓ Loaded {len(gui.networks)} networks and {len(gui.users)} users from snapshot format {reader.version}" + Style.RESET_ALL)
+    return gui
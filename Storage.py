@@ -0,0 +1,581 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import gc
+import json
+import os
+import sqlite3
+import threading
+from urllib.parse import quote
+from colorama import Fore, Style
+import Autosave
+import DeviceTable
+import Events
+import Network
+import SmartDevice
+import Snapshot
+import User
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER
+);
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    username TEXT NOT NULL UNIQUE,
+    network_ip TEXT
+);
+CREATE TABLE IF NOT EXISTS networks (
+    ip_address TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS homes (
+    home_id INTEGER PRIMARY KEY,
+    network_ip TEXT NOT NULL,
+    name TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS homes_by_network ON homes (network_ip);
+CREATE TABLE IF NOT EXISTS devices (
+    serial_number TEXT PRIMARY KEY,
+    home_id INTEGER NOT NULL,
+    class TEXT NOT NULL,
+    name TEXT NOT NULL,
+    device_type TEXT,
+    is_on INTEGER NOT NULL,
+    energy_consumption REAL NOT NULL,
+    network_ip TEXT,
+    attrs TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS devices_by_home ON devices (home_id);
+CREATE TABLE IF NOT EXISTS scheduled_operations (
+    operation_id INTEGER PRIMARY KEY,
+    device_serial_number TEXT NOT NULL,
+    operation TEXT NOT NULL,
+    target_time TEXT NOT NULL,
+    recurring INTEGER NOT NULL,
+    args TEXT NOT NULL,
+    kwargs TEXT NOT NULL,
+    misfire_policy TEXT,
+    next_fire_at REAL,
+    anchor_at REAL
+);
+CREATE INDEX IF NOT EXISTS operations_by_device ON scheduled_operations (device_serial_number);
+CREATE TABLE IF NOT EXISTS free_device_ids (
+    device_id INTEGER PRIMARY KEY
+);
+"""
+
+# Attributes every device has their own column for; anything a subclass adds goes in attrs
+DEVICE_FIELDS = ("name", "device_type", "is_on", "energy_consumption", "serial_number", "device_id", "network", "home")
+
+UPSERTS = {
+    "users": "INSERT INTO users VALUES (?, ?, ?) ON CONFLICT (user_id) DO UPDATE SET username = excluded.username, network_ip = excluded.network_ip",
+    "networks": "INSERT INTO networks VALUES (?) ON CONFLICT (ip_address) DO NOTHING",
+    "homes": "INSERT INTO homes VALUES (?, ?, ?) ON CONFLICT (home_id) DO UPDATE SET network_ip = excluded.network_ip, name = excluded.name",
+    "devices": "INSERT INTO devices VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (serial_number) DO UPDATE SET "
+               "home_id = excluded.home_id, class = excluded.class, name = excluded.name, device_type = excluded.device_type, "
+               "is_on = excluded.is_on, energy_consumption = excluded.energy_consumption, network_ip = excluded.network_ip, attrs = excluded.attrs",
+    "scheduled_operations": "INSERT INTO scheduled_operations VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (operation_id) DO UPDATE SET "
+                            "device_serial_number = excluded.device_serial_number, operation = excluded.operation, target_time = excluded.target_time, "
+                            "recurring = excluded.recurring, args = excluded.args, kwargs = excluded.kwargs, misfire_policy = excluded.misfire_policy, "
+                            "next_fire_at = excluded.next_fire_at, anchor_at = excluded.anchor_at",
+}
+
+# This class keeps users, networks, homes, devices and scheduled operations in
+# indexed SQLite tables. It listens for changes to the model and save() only
+# writes the rows that changed since the last save, in one transaction.
+# Networks can be loaded one at a time with load_network(), or on first use
+# with load_lazy().
+class SQLiteStore():
+    def __init__(self, path="data.db"):
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+        self._lock = threading.RLock()
+        self._dirty = {}
+        self._deleted = self._empty_deletes()
+        self._gui = None
+        self._loaded = OrderedDict()
+        self.max_loaded = None
+        self._restore_options = (None, None)
+        Events.subscribe(self._on_event)
+
+    # Magic Methods
+    def __str__(self):
+        return f"SQLiteStore: {self.path}"
+    def __repr__(self):
+        return f"SQLiteStore(path={self.path}, dirty={len(self._dirty)})"
+
+    def close(self):
+        Events.unsubscribe(self._on_event)
+        with self._lock:
+            self.connection.close()
+
+    @staticmethod
+    def _empty_deletes():
+        return {"homes": set(), "devices": set(), "scheduled_operations": set()}
+
+    # Check whether anything changed since the last save
+    @property
+    def has_changes(self):
+        return bool(self._dirty) or any(self._deleted.values())
+
+    def is_empty(self):
+        with self._lock:
+            return self.connection.execute("SELECT COUNT(*) FROM networks").fetchone()[0] == 0
+
+    # Change Tracking
+
+    # Loading only uses __setstate__, which emits no events, so every event is a change to save
+    def _on_event(self, obj, event, data):
+        with self._lock:
+            if event == "remove_smart_home":
+                self._forget_home(data["home"])
+            elif event == "remove_smart_device":
+                self._forget_device(data["device"])
+            elif event == "remove_scheduled_operation":
+                self._dirty.pop(id(obj), None)
+                self._deleted["scheduled_operations"].add(obj.operation_id)
+            elif event == "add_smart_home":
+                self._mark(obj)
+                self._mark_home(data["home"])
+            elif event == "add_smart_device":
+                self._mark(obj)
+                self._mark(data["device"])
+                self._deleted["devices"].discard(data["device"].serial_number)
+            elif event == "dispose" and isinstance(obj, Network.Network):
+                # Its homes were removed already, and it is no longer one to evict
+                if self._loaded.get(obj.ip_address) is obj:
+                    del self._loaded[obj.ip_address]
+                self._mark(obj)
+            else:
+                self._mark(obj)
+
+    def _mark(self, obj):
+        self._dirty[id(obj)] = obj
+
+    def _mark_home(self, home):
+        self._mark(home)
+        self._deleted["homes"].discard(home.home_id)
+        for device in home.smart_devices:
+            self._mark(device)
+            self._deleted["devices"].discard(device.serial_number)
+
+    def _forget_home(self, home):
+        self._dirty.pop(id(home), None)
+        self._deleted["homes"].add(home.home_id)
+        for device in home.smart_devices:
+            self._forget_device(device)
+
+    def _forget_device(self, device):
+        self._dirty.pop(id(device), None)
+        self._deleted["devices"].add(device.serial_number)
+
+    # Mark the whole graph as changed, e.g. to move a pickled GUI into the database
+    def mark_all(self, gui):
+        with self._lock:
+            for user in gui.users:
+                self._mark(user)
+            for network in gui.networks:
+                self._mark(network)
+                for home in network.smart_homes:
+                    self._mark_home(home)
+            for operation in SmartDevice.SmartDevice.get_scheduled_operations():
+                self._mark(operation)
+
+    # Saving
+    def save(self, gui=None):
+        with self._lock:
+            dirty, self._dirty = list(self._dirty.values()), {}
+            deleted, self._deleted = self._deleted, self._empty_deletes()
+            rows = {table: [] for table in UPSERTS}
+            for obj in dirty:
+                table, row = self._to_row(obj)
+                if row is not None:
+                    rows[table].append(row)
+            with self.connection:
+                for table, values in rows.items():
+                    if values:
+                        self.connection.executemany(UPSERTS[table], values)
+                if deleted["homes"]:
+                    self.connection.executemany("DELETE FROM homes WHERE home_id = ?", [(key,) for key in deleted["homes"]])
+                if deleted["devices"]:
+                    keys = [(key,) for key in deleted["devices"]]
+                    self.connection.executemany("DELETE FROM devices WHERE serial_number = ?", keys)
+                    self.connection.executemany("DELETE FROM scheduled_operations WHERE device_serial_number = ?", keys)
+                if deleted["scheduled_operations"]:
+                    self.connection.executemany("DELETE FROM scheduled_operations WHERE operation_id = ?", [(key,) for key in deleted["scheduled_operations"]])
+                if gui is not None:
+                    self.connection.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)", self._counters())
+                    self.connection.execute("DELETE FROM free_device_ids")
+                    _, free = SmartDevice.SmartDevice.get_device_ids().get_state()
+                    self.connection.executemany("INSERT INTO free_device_ids VALUES (?)", [(device_id,) for device_id in free])
+            return sum(len(values) for values in rows.values()) + sum(len(keys) for keys in deleted.values())
+
+    def save_all(self, gui):
+        self.mark_all(gui)
+        return self.save(gui)
+
+    @staticmethod
+    def _counters():
+        return [
+            ("device_count", SmartDevice.SmartDevice.get_device_count()),
+            ("next_device_id", SmartDevice.SmartDevice.get_device_ids().next_id),
+            ("user_count", User.User.get_user_count()),
+            ("home_count", User.SmartHome.get_home_count()),
+            ("operation_count", SmartDevice.ScheduledOperation._operation_count),
+        ]
+
+    # Turn a model object into the table and row it is saved as, or None if it is not part of the graph
+    def _to_row(self, obj):
+        if isinstance(obj, SmartDevice.SmartDevice):
+            home = getattr(obj, "home", None)
+            if home is None:
+                return "devices", None
+            attrs = {key: value for key, value in obj.__getstate__().items() if key not in DEVICE_FIELDS}
+            network_ip = obj.network.ip_address if obj.network is not None else None
+            return "devices", (obj.serial_number, home.home_id, type(obj).__name__, obj.name, obj.device_type,
+                               int(obj.is_on), obj.energy_consumption, network_ip, json.dumps(attrs))
+        if isinstance(obj, SmartDevice.ScheduledOperation):
+            if obj not in SmartDevice.SmartDevice.get_scheduled_operations():
+                return "scheduled_operations", None
+            return "scheduled_operations", (obj.operation_id, obj.device_serial_number, obj.operation, json.dumps(obj.target_time),
+                                            int(bool(obj.recurring)), json.dumps(obj.args), json.dumps(obj.kwargs),
+                                            getattr(obj, "misfire_policy", None), getattr(obj, "next_fire_at", None), getattr(obj, "anchor_at", None))
+        if isinstance(obj, User.SmartHome):
+            if obj.network is None or obj.network.get_home(obj.home_id) is not obj:
+                return "homes", None
+            return "homes", (obj.home_id, obj.network.ip_address, obj.name)
+        if isinstance(obj, User.User):
+            return "users", (obj.user_id, obj.username, obj.network.ip_address if obj.network is not None else None)
+        if isinstance(obj, Network.Network):
+            return "networks", (obj.ip_address,)
+        return None, None
+
+    # Loading
+
+    # Load users, networks and counters, but none of the homes or devices
+    def load_headers(self, gui):
+        with self._lock:
+            counters = dict(self.connection.execute("SELECT key, value FROM meta"))
+            self._restore_device_ids(counters)
+            User.User._Users = counters.get("user_count", 0)
+            User.SmartHome._home_count = counters.get("home_count", 0)
+            SmartDevice.ScheduledOperation._operation_count = counters.get("operation_count", 0)
+            networks = {}
+            for (ip_address,) in self.connection.execute("SELECT ip_address FROM networks ORDER BY rowid"):
+                network = Network.Network.__new__(Network.Network)
+                network.__setstate__(dict(ip_address=ip_address, smart_homes=[]))
+                gui.networks.append(network)
+                networks[ip_address] = network
+            for user_id, username, network_ip in self.connection.execute("SELECT user_id, username, network_ip FROM users ORDER BY rowid"):
+                user = User.User.__new__(User.User)
+                user.__setstate__(dict(username=username, network=networks.get(network_ip), user_id=user_id))
+                gui.users.append(user)
+
+    # Put back the next device id and the free ids, which the devices take their ids from as they are loaded
+    def _restore_device_ids(self, counters):
+        if "next_device_id" in counters:
+            free = [device_id for (device_id,) in self.connection.execute("SELECT device_id FROM free_device_ids")]
+            SmartDevice.SmartDevice.get_device_ids().restore(counters["next_device_id"], free)
+            return
+        # Saved before device ids were kept, so work them out from the serial numbers once
+        used = {SmartDevice.SmartDevice.id_from_serial(serial) for (serial,) in self.connection.execute("SELECT serial_number FROM devices")}
+        used.discard(None)
+        next_id = max(used) + 1 if used else 0
+        SmartDevice.SmartDevice.get_device_ids().restore(next_id, [device_id for device_id in range(next_id) if device_id not in used])
+
+    # Load the homes and devices of one network, returning the scheduled operations of its devices
+    def load_network(self, network):
+        with self._lock:
+            homes = {}
+            for home_id, name in self.connection.execute("SELECT home_id, name FROM homes WHERE network_ip = ? ORDER BY rowid", (network.ip_address,)):
+                home = User.SmartHome.__new__(User.SmartHome)
+                home.__setstate__(dict(smart_devices=[], network=network, name=name, home_id=home_id))
+                homes[home_id] = home
+            devices = self.connection.execute(
+                "SELECT devices.* FROM devices JOIN homes ON devices.home_id = homes.home_id "
+                "WHERE homes.network_ip = ? ORDER BY devices.rowid", (network.ip_address,))
+            for serial_number, home_id, class_name, name, device_type, is_on, energy_consumption, network_ip, attrs in devices:
+                device_class = getattr(SmartDevice, class_name, SmartDevice.SmartDevice)
+                if not (isinstance(device_class, type) and issubclass(device_class, SmartDevice.SmartDevice)):
+                    device_class = SmartDevice.SmartDevice
+                device = device_class.__new__(device_class)
+                device.__setstate__(dict(name=name, device_type=device_type, is_on=bool(is_on), energy_consumption=energy_consumption,
+                                         network=network if network_ip == network.ip_address else None,
+                                         home=homes[home_id], serial_number=serial_number))
+                device.__setstate__(json.loads(attrs))
+                homes[home_id].smart_devices.append(device)
+            # The homes only become visible once they are complete, for readers on other threads
+            object.__setattr__(network, "smart_homes", list(homes.values()))
+            operations = self.connection.execute(
+                "SELECT scheduled_operations.* FROM scheduled_operations "
+                "JOIN devices ON scheduled_operations.device_serial_number = devices.serial_number "
+                "JOIN homes ON devices.home_id = homes.home_id "
+                "WHERE homes.network_ip = ? ORDER BY scheduled_operations.operation_id", (network.ip_address,))
+            return [self._to_operation(row) for row in operations]
+
+    @staticmethod
+    def _to_operation(row):
+        operation_id, serial_number, operation_name, target_time, recurring, args, kwargs, misfire_policy, next_fire_at, anchor_at = row
+        operation = SmartDevice.ScheduledOperation.__new__(SmartDevice.ScheduledOperation)
+        operation.__setstate__(dict(operation_id=operation_id, recurring=bool(recurring), operation=operation_name,
+                                    target_time=json.loads(target_time), device_serial_number=serial_number,
+                                    args=tuple(json.loads(args)), kwargs=json.loads(kwargs), handle=None,
+                                    misfire_policy=misfire_policy, next_fire_at=next_fire_at, anchor_at=anchor_at))
+        return operation
+
+    # Load the whole graph into the GUI, ready for gui.load_scheduals()
+    def load(self, gui):
+        self.load_headers(gui)
+        operations = []
+        for network in gui.networks:
+            operations.extend(self.load_network(network))
+        gui.scheduled_operations = operations
+        print(Fore.GREEN + f"✓ Loaded {len(gui.networks)} networks and {len(gui.users)} users from {self.path}" + Style.RESET_ALL)
+        return gui
+
+    # Lazy Loading
+
+    # Load only users, networks and counters, so startup does not depend on the size of the fleet.
+    # The homes and devices of a network are loaded the first time its smart_homes are used, and at
+    # most max_loaded networks are kept in memory. Networks with scheduled operations are loaded on a
+    # background thread so their operations keep running.
+    def load_lazy(self, gui, max_loaded=None, misfire_policy=None, grace_seconds=None):
+        SmartDevice.SmartDevice.set_scheduled_operations([])
+        self.load_headers(gui)
+        self._gui = gui
+        self.max_loaded = max_loaded
+        self._restore_options = (misfire_policy, grace_seconds)
+        for network in gui.networks:
+            object.__delattr__(network, "smart_homes")
+            network._loader = self._load_on_demand
+        with self._lock:
+            scheduled = {ip_address for (ip_address,) in self.connection.execute(
+                "SELECT DISTINCT homes.network_ip FROM scheduled_operations "
+                "JOIN devices ON scheduled_operations.device_serial_number = devices.serial_number "
+                "JOIN homes ON devices.home_id = homes.home_id")}
+        pending = [network for network in gui.networks if network.ip_address in scheduled]
+        thread = threading.Thread(target=self._load_scheduled, args=(pending,), name="lazy-load", daemon=True)
+        thread.start()
+        print(Fore.GREEN + f"✓ Loaded {len(gui.networks)} networks and {len(gui.users)} users from {self.path}, homes are loaded when needed" + Style.RESET_ALL)
+        return thread
+
+    def _load_scheduled(self, networks):
+        for network in networks:
+            try:
+                network.smart_homes
+            except sqlite3.Error as e:
+                print(Fore.RED + f"✗ Could not load network {network.ip_address}: {e}" + Style.RESET_ALL)
+
+    # Called by a lazily loaded network the first time its homes are used
+    def _load_on_demand(self, network):
+        with self._lock:
+            if network.is_loaded:
+                # Another thread loaded it first
+                self.touch(network)
+                return
+            operations = self.load_network(network)
+            registry = SmartDevice.SmartDevice.get_scheduled_operations()
+            for operation in operations:
+                if registry.get(operation.operation_id) is None:
+                    registry.add(operation)
+            self._loaded[network.ip_address] = network
+            self._loaded.move_to_end(network.ip_address)
+        table = DeviceTable.current()
+        if table is not None:
+            table.add_network(network)
+        if operations:
+            devices = [device for home in network.smart_homes for device in home.smart_devices]
+            SmartDevice.SmartDevice.restore_scheduled_operations(devices, *self._restore_options)
+        self._evict_over_limit(keep=network)
+
+    # Mark a loaded network as the most recently used, so the least recently used one is evicted first
+    def touch(self, network):
+        with self._lock:
+            if self._loaded.get(network.ip_address) is network:
+                self._loaded.move_to_end(network.ip_address)
+
+    # A network stays in memory while it is connected or has scheduled operations to run
+    def _is_pinned(self, network):
+        if network is getattr(self._gui, "connected_network", None):
+            return True
+        registry = SmartDevice.SmartDevice.get_scheduled_operations()
+        return any(registry.for_device(device.serial_number) for home in network.smart_homes for device in home.smart_devices)
+
+    # Save and drop the homes and devices of a network. They are read back when they are used again.
+    def evict(self, network):
+        with self._lock:
+            if not network.is_loaded or getattr(network, "_loader", None) is None or self._is_pinned(network):
+                return False
+            self.save()
+            table = DeviceTable.current()
+            if table is not None:
+                table.remove_network(network)
+            object.__delattr__(network, "smart_homes")
+            network.reindex()
+            self._loaded.pop(network.ip_address, None)
+            return True
+
+    # Evict every network that is not in use, e.g. when memory runs low
+    def evict_idle(self):
+        return sum(self.evict(network) for network in list(self._loaded.values()))
+
+    def _evict_over_limit(self, keep=None):
+        if self.max_loaded is None:
+            return
+        with self._lock:
+            for network in list(self._loaded.values()):
+                if len(self._loaded) <= self.max_loaded:
+                    break
+                if network is not keep:
+                    self.evict(network)
+
+
+# This class keeps every network in its own snapshot file in a directory, next
+# to a small JSON index of the users, networks and counters. It follows the
+# model events, so save() only rewrites the networks that changed, and the
+# shards are written and read in parallel on a thread pool.
+class ShardedStore():
+    def __init__(self, directory="data", max_workers=4):
+        self.directory = directory
+        self.index_path = os.path.join(directory, "index.json")
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="shard")
+        self._lock = threading.RLock()
+        self._dirty = set()
+        self._index_dirty = False
+        self._serials = {}
+        os.makedirs(directory, exist_ok=True)
+        Events.subscribe(self._on_event)
+
+    # Magic Methods
+    def __str__(self):
+        return f"ShardedStore: {self.directory}"
+    def __repr__(self):
+        return f"ShardedStore(directory={self.directory}, dirty={sorted(self._dirty)})"
+
+    def close(self):
+        Events.unsubscribe(self._on_event)
+        self.executor.shutdown()
+
+    @property
+    def has_changes(self):
+        return bool(self._dirty) or self._index_dirty
+
+    def is_empty(self):
+        return not os.path.exists(self.index_path)
+
+    # File a network is saved in. IP addresses are quoted so IPv6 addresses make valid file names.
+    def shard_path(self, ip_address):
+        return os.path.join(self.directory, "network-" + quote(ip_address, safe="") + ".snap")
+
+    # Change Tracking
+    def _on_event(self, obj, event, data):
+        with self._lock:
+            if event == "add_smart_home":
+                self._track_home(data["home"])
+            elif event == "add_smart_device":
+                self._serials[data["device"].serial_number] = obj.network
+            if isinstance(obj, (User.User, Network.Network)) or event in ("add_user", "add_network"):
+                self._index_dirty = True
+            network = self._network_of(obj)
+            if network is not None:
+                self._dirty.add(network.ip_address)
+
+    def _network_of(self, obj):
+        if isinstance(obj, Network.Network):
+            return obj
+        if isinstance(obj, User.SmartHome):
+            return getattr(obj, "network", None)
+        if isinstance(obj, SmartDevice.SmartDevice):
+            home = getattr(obj, "home", None)
+            return home.network if home is not None else None
+        if isinstance(obj, SmartDevice.ScheduledOperation):
+            return self._serials.get(getattr(obj, "device_serial_number", None))
+        return None
+
+    def _track_home(self, home):
+        for device in home.smart_devices:
+            self._serials[device.serial_number] = home.network
+
+    def _track(self, network):
+        for home in network.smart_homes:
+            self._track_home(home)
+
+    # Mark every network as changed, e.g. to move a pickled GUI into shards
+    def mark_all(self, gui):
+        with self._lock:
+            for network in gui.networks:
+                self._track(network)
+                self._dirty.add(network.ip_address)
+            self._index_dirty = True
+
+    # Saving
+
+    # Write the networks that changed, in parallel, and the index. Returns the number of files written.
+    def save(self, gui):
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            index_dirty, self._index_dirty = self._index_dirty or bool(dirty), False
+        if not index_dirty:
+            return 0
+        registry = SmartDevice.SmartDevice.get_scheduled_operations()
+        networks = [network for network in gui.networks if network.ip_address in dirty]
+        def save_network(network):
+            operations = [operation for home in network.smart_homes for device in home.smart_devices
+                          for operation in registry.for_device(device.serial_number)]
+            Autosave.write_atomic(self.shard_path(network.ip_address), Snapshot.dumps_network(network, operations))
+        # Collect every result, so a failed shard is reported instead of silently skipped
+        list(self.executor.map(save_network, networks))
+        Autosave.write_atomic(self.index_path, json.dumps(self._index(gui), indent=1).encode("utf-8"))
+        return len(networks) + 1
+
+    def save_all(self, gui):
+        self.mark_all(gui)
+        return self.save(gui)
+
+    @staticmethod
+    def _index(gui):
+        return {
+            "format": 2,
+            "counters": dict(SQLiteStore._counters()),
+            "free_device_ids": SmartDevice.SmartDevice.get_device_ids().get_state()[1],
+            "networks": [network.ip_address for network in gui.networks],
+            "users": [[user.user_id, user.username, user.network.ip_address if user.network is not None else None] for user in gui.users],
+        }
+
+    # Loading
+
+    # Load the index and every network shard into the GUI, ready for gui.load_scheduals()
+    def load(self, gui):
+        with open(self.index_path, encoding="utf-8") as f:
+            index = json.load(f)
+        def load_network(ip_address):
+            with open(self.shard_path(ip_address), "rb") as f:
+                return Snapshot.load_network(f)
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            shards = list(self.executor.map(load_network, index["networks"]))
+        finally:
+            if collecting:
+                gc.enable()
+        counters = index["counters"]
+        # Every shard is loaded, so an index written before device ids were kept frees the gaps
+        SmartDevice.SmartDevice.get_device_ids().restore(counters.get("next_device_id", 0), index.get("free_device_ids"))
+        User.User._Users = counters.get("user_count", 0)
+        User.SmartHome._home_count = counters.get("home_count", 0)
+        SmartDevice.ScheduledOperation._operation_count = counters.get("operation_count", 0)
+        networks = {}
+        operations = []
+        for network, network_operations in shards:
+            networks[network.ip_address] = network
+            gui.networks.append(network)
+            operations.extend(network_operations)
+            self._track(network)
+        for user_id, username, network_ip in index["users"]:
+            user = User.User.__new__(User.User)
+            user.__setstate__(dict(username=username, network=networks.get(network_ip), user_id=user_id))
+            gui.users.append(user)
+        gui.scheduled_operations = operations
+        print(Fore.GREEN + f"✓ Loaded {len(gui.networks)} network shards and {len(gui.users)} users from {self.directory}" + Style.RESET_ALL)
+        return gui
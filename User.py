@@ -1,7 +1,9 @@
+import Events
 import Network
 
 # This code defines a User class that represents a user in a smart home system.
-class User:
+class User(Events.Observable):
+    __slots__ = ("username", "network", "user_id")
     _Users = 0
     def __init__(self, username):
         if username.lower() in ["example", "test", "admin"]:
@@ -16,8 +18,6 @@ class User:
         return f"User: {self.username}"
     def __repr__(self):
         return f"User(username={self.username})"
-    def __del__(self):
-        print(f"User {self.username} has been removed from the system")
 
     # Connect and Disconnect from Network
     def connect_to_network(self, network):
@@ -39,8 +39,12 @@ class User:
         return cls._Users
 
 # This code defines a SmartHome class that represents a smart home in a network.
-class SmartHome:
+class SmartHome(Events.Observable):
+    __slots__ = ("smart_devices", "_network", "name", "home_id", "_totals")
+    # The network owns its homes, a home only points back to it weakly
+    network = Events.WeakAttribute("_network")
     _home_count = 0
+    _transient = ("smart_devices",)
     def __init__(self, network, name):
         self.smart_devices = []
         self.network = network
@@ -56,42 +60,95 @@ class SmartHome:
         return f"SmartHome: {self.name}, Network: {self.network.ip_address}"
     def __repr__(self):
         return f"SmartHome(name={self.name}, network={self.network.ip_address}, smart_devices={self.smart_devices})"
-    def __del__(self):
-        print(f"⚠️ SmartHome '{self.name}' has been removed from the system")
-        print(f"  └─ Removing {len(self.smart_devices)} devices...")
-        for smart_device in self.smart_devices:
-            smart_device.__del__()
-        self.smart_devices.clear()
+
+    # The network index looks a home up by its name, so the home is indexed out
+    # before its name changes and back in afterwards
+    def __setattr__(self, name, value):
+        network = getattr(self, "network", None) if name == "name" else None
+        if network is None or getattr(self, "home_id", None) is None:
+            Events.Observable.__setattr__(self, name, value)
+            return
+        network.unindex_home_name(self)
+        Events.Observable.__setattr__(self, name, value)
+        network.index_home_name(self)
+
+    # Remove the home and all of its devices for good. A home dropped without this, e.g.
+    # when its network is evicted from memory, stays in the store.
+    def dispose(self, report=True):
+        network = self.network
+        if network is not None and network.get_home(self.home_id) is self:
+            network.remove_smart_home(self)
+        Events.emit(self, "dispose")
+        smart_devices = self.smart_devices
+        if report:
+            print(f"⚠️ SmartHome '{self.name}' has been removed from the system")
+            print(f"  └─ Removing {len(smart_devices)} devices...")
+        # The devices are let go all at once rather than removed one by one
+        self.smart_devices = []
+        self.reset_totals()
+        for smart_device in smart_devices:
+            object.__setattr__(smart_device, "home", None)
+            smart_device.dispose(report=False)
 
     # Add and Remove Smart Devices
     def add_smart_device(self, smart_device):
         self.smart_devices.append(smart_device)
+        smart_device.home = self
+        self.update_totals(smart_device, 1)
+        if self.network is not None:
+            self.network.index_device(smart_device)
+        Events.emit(self, "add_smart_device", device=smart_device)
         print(f"✓ Added device '{smart_device.name}' to '{self.name}'")
 
     def remove_smart_device(self, smart_device):
         self.smart_devices.remove(smart_device)
+        self.update_totals(smart_device, -1)
+        if self.network is not None:
+            self.network.unindex_device(smart_device)
+        smart_device.home = None
+        smart_device.cancel_scheduled_operations()
+        Events.emit(self, "remove_smart_device", device=smart_device)
         print(f"✓ Removed device '{smart_device.name}' from '{self.name}'")
 
+    # Running Totals
+
+    # Totals over the devices of the home, counted the first time they are needed and kept up to date after that
+    def get_totals(self):
+        totals = getattr(self, "_totals", None)
+        if totals is None or totals.source is not self.smart_devices:
+            totals = Network.EnergyTotals(self.smart_devices)
+            for smart_device in self.smart_devices:
+                totals.apply(smart_device, 1)
+            self._totals = totals
+        return totals
+
+    # Count a device in (sign=1) or out (sign=-1), here and in the network. SmartDevice
+    # counts itself out before is_on, energy_consumption or device_type change and back in after.
+    def update_totals(self, smart_device, sign):
+        totals = getattr(self, "_totals", None)
+        if totals is not None and totals.source is self.smart_devices:
+            totals.apply(smart_device, sign)
+        if self.network is not None:
+            self.network.update_totals(self, smart_device, sign)
+
+    # Count the devices again the next time the totals are used
+    def reset_totals(self):
+        self._totals = None
+
     # List Smart Devices
     def list_smart_devices(self):
         return [smart_device for smart_device in self.smart_devices]
 
     # Security Assessment
     def secure_home(self):
-        points = 0
-        secure_types = ["Lock", "Security Camera", "Doorbell", "Door"]
-        security_devices = []
-
-        for device in self.smart_devices:
-            if device.device_type in secure_types:
-                security_devices.append(device)
-                points += 1
-                if device.is_on:
-                    points += 1
+        totals = self.get_totals()
+        security_count = totals.secure_count
+        active_count = totals.secure_active
+        points = totals.security_points
 
         print(f"\n📊 Security Assessment for '{self.name}':")
-        print(f"  ├─ Security devices: {len(security_devices)}/{len(self.smart_devices)}")
-        print(f"  ├─ Active security devices: {sum(1 for d in security_devices if d.is_on)}/{len(security_devices)}")
+        print(f"  ├─ Security devices: {security_count}/{len(self.smart_devices)}")
+        print(f"  ├─ Active security devices: {active_count}/{security_count}")
         print(f"  └─ Security score: {points}/10")
 
         if points >= 6:
@@ -116,8 +173,9 @@ class SmartHome:
 
     # Get Energy Consumption
     def get_energy_consumption(self):
-        total_consumption = sum(device.energy_consumption for device in self.smart_devices if device.is_on)
-        active_devices = sum(1 for device in self.smart_devices if device.is_on)
+        totals = self.get_totals()
+        total_consumption = totals.active_energy
+        active_devices = totals.active_count
 
         print(f"\n⚡ Energy consumption for '{self.name}':")
         print(f"  ├─ Active devices: {active_devices}/{len(self.smart_devices)}")
@@ -3,6 +3,12 @@ import SmartDevice
 import time
 import Network
 import User
+import DeviceTable
+import Events
+import Storage
+import Journal
+import Autosave
+import Snapshot
 import pickle
 
 # This is the main GUI class that handles user interactions and displays menus
@@ -14,16 +20,129 @@ class GUI():
         self.connected_network = None
         self.scheduled_operations = []
         self.device_count = 0
+        self.device_ids = (0, [])
+        self._users_by_name = None
+        self._networks_by_ip = None
         self.user_count = 0
         self.home_count = 0
+        self.store = None
+        self.journal = None
+
+    # The database connection and the journal are not part of the saved state
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["store"] = None
+        state["journal"] = None
+        # The lookup indexes are rebuilt the first time they are needed
+        state["_users_by_name"] = None
+        state["_networks_by_ip"] = None
+        return state
+
+    # The id counters come back with the GUI, so nothing has to patch them after unpickling
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.restore_counters()
+
+    # The scheduled operations and the id counters, as they are saved with the GUI
+    @staticmethod
+    def saved_counters():
+        return {
+            "scheduled_operations": list(SmartDevice.SmartDevice.get_scheduled_operations()),
+            "device_count": SmartDevice.SmartDevice.get_device_count(),
+            "device_ids": SmartDevice.SmartDevice.get_device_ids().get_state(),
+            "user_count": User.User.get_user_count(),
+            "home_count": User.SmartHome.get_home_count(),
+        }
+
+    # Copy the scheduled operations and the id counters into the GUI before it is pickled
+    def prepare_save(self):
+        self.__dict__.update(self.saved_counters())
+
+    # Put the id counters back. The devices have already taken their own ids when they were unpickled.
+    def restore_counters(self):
+        device_ids = getattr(self, "device_ids", None)
+        if device_ids is not None:
+            SmartDevice.SmartDevice.get_device_ids().restore(*device_ids)
+        else:
+            # Saved before device ids were kept, every device is loaded so the gaps are free
+            SmartDevice.SmartDevice.get_device_ids().restore(0)
+        User.User._Users = self.user_count
+        User.SmartHome._home_count = self.home_count
+
+    # Pickle the GUI with its scheduled operations and counters. A copy carries them, so
+    # a background thread taking the snapshot never changes the GUI the menus are using.
+    def snapshot(self):
+        copy = GUI.__new__(GUI)
+        copy.__dict__.update(self.__dict__)
+        copy.__dict__.update(self.saved_counters())
+        return pickle.dumps(copy)
 
     # Add a user to the GUI
     def add_user(self, user):
         self.users.append(user)
+        self._index_append("_users_by_name", self.users, user.username, user)
+        Events.emit(user, "add_user")
 
     # Add a network to the GUI
     def add_network(self, network):
         self.networks.append(network)
+        self._index_append("_networks_by_ip", self.networks, network.ip_address, network)
+        Events.emit(network, "add_network")
+
+    # Lookups
+
+    # Users and networks are only ever added, and the loaders append them to the lists
+    # directly, so an index is current while it was built from the same list at the same length
+    def _index_is_current(self, name, source, length):
+        index = getattr(self, name, None)
+        return index is not None and index[0] is source and index[2] == length
+
+    # Add the item just appended to source to a current index, so it stays current
+    def _index_append(self, name, source, key, item):
+        if self._index_is_current(name, source, len(source) - 1):
+            _, index, length = getattr(self, name)
+            index[key] = item
+            setattr(self, name, (source, index, length + 1))
+
+    def _get_index(self, name, source, key):
+        if not self._index_is_current(name, source, len(source)):
+            setattr(self, name, (source, {key(item): item for item in source}, len(source)))
+        return getattr(self, name)[1]
+
+    def get_user(self, username):
+        return self._get_index("_users_by_name", self.users, lambda user: user.username).get(username)
+
+    def get_network(self, ip_address):
+        network = self._get_index("_networks_by_ip", self.networks, lambda network: network.ip_address).get(ip_address)
+        if network is not None:
+            self._touch(network)
+        return network
+
+    # Tell a store that loads networks on demand that a network is in use
+    def _touch(self, network):
+        touch = getattr(getattr(self, "store", None), "touch", None)
+        if touch is not None:
+            touch(network)
+
+    # Find a smart home of the connected network by its number in the list, or by its name
+    def find_home(self, choice):
+        choice = choice.strip()
+        smart_homes = self.connected_network.smart_homes
+        if choice.isdigit():
+            idx = int(choice) - 1
+            return smart_homes[idx] if 0 <= idx < len(smart_homes) else None
+        return self.connected_network.get_home_by_name(choice)
+
+    # Find a device of a smart home by its number in the list, its serial number or its name
+    def find_device(self, smart_home, choice):
+        choice = choice.strip()
+        if choice.isdigit():
+            idx = int(choice) - 1
+            return smart_home.smart_devices[idx] if 0 <= idx < len(smart_home.smart_devices) else None
+        device = self.connected_network.get_device(choice)
+        if device is not None and device.home is smart_home:
+            return device
+        return next((device for device in self.connected_network.get_devices_by_name(choice) if device.home is smart_home), None)
 
     # Set the currently logged-in user
     def set_logged_in_user(self, user):
@@ -32,6 +151,16 @@ class GUI():
     # Set the currently connected network
     def set_connected_network(self, network):
         self.connected_network = network
+        if network is not None:
+            self._touch(network)
+
+    # kWh of every home of a network as {home: kWh}. An installed device table gets every
+    # home of the fleet in one pass, otherwise each home reads its running totals.
+    def energy_by_home(self, network):
+        table = DeviceTable.current()
+        if table is not None:
+            return table.energy_by_home()
+        return {home: home.get_totals().active_energy for home in network.smart_homes}
 
     # Display functions
 
@@ -83,7 +212,7 @@ class GUI():
         # Create new User
         if choice == "1":
             username = self.prompt("Enter a username")
-            user = next((user for user in self.users if user.username == username), None)
+            user = self.get_user(username)
             if user:
                 self.display_error(f"Username '{username}' already exists")
                 return False
@@ -91,7 +220,7 @@ class GUI():
                 self.logged_in_user = User.User(username)
                 if self.connected_network is not None:
                     self.logged_in_user.connect_to_network(self.connected_network)
-                self.users.append(self.logged_in_user)
+                self.add_user(self.logged_in_user)
                 self.display_success(f"User '{username}' created successfully!")
                 return False
             except ValueError as e:
@@ -101,7 +230,7 @@ class GUI():
         # Log in existing User
         elif choice == "2":
             username = self.prompt("Enter your username")
-            user = next((user for user in self.users if user.username == username), None)
+            user = self.get_user(username)
             if user:
                 self.logged_in_user = user
                 if self.connected_network is not None:
@@ -169,17 +298,12 @@ class GUI():
             for i, home in enumerate(self.connected_network.smart_homes, 1):
                 print(f"  {Fore.YELLOW}[{i}]{Style.RESET_ALL} {home.name}")
 
-            smart_home_idx = self.prompt("Enter the number of the smart home")
-            try:
-                idx = int(smart_home_idx) - 1
-                if 0 <= idx < len(self.connected_network.smart_homes):
-                    smart_home = self.connected_network.smart_homes[idx]
-                    self.display_success(f"Selected smart home: {smart_home.name}")
-                    self.home_details(smart_home)
-                else:
-                    self.display_error("Invalid smart home number.")
-            except ValueError:
-                self.display_error("Please enter a valid number.")
+            smart_home = self.find_home(self.prompt("Enter the number or name of the smart home"))
+            if smart_home is not None:
+                self.display_success(f"Selected smart home: {smart_home.name}")
+                self.home_details(smart_home)
+            else:
+                self.display_error("Invalid smart home number or name.")
 
         # List smart homes
         elif choice == "3" and self.connected_network is not None:
@@ -280,15 +404,9 @@ class GUI():
             for i, home in enumerate(self.connected_network.smart_homes, 1):
                 print(f"  {Fore.YELLOW}[{i}]{Style.RESET_ALL} {home.name}")
 
-            try:
-                home_idx = int(self.prompt("Select a smart home by number")) - 1
-                if 0 <= home_idx < len(self.connected_network.smart_homes):
-                    smart_home = self.connected_network.smart_homes[home_idx]
-                else:
-                    self.display_error("Invalid smart home number.")
-                    return False
-            except ValueError:
-                self.display_error("Please enter a valid number.")
+            smart_home = self.find_home(self.prompt("Select a smart home by number or name"))
+            if smart_home is None:
+                self.display_error("Invalid smart home number or name.")
                 return False
 
             if not smart_home.smart_devices:
@@ -300,16 +418,12 @@ class GUI():
                 status = f"{Fore.GREEN}ON{Style.RESET_ALL}" if device.is_on else f"{Fore.RED}OFF{Style.RESET_ALL}"
                 print(f"  {Fore.YELLOW}[{i}]{Style.RESET_ALL} {device.name} ({device.device_type}) - {status}")
 
-            try:
-                device_idx = int(self.prompt("Select a device by number")) - 1
-                if 0 <= device_idx < len(smart_home.smart_devices):
-                    device = smart_home.smart_devices[device_idx]
-                    self.display_success(f"Selected device: {device.name}")
-                    self.device_details(device, smart_home)
-                else:
-                    self.display_error("Invalid device number.")
-            except ValueError:
-                self.display_error("Please enter a valid number.")
+            device = self.find_device(smart_home, self.prompt("Select a device by number, serial number or name"))
+            if device is not None:
+                self.display_success(f"Selected device: {device.name}")
+                self.device_details(device, smart_home)
+            else:
+                self.display_error("Invalid device number, serial number or name.")
 
         # Select Network
         elif choice == "7" and self.connected_network is not None:
@@ -340,7 +454,7 @@ class GUI():
                     network = self.networks[network_idx]
                     try:
                         self.logged_in_user.connect_to_network(network)
-                        self.connected_network = network
+                        self.set_connected_network(network)
                         self.display_success(f"Connected to network: {network.ip_address}")
                     except ValueError as e:
                         self.display_error(str(e))
@@ -420,21 +534,18 @@ class GUI():
 
             # View scheduled operations
             elif choice == "5":
-                operations = SmartDevice.SmartDevice.get_scheduled_operations()
+                operations = SmartDevice.SmartDevice.get_scheduled_operations().for_device(device.serial_number)
                 if operations:
                     self.display_info("Scheduled Operations:")
                     options = {}
-                    loop = 1
-                    for op in operations:
-                        if op.device_serial_number == device.serial_number:
-                            # Format the target_time string properly
-                            device_info = f"Device: {op.device_serial_number}"
-                            function_info = f"operation: {op.operation}"
-                            recurring = "Recurring" if op.recurring else "One-time"
-
-                            # Add to options dictionary
-                            options[str(loop)] = f"{op.target_time} - {device_info} - {function_info} ({recurring})"
-                            loop+=1
+                    for loop, op in enumerate(operations, 1):
+                        # Format the target_time string properly
+                        device_info = f"Device: {op.device_serial_number}"
+                        function_info = f"operation: {op.operation}"
+                        recurring = "Recurring" if op.recurring else "One-time"
+
+                        # Add to options dictionary
+                        options[str(loop)] = f"{op.target_time} - {device_info} - {function_info} ({recurring})"
 
                     options["0"] = "Back to device menu"
                     self.display_menu_options(options)
@@ -465,7 +576,7 @@ class GUI():
                                 delete = self.prompt(
                                     "Would you like to delete this operation? (yes/no)").strip().lower()
                                 if delete == "yes":
-                                    operations.remove(selected_op)
+                                    SmartDevice.SmartDevice.remove_scheduled_operation(selected_op)
                                     self.display_success("Operation removed successfully!")
                             else:
                                 self.display_error("Invalid operation number.")
@@ -479,7 +590,7 @@ class GUI():
                 confirm = self.prompt("Are you sure you want to delete this device? (yes/no)").strip().lower()
                 if confirm == "yes":
                     try:
-                        home.remove_smart_device(device)
+                        device.dispose()
                         self.display_success(f"Device '{device.name}' deleted successfully!")
                         break
                     except ValueError as e:
@@ -500,23 +611,20 @@ class GUI():
         self.display_header(f"SCHEDULE OPERATION FOR {device.name}")
 
         # Get the time to schedule
-        scheduled_time = self.prompt("Enter the time to schedule the operation (HH:MM)")
+        scheduled_time = self.prompt("Enter the time to schedule the operation (HH:MM, 'mon-fri 07:00' or 'every 15m')")
         # Calculate minutes until the scheduled time
         try:
-            now = time.localtime()
-            hour, minute = map(int, scheduled_time.split(":"))
-            scheduled = time.struct_time((now.tm_year, now.tm_mon, now.tm_mday, hour, minute, 0, now.tm_wday, now.tm_yday, now.tm_isdst))
-            scheduled_timestamp = time.mktime(scheduled)
-            now_timestamp = time.mktime(now)
-            if scheduled_timestamp < now_timestamp:
-                # If the time is earlier than now, schedule for the next day
-                scheduled = time.struct_time((now.tm_year, now.tm_mon, now.tm_mday + 1, hour, minute, 0, (now.tm_wday + 1) % 7, now.tm_yday + 1, now.tm_isdst))
-                scheduled_timestamp = time.mktime(scheduled)
-            minutes = int((scheduled_timestamp - now_timestamp) // 60)
+            minutes = int(SmartDevice.SmartDevice.get_delay_seconds(scheduled_time) // 60)
         except Exception:
-            self.display_error("Invalid time format. Please use HH:MM.")
+            self.display_error("Invalid time format. Please use HH:MM, 'mon-fri 07:00' or 'every 15m'.")
             return
 
+        # Ask before the operation is made, so it is created and saved with the right kind
+        answer = self.prompt("Is this a recurring operation? (yes/no)").strip().lower()
+        if answer not in ("yes", "no"):
+            self.display_error("Invalid input. Set to non-recurring by default.")
+        recurring = answer == "yes"
+
         self.display_info(f"Select operation to schedule for {device.name}:")
 
         # Define operations based on device type
@@ -587,10 +695,10 @@ class GUI():
 
         # Common operations
         if choice == "1":
-            temp_sch = SmartDevice.ScheduledOperation(device.serial_number, "turn_on", scheduled_time, False)
+            temp_sch = SmartDevice.ScheduledOperation(device.serial_number, "turn_on", scheduled_time, recurring)
             self.display_success(f"Scheduled {device.name} to turn ON in {minutes} minutes")
         elif choice == "2":
-            temp_sch = SmartDevice.ScheduledOperation(device.serial_number, "turn_off", scheduled_time, False)
+            temp_sch = SmartDevice.ScheduledOperation(device.serial_number, "turn_off", scheduled_time, recurring)
             self.display_success(f"Scheduled {device.name} to turn OFF in {minutes} minutes")
         elif choice == "0":
             self.display_info("Scheduling cancelled")
@@ -601,7 +709,7 @@ class GUI():
             if isinstance(device, SmartDevice.SmartLight):
                 try:
                     brightness = int(self.prompt("Enter brightness level (0-100)"))
-                    temp_sch = SmartDevice.ScheduledOperation(device.serial_number, "set_brightness", scheduled_time, False, brightness)
+                    temp_sch = SmartDevice.ScheduledOperation(device.serial_number, "set_brightness", scheduled_time, recurring, brightness)
                     self.display_success(
                         f"Scheduled {device.name} brightness to set to {brightness} in {minutes} minutes")
                 except ValueError:
@@ -609,28 +717,28 @@ class GUI():
             elif isinstance(device, SmartDevice.SmartThermostat):
                 try:
                     temp = float(self.prompt("Enter temperature"))
-                    temp_sch = SmartDevice.ScheduledOperation(device.serial_number, "set_temperature", scheduled_time, False)
+                    temp_sch = SmartDevice.ScheduledOperation(device.serial_number, "set_temperature", scheduled_time, recurring)
                     self.display_success(f"Scheduled {device.name} temperature to set to {temp} in {minutes} minutes")
                 except ValueError:
                     self.display_error("Please enter a valid temperature")
             elif isinstance(device, SmartDevice.SmartCamera):
-                temp_sch = SmartDevice.ScheduledOperation(device.serial_number, "record", scheduled_time, False)
+                temp_sch = SmartDevice.ScheduledOperation(device.serial_number, "record", scheduled_time, recurring)
                 self.display_success(f"Scheduled {device.name} to start recording in {minutes} minutes")
             elif isinstance(device, SmartDevice.SmartLock):
-                temp_sch = SmartDevice.ScheduledOperation(device.serial_number, "lock", scheduled_time, False)
+                temp_sch = SmartDevice.ScheduledOperation(device.serial_number, "lock", scheduled_time, recurring)
                 self.display_success(f"Scheduled {device.name} to lock in {minutes} minutes")
             elif isinstance(device, SmartDevice.SmartSpeaker):
                 try:
                     volume = int(self.prompt("Enter volume level (0-100)"))
-                    temp_sch = SmartDevice.ScheduledOperation(device.serial_number, "set_volume", scheduled_time, False, volume)
+                    temp_sch = SmartDevice.ScheduledOperation(device.serial_number, "set_volume", scheduled_time, recurring, volume)
                     self.display_success(f"Scheduled {device.name} volume to set to {volume} in {minutes} minutes")
                 except ValueError:
                     self.display_error("Please enter a valid number")
             elif isinstance(device, SmartDevice.SmartDoorbell):
-                temp_sch = SmartDevice.ScheduledOperation(device.serial_number, "ring", scheduled_time, False)
+                temp_sch = SmartDevice.ScheduledOperation(device.serial_number, "ring", scheduled_time, recurring)
                 self.display_success(f"Scheduled {device.name} to ring in {minutes} minutes")
             elif isinstance(device, SmartDevice.SmartDoor):
-                temp_sch = SmartDevice.ScheduledOperation(device.serial_number, "open_door", scheduled_time, False)
+                temp_sch = SmartDevice.ScheduledOperation(device.serial_number, "open_door", scheduled_time, recurring)
                 self.display_success(f"Scheduled {device.name} to open in {minutes} minutes")
             else:
                 self.display_error("Invalid operation for this device type")
@@ -639,34 +747,34 @@ class GUI():
         elif choice == "4":
             if isinstance(device, SmartDevice.SmartLight):
                 colour = self.prompt("Enter colour")
-                temp_sch = SmartDevice.ScheduledOperation(device.serial_number, "set_colour", scheduled_time, False, colour)
+                temp_sch = SmartDevice.ScheduledOperation(device.serial_number, "set_colour", scheduled_time, recurring, colour)
                 self.display_success(f"Scheduled {device.name} colour to set to {colour} in {minutes} minutes")
             elif isinstance(device, SmartDevice.SmartThermostat):
                 try:
                     amount = float(self.prompt("Enter amount to increase"))
-                    temp_sch = SmartDevice.ScheduledOperation(device.serial_number, "increase_temperature", scheduled_time, False, amount)
+                    temp_sch = SmartDevice.ScheduledOperation(device.serial_number, "increase_temperature", scheduled_time, recurring, amount)
                     self.display_success(
                         f"Scheduled {device.name} temperature to increase by {amount} in {minutes} minutes")
                 except ValueError:
                     self.display_error("Please enter a valid number")
             elif isinstance(device, SmartDevice.SmartCamera):
-                temp_sch = SmartDevice.ScheduledOperation(device.serial_number, "stop_recording", scheduled_time, False)
+                temp_sch = SmartDevice.ScheduledOperation(device.serial_number, "stop_recording", scheduled_time, recurring)
                 self.display_success(f"Scheduled {device.name} to stop recording in {minutes} minutes")
             elif isinstance(device, SmartDevice.SmartLock):
-                temp_sch = SmartDevice.ScheduledOperation(device.serial_number, "unlock", scheduled_time, False)
+                temp_sch = SmartDevice.ScheduledOperation(device.serial_number, "unlock", scheduled_time, recurring)
                 self.display_success(f"Scheduled {device.name} to unlock in {minutes} minutes")
             elif isinstance(device, SmartDevice.SmartSpeaker):
                 try:
                     amount = int(self.prompt("Enter amount to increase"))
-                    temp_sch = SmartDevice.ScheduledOperation(device.serial_number, "increase_volume", scheduled_time, False, amount)
+                    temp_sch = SmartDevice.ScheduledOperation(device.serial_number, "increase_volume", scheduled_time, recurring, amount)
                     self.display_success(f"Scheduled {device.name} volume to increase by {amount} in {minutes} minutes")
                 except ValueError:
                     self.display_error("Please enter a valid number")
             elif isinstance(device, SmartDevice.SmartDoorbell):
-                temp_sch = SmartDevice.ScheduledOperation(device.serial_number, "stop_ringing", scheduled_time, False)
+                temp_sch = SmartDevice.ScheduledOperation(device.serial_number, "stop_ringing", scheduled_time, recurring)
                 self.display_success(f"Scheduled {device.name} to stop ringing in {minutes} minutes")
             elif isinstance(device, SmartDevice.SmartDoor):
-                temp_sch = SmartDevice.ScheduledOperation(device.serial_number, "close_door", scheduled_time, False)
+                temp_sch = SmartDevice.ScheduledOperation(device.serial_number, "close_door", scheduled_time, recurring)
                 self.display_success(f"Scheduled {device.name} to close in {minutes} minutes")
             else:
                 self.display_error("Invalid operation for this device type")
@@ -676,18 +784,18 @@ class GUI():
             if isinstance(device, SmartDevice.SmartThermostat):
                 try:
                     amount = float(self.prompt("Enter amount to decrease"))
-                    temp_sch = SmartDevice.ScheduledOperation(device.serial_number, "decrease_temperature", scheduled_time, False, amount)
+                    temp_sch = SmartDevice.ScheduledOperation(device.serial_number, "decrease_temperature", scheduled_time, recurring, amount)
                     self.display_success(f"Scheduled {device.name} temperature to decrease by {amount} in {minutes} minutes")
                 except ValueError:
                     self.display_error("Please enter a valid number")
             elif isinstance(device, SmartDevice.SmartCamera):
                 resolution = self.prompt("Enter resolution (e.g. 1080p)")
-                temp_sch = SmartDevice.ScheduledOperation(device.serial_number, "set_resolution", scheduled_time, False, resolution)
+                temp_sch = SmartDevice.ScheduledOperation(device.serial_number, "set_resolution", scheduled_time, recurring, resolution)
                 self.display_success(f"Scheduled {device.name} resolution to set to {resolution} in {minutes} minutes")
             elif isinstance(device, SmartDevice.SmartSpeaker):
                 try:
                     amount = int(self.prompt("Enter amount to decrease"))
-                    temp_sch = SmartDevice.ScheduledOperation(device.serial_number, "decrease_volume", scheduled_time, False, amount)
+                    temp_sch = SmartDevice.ScheduledOperation(device.serial_number, "decrease_volume", scheduled_time, recurring, amount)
                     self.display_success(f"Scheduled {device.name} volume to decrease by {amount} in {minutes} minutes")
                 except ValueError:
                     self.display_error("Please enter a valid number")
@@ -697,11 +805,11 @@ class GUI():
 
         elif choice == "6" and isinstance(device, SmartDevice.SmartSpeaker):
             song = self.prompt("Enter name of song to play")
-            temp_sch = SmartDevice.ScheduledOperation(device.serial_number, "play_music", scheduled_time, False, song)
+            temp_sch = SmartDevice.ScheduledOperation(device.serial_number, "play_music", scheduled_time, recurring, song)
             self.display_success(f"Scheduled {device.name} to play '{song}' in {minutes} minutes")
 
         elif choice == "7" and isinstance(device, SmartDevice.SmartSpeaker):
-            temp_sch = SmartDevice.ScheduledOperation(device.serial_number, "stop_music", scheduled_time, False)
+            temp_sch = SmartDevice.ScheduledOperation(device.serial_number, "stop_music", scheduled_time, recurring)
             self.display_success(f"Scheduled {device.name} to stop music in {minutes} minutes")
 
         # Invalid choice
@@ -709,17 +817,10 @@ class GUI():
             self.display_error("Invalid choice. Please try again.")
             return
 
-        recurring = self.prompt("Is this a recurring operation? (yes/no)").strip().lower()
-        # Validate recurring input
-        if recurring == "yes":
-            # Schedule the recurring operation
-            temp_sch.recurring = True
+        if recurring:
             self.display_success(f"Recurring operation scheduled")
-        elif recurring == "no":
-            temp_sch.recurring = False
-            self.display_success("Non-recurring operation scheduled successfully")
         else:
-            self.display_error("Invalid input. Set to non-recurring by default.")
+            self.display_success("Non-recurring operation scheduled successfully")
         temp_sch.load(device)
 
     # Device Operations Menu
@@ -941,7 +1042,7 @@ class GUI():
                 confirm = self.prompt("Are you sure you want to delete this home? (yes/no)").strip().lower()
                 if confirm == "yes":
                     try:
-                        self.connected_network.remove_smart_home(home)
+                        home.dispose()
                         self.display_success(f"Smart home '{home.name}' deleted successfully!")
                         break
                     except ValueError as e:
@@ -968,7 +1069,9 @@ class GUI():
                 "3": "Remove smart home",
                 "4": "List all devices",
                 "5": "Disconnect from network",
-                "6": "Back to main menu"
+                "6": "Security audit",
+                "7": "Top energy consumers",
+                "8": "Back to main menu"
             }
             self.display_menu_options(options)
 
@@ -979,8 +1082,9 @@ class GUI():
                 self.display_info(f"Smart homes in network {self.connected_network.ip_address}:")
                 if not self.connected_network.smart_homes:
                     print(f"  {Fore.YELLOW}No smart homes found{Style.RESET_ALL}")
+                energy = self.energy_by_home(self.connected_network)
                 for i, home in enumerate(self.connected_network.smart_homes, 1):
-                    print(f"  {Fore.YELLOW}[{i}]{Style.RESET_ALL} {home.name}")
+                    print(f"  {Fore.YELLOW}[{i}]{Style.RESET_ALL} {home.name} - {energy.get(home, 0.0):.2f} kWh")
 
             # Add a new smart home to the network
             elif choice == "2":
@@ -1005,7 +1109,7 @@ class GUI():
                         confirm = self.prompt(
                             f"Are you sure you want to remove '{smart_home.name}'? (yes/no)").strip().lower()
                         if confirm == "yes":
-                            self.connected_network.remove_smart_home(smart_home)
+                            smart_home.dispose()
                             self.display_success(f"Smart home '{smart_home.name}' removed successfully!")
                         else:
                             self.display_info("Home removal cancelled.")
@@ -1039,8 +1143,27 @@ class GUI():
                 else:
                     self.display_info("Disconnection cancelled.")
 
-            # Back to main menu
+            # Audit the security of every home in the network
             elif choice == "6":
+                audit = self.connected_network.get_security_audit()
+                audit.report()
+                least_secure = audit.least_secure(3)
+                if least_secure:
+                    self.display_info("Least secure homes: " + ", ".join(f"{home.name} ({score}/10)" for home, score in least_secure))
+
+            # Show the homes and devices using the most energy
+            elif choice == "7":
+                self.display_info("Top energy consumers:")
+                top_homes = self.connected_network.top_homes(5)
+                if not top_homes:
+                    print(f"  {Fore.YELLOW}No devices are using energy{Style.RESET_ALL}")
+                for home, kwh in top_homes:
+                    print(f"  {Fore.BLUE}■ Smart Home: {home.name}{Style.RESET_ALL} - {kwh:.2f} kWh")
+                for device, kwh in self.connected_network.top_devices(5):
+                    print(f"    {Fore.YELLOW}►{Style.RESET_ALL} {device.name} ({device.device_type}) - {kwh:.2f} kWh")
+
+            # Back to main menu
+            elif choice == "8":
                 break
 
             # Invalid choice
@@ -1056,50 +1179,142 @@ class GUI():
                 x = self.logged_in()
             if x:
                 break
+            # Write what changed in this step, so a crash loses at most one menu action
+            if getattr(self, "store", None) is not None:
+                self.store.save(self)
+            if getattr(self, "journal", None) is not None:
+                self.journal.maybe_compact()
             time.sleep(1)
 
-    # Load all scheduled operations
-    def load_scheduals(self):
+    # Load all scheduled operations, catching up on runs missed while the system was down
+    def load_scheduals(self, misfire_policy=None, grace_seconds=None):
         try:
-            SmartDevice.SmartDevice._scheduled_operations = self.scheduled_operations
+            SmartDevice.SmartDevice.set_scheduled_operations(self.scheduled_operations)
             devices = []
-            for i in self.networks:
-                devices.append(i.list_smart_devices())
-            for x in devices:
-                for y in x:
-                    if isinstance(y, SmartDevice.SmartDevice):
-                        for z in self.scheduled_operations:
-                            if z.device_serial_number == y.serial_number:
-                                z.load(y)
+            for network in self.networks:
+                for home in network.smart_homes:
+                    for device in home.smart_devices:
+                        if isinstance(device, SmartDevice.SmartDevice):
+                            # Devices saved before they knew their home are linked back to it
+                            device.home = home
+                            devices.append(device)
+            results = SmartDevice.SmartDevice.restore_scheduled_operations(devices, misfire_policy, grace_seconds)
+            if results:
+                self.display_info("Restored scheduled operations: " + ", ".join(f"{count} {result}" for result, count in results.items()))
             self.scheduled_operations = []
         except FileNotFoundError:
             self.display_error("No scheduled operations found. Please load the data file.")
 
-
 if __name__ == "__main__":
+    #change this to True to keep the data in an SQLite database instead of data.pkl
+    use_sqlite = False
+    #change this to True to keep device state in NumPy columns for the energy and security reports
+    use_device_table = False
+    #change this to True to only load the homes and devices of a network when it is opened (SQLite only)
+    lazy_load = False
+    #change this to True to keep one file per network in the data directory
+    use_shards = False
+    #change this to True to record changes in data.journal and only rewrite data.pkl when compacting
+    use_journal = False
+    #change this to True to save data.snap in the compact binary format instead of pickling to data.pkl
+    use_binary_snapshot = False
     #change this to False if you want to load the data from the file
     #change this to True if you want to start with a fresh GUI
     first_start = True
-    if first_start:
+    if use_sqlite:
+        store = Storage.SQLiteStore("data.db")
         gui = GUI()
-        gui.add_network(Network.Network("1"))
-        gui.add_network(Network.Network("2"))
+        if store.is_empty():
+            gui.add_network(Network.Network("1"))
+            gui.add_network(Network.Network("2"))
+        elif lazy_load:
+            # Load the users and networks now, and each network's homes the first time they are needed
+            store.load_lazy(gui, max_loaded=8)
+        else:
+            # Load the GUI and its scheduled operations from the database
+            store.load(gui)
+            gui.load_scheduals()
+        gui.store = store
+        if use_device_table:
+            DeviceTable.install(gui.networks)
+        # Start the program
+        gui.loop()
+        # Save whatever changed since the last menu action
+        store.save(gui)
+        store.close()
+    elif use_shards:
+        store = Storage.ShardedStore("data")
+        gui = GUI()
+        if store.is_empty():
+            gui.add_network(Network.Network("1"))
+            gui.add_network(Network.Network("2"))
+        else:
+            # Load every network shard and the scheduled operations of its devices
+            store.load(gui)
+            gui.load_scheduals()
+        gui.store = store
+        if use_device_table:
+            DeviceTable.install(gui.networks)
+        # Start the program
+        gui.loop()
+        # Save the networks that changed since the last menu action
+        store.save(gui)
+        store.close()
+    elif use_journal:
+        journal = Journal.Journal("data.journal", "data.pkl")
+        # Load the last snapshot and replay the changes made after it
+        gui = journal.load(GUI)
+        if gui is None:
+            gui = GUI()
+            gui.add_network(Network.Network("1"))
+            gui.add_network(Network.Network("2"))
+        else:
+            gui.load_scheduals()
+        journal.attach(gui)
+        gui.journal = journal
+        if use_device_table:
+            DeviceTable.install(gui.networks)
+        # Start the program
+        gui.loop()
+        # Every change is already in the journal, so there is nothing left to save
+        journal.close()
+    elif use_binary_snapshot:
+        if first_start:
+            gui = GUI()
+            gui.add_network(Network.Network("1"))
+            gui.add_network(Network.Network("2"))
+        else:
+            # Load the GUI and its scheduled operations from the snapshot
+            gui = GUI()
+            with open("data.snap", "rb") as f:
+                Snapshot.load(f, gui)
+            gui.load_scheduals()
+        # Save the GUI in the background while the program runs
+        autosave = Autosave.Autosave(gui, "data.snap", interval=30, serialize=lambda: Snapshot.dumps(gui))
+        autosave.start()
+        if use_device_table:
+            DeviceTable.install(gui.networks)
+        # Start the program
+        gui.loop()
+        # Save the GUI state to a file
+        autosave.stop()
     else:
-        # Load the GUI from the saved data file
-        with open("data.pkl", "rb") as f:
-            gui = pickle.load(f)
-        # Load the scheduled operations
-        gui.load_scheduals()
-        # Update the device count
-        SmartDevice.SmartDevice._device_count = gui.device_count
-        User.User._Users = gui.user_count
-        User.SmartHome._home_count = gui.home_count
-    # Start the program
-    gui.loop()
-    # Save the GUI state to a file
-    gui.scheduled_operations = SmartDevice.SmartDevice._scheduled_operations
-    gui.device_count = SmartDevice.SmartDevice.get_device_count()
-    gui.user_count = User.User.get_user_count()
-    gui.home_count = User.SmartHome.get_home_count()
-    with open("data.pkl", "wb") as f:
-        pickle.dump(gui, f)
+        if first_start:
+            gui = GUI()
+            gui.add_network(Network.Network("1"))
+            gui.add_network(Network.Network("2"))
+        else:
+            # Load the GUI from the saved data file
+            with open("data.pkl", "rb") as f:
+                gui = pickle.load(f)
+            # Load the scheduled operations
+            gui.load_scheduals()
+        # Save the GUI in the background while the program runs
+        autosave = Autosave.Autosave(gui, "data.pkl", interval=30)
+        autosave.start()
+        if use_device_table:
+            DeviceTable.install(gui.networks)
+        # Start the program
+        gui.loop()
+        # Save the GUI state to a file
+        autosave.stop()
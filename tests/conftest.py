@@ -0,0 +1,62 @@
+import os
+import sys
+from datetime import datetime
+import pytest
+
+# The modules live in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Clock
+import DeviceTable
+import Events
+import Network
+import Scheduler
+import SmartDevice
+import User
+
+# Monday 5 January 2026, 08:00
+START = datetime(2026, 1, 5, 8, 0)
+
+
+# Every test starts with an empty schedule, fresh id counters and a virtual clock,
+# so nothing runs in the background and no state leaks from one test to the next
+@pytest.fixture(autouse=True)
+def fresh_model():
+    listeners = list(Events._listeners)
+    scheduler = SmartDevice.SmartDevice.get_scheduler()
+    virtual = Scheduler.Scheduler(clock=Clock.VirtualClock(START))
+    SmartDevice.SmartDevice.set_scheduler(virtual)
+    SmartDevice.SmartDevice.set_scheduled_operations([])
+    SmartDevice.SmartDevice.get_device_ids().reset()
+    User.User._Users = 0
+    User.SmartHome._home_count = 0
+    yield virtual
+    virtual.shutdown(wait=False)
+    DeviceTable.uninstall()
+    Events._listeners[:] = listeners
+    SmartDevice.SmartDevice.set_scheduler(scheduler)
+    SmartDevice.SmartDevice.set_scheduled_operations([])
+    SmartDevice.SmartDevice.get_device_ids().reset()
+    SmartDevice.SmartDevice.set_verbose(True)
+
+
+@pytest.fixture
+def scheduler(fresh_model):
+    return fresh_model
+
+
+# A network with a few homes of devices, every other device switched on
+@pytest.fixture
+def build_network():
+    def build(ip_address="1", homes=3, devices=4, device_type="Light"):
+        network = Network.Network(ip_address)
+        for h in range(homes):
+            home = User.SmartHome(network, f"Home {h}")
+            for d in range(devices):
+                device = SmartDevice.SmartDevice(f"Device {h}-{d}", device_type)
+                device.energy_consumption = float(d + 1)
+                home.add_smart_device(device)
+                if d % 2:
+                    device.turn_on()
+        return network
+    return build
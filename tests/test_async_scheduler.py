@@ -0,0 +1,41 @@
+import asyncio
+import threading
+import Scheduler
+
+
+def test_callbacks_run_on_the_event_loop():
+    async def main():
+        scheduler = Scheduler.AsyncScheduler()
+        ran = []
+        scheduler.schedule(0.02, lambda: ran.append("second"))
+        scheduler.schedule(0.01, lambda: ran.append("first"))
+        assert len(scheduler) == 2
+        await scheduler.wait_idle()
+        return ran, len(scheduler)
+    assert asyncio.run(main()) == (["first", "second"], 0)
+
+
+def test_cancelled_callback_never_runs():
+    async def main():
+        scheduler = Scheduler.AsyncScheduler()
+        ran = []
+        timer = scheduler.schedule(0.01, lambda: ran.append("cancelled"))
+        scheduler.schedule(0.02, lambda: ran.append("kept"))
+        timer.cancel()
+        await scheduler.wait_idle()
+        return ran
+    assert asyncio.run(main()) == ["kept"]
+
+
+def test_schedule_from_another_thread():
+    async def main():
+        scheduler = Scheduler.AsyncScheduler()
+        scheduler.attach()
+        ran = asyncio.Event()
+        thread = threading.Thread(target=scheduler.schedule, args=(0, ran.set))
+        thread.start()
+        thread.join()
+        await asyncio.wait_for(ran.wait(), 1)
+        await scheduler.wait_idle()
+        return len(scheduler)
+    assert asyncio.run(main()) == 0
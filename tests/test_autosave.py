@@ -0,0 +1,60 @@
+import os
+import pickle
+import time
+import Autosave
+import main
+import Network
+import SmartDevice
+
+
+def test_write_atomic_replaces_the_file(tmp_path):
+    path = str(tmp_path / "data.pkl")
+    Autosave.write_atomic(path, b"old")
+    Autosave.write_atomic(path, b"new")
+    assert open(path, "rb").read() == b"new"
+    assert os.listdir(tmp_path) == ["data.pkl"]
+
+
+def test_save_is_skipped_until_something_changes(tmp_path):
+    gui = main.GUI()
+    autosave = Autosave.Autosave(gui, str(tmp_path / "data.pkl"), interval=60)
+    autosave.start()
+    try:
+        assert autosave.save()
+        assert not autosave.save()
+        gui.add_network(Network.Network("1"))
+        assert autosave.dirty
+        assert autosave.save()
+    finally:
+        autosave.stop()
+    assert (autosave.saves, autosave.skipped) == (2, 2)
+
+
+def test_snapshot_leaves_the_gui_alone():
+    gui = main.GUI()
+    device = SmartDevice.SmartDevice("Lamp", "Light")
+    SmartDevice.ScheduledOperation(device.serial_number, "turn_on", 60, False)
+    gui.scheduled_operations = ["loaded, not yet armed"]
+    restored = pickle.loads(gui.snapshot())
+    assert gui.scheduled_operations == ["loaded, not yet armed"]
+    assert [operation.operation for operation in restored.scheduled_operations] == ["turn_on"]
+
+
+def test_failed_save_keeps_the_thread_running(tmp_path):
+    attempts = []
+    def serialize():
+        attempts.append(None)
+        if len(attempts) == 1:
+            raise RuntimeError("dictionary changed size during iteration")
+        return b"saved"
+    autosave = Autosave.Autosave(main.GUI(), str(tmp_path / "data.pkl"), interval=0.01, serialize=serialize)
+    autosave.start()
+    try:
+        deadline = time.monotonic() + 5
+        while autosave.saves == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert autosave._thread.is_alive()
+    finally:
+        autosave.stop()
+    assert autosave.saves == 1
+    assert open(tmp_path / "data.pkl", "rb").read() == b"saved"
@@ -0,0 +1,61 @@
+import threading
+import time
+import Clock
+import Network
+import Scheduler
+import SmartDevice
+import User
+
+
+def test_operations_due_in_the_same_tick_run_as_one_batch():
+    scheduler = Scheduler.Scheduler(tick=1, clock=Clock.VirtualClock())
+    home, other = Network.Network("1"), Network.Network("2")
+    batches = []
+    scheduler.add_listener(lambda group, count: batches.append((group.ip_address, count)))
+    for delay in (10.1, 10.5, 10.9):
+        scheduler.schedule(delay, lambda: None, home)
+    scheduler.schedule(11.5, lambda: None, home)
+    scheduler.schedule(10.2, lambda: None, other)
+    scheduler.run_for(20)
+    assert sorted(batches) == [("1", 1), ("1", 3), ("2", 1)]
+    scheduler.shutdown()
+
+
+def test_operations_never_run_before_they_are_due():
+    clock = Clock.VirtualClock()
+    scheduler = Scheduler.Scheduler(tick=0.5, clock=clock)
+    early = []
+    for i in range(50):
+        due = i * 0.37
+        scheduler.schedule(due, lambda due=due: early.append(clock.time() < due))
+    assert scheduler.run_for(30) == 50
+    assert not any(early)
+    scheduler.shutdown()
+
+
+def test_real_clock_operations_are_never_early():
+    scheduler = Scheduler.Scheduler(tick=0.05)
+    lateness = []
+    done = threading.Event()
+    try:
+        for i in range(20):
+            due = time.monotonic() + 0.01 * i
+            scheduler.schedule(0.01 * i, lambda due=due: (lateness.append(time.monotonic() - due), len(lateness) == 20 and done.set()))
+        assert done.wait(5)
+        assert min(lateness) >= 0
+    finally:
+        scheduler.shutdown()
+
+
+def test_devices_of_one_home_are_batched_together(scheduler):
+    batches = []
+    scheduler.add_listener(lambda group, count: batches.append((group, count)))
+    network = Network.Network("1")
+    home = User.SmartHome(network, "Home")
+    for i in range(3):
+        device = SmartDevice.SmartDevice(f"Lamp {i}", "Light")
+        home.add_smart_device(device)
+        device.schedule_operation("turn_on", 60, False, None)
+    scheduler.run_for(60)
+    assert batches == [(home, 3)]
+    assert all(device.is_on for device in home.smart_devices)
@@ -0,0 +1,21 @@
+import Benchmark
+
+
+def test_percentiles_of_a_sorted_list():
+    values = [i / 1000 for i in range(101)]
+    summary = Benchmark.summarise(values)
+    assert summary["count"] == 101
+    assert summary["p50_ms"] == 50
+    assert summary["max_ms"] == 100
+    assert Benchmark.summarise([])["p50_ms"] is None
+
+
+def test_small_run_reports_every_section():
+    args = Benchmark.parse_args(["--devices", "40", "--networks", "2", "--homes", "2", "--operations", "60",
+                                 "--delay", "0", "--timeout", "5", "--memory-devices", "20"])
+    results = Benchmark.run(args)
+    assert results["arm"]["operations"] == 60
+    assert results["fire"]["fired"] == results["fire"]["expected"] == 30
+    assert results["fire"]["lateness"]["p50_ms"] >= 0
+    assert results["restore"]["restored_operations"] == 30
+    assert set(results["memory"]) == {cls.__name__ for cls, _ in Benchmark.DEVICE_TYPES}
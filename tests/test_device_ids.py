@@ -0,0 +1,65 @@
+import SmartDevice
+
+
+class Owner():
+    pass
+
+
+def test_lowest_free_id_is_reused():
+    ids = SmartDevice.DeviceIdAllocator()
+    owners = [Owner() for _ in range(4)]
+    assert [ids.allocate(owner) for owner in owners] == [0, 1, 2, 3]
+    ids.release(owners[2], 2)
+    ids.release(owners[1], 1)
+    assert ids.allocate(Owner()) == 1
+    assert ids.allocate(Owner()) == 2
+    assert ids.allocate(Owner()) == 4
+    assert len(ids) == 5
+
+
+def test_release_by_another_copy_keeps_the_id():
+    ids = SmartDevice.DeviceIdAllocator()
+    first, copy = Owner(), Owner()
+    ids.allocate(first)
+    ids.adopt(copy, 0)
+    ids.release(first, 0)
+    assert len(ids) == 1
+    assert ids.allocate(Owner()) == 1
+
+
+def test_state_round_trip_before_devices_are_loaded():
+    ids = SmartDevice.DeviceIdAllocator()
+    owners = [Owner() for _ in range(5)]
+    for owner in owners:
+        ids.allocate(owner)
+    ids.release(owners[1], 1)
+    ids.release(owners[3], 3)
+    state = ids.get_state()
+    assert state == (5, [1, 3])
+    restored = SmartDevice.DeviceIdAllocator()
+    restored.restore(*state)
+    # Ids 0, 2 and 4 still belong to devices that are not loaded, so they are never handed out
+    assert [restored.allocate(Owner()) for _ in range(3)] == [1, 3, 5]
+    restored.adopt(Owner(), 2)
+    assert len(restored) == 6
+
+
+def test_adopt_past_the_end_holds_the_ids_in_between():
+    ids = SmartDevice.DeviceIdAllocator()
+    ids.adopt(Owner(), 3)
+    assert ids.next_id == 4
+    assert ids.allocate(Owner()) == 4
+    # Without a free list every id no loaded device holds is freed
+    ids.restore(4, None)
+    assert ids.get_state() == (5, [0, 1, 2])
+    assert ids.allocate(Owner()) == 0
+
+
+def test_devices_free_their_id_when_disposed():
+    first = SmartDevice.SmartLight("First")
+    second = SmartDevice.SmartLight("Second")
+    first.dispose(report=False)
+    third = SmartDevice.SmartLight("Third")
+    assert third.device_id == first.device_id
+    assert third.device_id != second.device_id
+    assert third.serial_number == f"DEV-{third.device_id}"
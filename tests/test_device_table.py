@@ -0,0 +1,63 @@
+import gc
+import weakref
+import pytest
+import DeviceTable
+import SmartDevice
+import User
+
+pytest.importorskip("numpy")
+
+
+def walk(homes):
+    devices = [device for home in homes for device in home.smart_devices]
+    energy = sum(device.energy_consumption for device in devices if device.is_on)
+    return len(devices), sum(1 for device in devices if device.is_on), energy
+
+
+def test_aggregates_match_walking_the_devices(build_network):
+    network = build_network(homes=3, devices=4)
+    other = build_network(ip_address="2", homes=2, devices=3)
+    table = DeviceTable.install([network, other])
+    home = network.smart_homes[1]
+    home.smart_devices[0].turn_on()
+    home.smart_devices[0].energy_consumption = 7.5
+    for target in (home, network, other):
+        homes = [target] if isinstance(target, User.SmartHome) else target.smart_homes
+        kwargs = {"home": target} if isinstance(target, User.SmartHome) else {"network": target}
+        count, active, energy = walk(homes)
+        assert table.device_count(**kwargs) == count
+        assert table.active_count(**kwargs) == active
+        assert table.energy_consumption(**kwargs) == pytest.approx(energy)
+    by_home = table.energy_by_home()
+    assert by_home[home] == pytest.approx(walk([home])[2])
+
+
+def test_removed_homes_and_networks_are_not_kept_alive(build_network):
+    network = build_network(homes=2, devices=2)
+    table = DeviceTable.install([network])
+    home = network.smart_homes[0]
+    network.remove_smart_home(home)
+    home_ref = weakref.ref(home)
+    del home
+    gc.collect()
+    assert home_ref() is None
+    assert len(table.homes) == 1
+    network_ref = weakref.ref(network)
+    network.dispose(report=False)
+    del network
+    gc.collect()
+    assert network_ref() is None
+    assert len(table.homes) == 0 and len(table.networks) == 0
+
+
+def test_numbers_of_removed_homes_are_reused(build_network):
+    network = build_network(homes=2, devices=1)
+    table = DeviceTable.install([network])
+    first = network.smart_homes[0]
+    number = table.homes.get(first)
+    network.remove_smart_home(first)
+    home = User.SmartHome(network, "New Home")
+    home.add_smart_device(SmartDevice.SmartLight("Lamp"))
+    assert table.homes.get(home) == number
+    assert table.homes.size == 2
+    assert table.device_count(home=home) == 1
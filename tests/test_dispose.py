@@ -0,0 +1,108 @@
+import gc
+import weakref
+import Journal
+import main
+import Network
+import SmartDevice
+import Storage
+import User
+
+
+def build(gui, ip_address):
+    network = Network.Network(ip_address)
+    gui.add_network(network)
+    for h in range(2):
+        home = User.SmartHome(network, f"Home {ip_address}-{h}")
+        for d in range(2):
+            home.add_smart_device(SmartDevice.SmartDevice(f"Lamp {ip_address}-{h}-{d}", "Light"))
+    return network
+
+
+def homes_by_network(gui):
+    return {network.ip_address: [home.name for home in network.smart_homes] for network in gui.networks}
+
+
+def restart():
+    SmartDevice.SmartDevice.get_device_ids().reset()
+    SmartDevice.SmartDevice.set_scheduled_operations([])
+
+
+def test_disposed_network_stays_empty_in_sqlite(tmp_path):
+    path = str(tmp_path / "data.db")
+    gui = main.GUI()
+    store = Storage.SQLiteStore(path)
+    build(gui, "1")
+    build(gui, "2")
+    store.save_all(gui)
+    gui.networks[0].dispose(report=False)
+    store.save(gui)
+    store.close()
+    restart()
+    store = Storage.SQLiteStore(path)
+    loaded = store.load(main.GUI())
+    store.close()
+    assert homes_by_network(loaded) == {"1": [], "2": ["Home 2-0", "Home 2-1"]}
+    assert len(SmartDevice.SmartDevice.get_device_ids()) == 4
+
+
+def test_disposing_a_network_that_is_not_loaded_deletes_its_homes(tmp_path):
+    path = str(tmp_path / "data.db")
+    gui = main.GUI()
+    store = Storage.SQLiteStore(path)
+    build(gui, "1")
+    build(gui, "2")
+    store.save_all(gui)
+    store.close()
+    restart()
+    gui = main.GUI()
+    store = Storage.SQLiteStore(path)
+    store.load_lazy(gui).join()
+    network = gui.networks[0]
+    assert not network.is_loaded
+    network.dispose(report=False)
+    assert network.ip_address not in store._loaded
+    store.save(gui)
+    store.close()
+    restart()
+    store = Storage.SQLiteStore(path)
+    loaded = store.load(main.GUI())
+    store.close()
+    assert homes_by_network(loaded) == {"1": [], "2": ["Home 2-0", "Home 2-1"]}
+
+
+def test_disposed_network_stays_empty_after_journal_replay(tmp_path):
+    gui = main.GUI()
+    journal = Journal.Journal(str(tmp_path / "data.journal"), str(tmp_path / "data.pkl"))
+    journal.attach(gui)
+    build(gui, "1")
+    build(gui, "2")
+    gui.networks[1].dispose(report=False)
+    journal.close()
+    restart()
+    loaded = Journal.Journal(str(tmp_path / "data.journal"), str(tmp_path / "data.pkl")).load(main.GUI)
+    assert homes_by_network(loaded) == {"1": ["Home 1-0", "Home 1-1"], "2": []}
+    assert SmartDevice.SmartDevice.get_device_ids().get_state() == (8, [4, 5, 6, 7])
+
+
+def test_disposed_homes_and_devices_are_freed(build_network):
+    network = build_network(homes=2, devices=2)
+    home = network.smart_homes[0]
+    device = home.smart_devices[0]
+    refs = [weakref.ref(home), weakref.ref(device)]
+    free_id = device.device_id
+    network.dispose(report=False)
+    assert network.smart_homes == [] and home.smart_devices == []
+    assert device.home is None and home.network is None
+    del home, device
+    gc.collect()
+    assert [ref() for ref in refs] == [None, None]
+    assert SmartDevice.SmartLight("New").device_id == free_id
+
+
+def test_with_block_disposes_the_device(build_network):
+    home = build_network(homes=1, devices=1).smart_homes[0]
+    with SmartDevice.SmartLight("Temporary") as device:
+        home.add_smart_device(device)
+        assert len(home.smart_devices) == 2
+    assert len(home.smart_devices) == 1
+    assert device.home is None
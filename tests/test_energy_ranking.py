@@ -0,0 +1,63 @@
+import random
+import pytest
+
+
+def brute_force_devices(network):
+    devices = [device for home in network.smart_homes for device in home.smart_devices
+               if device.is_on and device.energy_consumption]
+    return sorted(devices, key=lambda device: (-device.energy_consumption, device.device_id))
+
+
+def brute_force_homes(network):
+    energy = {home: sum(device.energy_consumption for device in home.smart_devices if device.is_on)
+              for home in network.smart_homes}
+    return sorted((home for home in energy if energy[home]), key=lambda home: (-energy[home], home.home_id)), energy
+
+
+def shuffle_energy(network, seed, steps=80):
+    rng = random.Random(seed)
+    for _ in range(steps):
+        home = rng.choice([home for home in network.smart_homes if home.smart_devices])
+        device = rng.choice(home.smart_devices)
+        action = rng.randrange(3)
+        if action == 0:
+            device.turn_off() if device.is_on else device.turn_on()
+        elif action == 1:
+            device.set_energy_consumption(rng.randint(1, 40) / 4)
+        else:
+            other = rng.choice(network.smart_homes)
+            home.remove_smart_device(device)
+            other.add_smart_device(device)
+
+
+def test_rankings_match_sorting_the_fleet(build_network):
+    network = build_network(homes=5, devices=4)
+    network.get_energy_ranking()
+    for seed in range(3):
+        shuffle_energy(network, seed)
+        assert [device for device, _ in network.top_devices(5)] == brute_force_devices(network)[:5]
+        homes, energy = brute_force_homes(network)
+        top = network.top_homes(3)
+        assert [home for home, _ in top] == homes[:3]
+        assert [kwh for _, kwh in top] == pytest.approx([energy[home] for home in homes[:3]])
+
+
+def test_devices_that_are_off_are_not_ranked(build_network):
+    network = build_network(homes=2, devices=2)
+    for home in network.smart_homes:
+        home.turn_off_all_devices()
+    assert network.top_devices() == []
+    assert network.top_homes() == []
+    device = network.smart_homes[1].smart_devices[0]
+    device.turn_on()
+    assert network.top_devices() == [(device, device.energy_consumption)]
+    assert network.top_homes() == [(network.smart_homes[1], device.energy_consumption)]
+
+
+def test_removed_homes_leave_the_ranking(build_network):
+    network = build_network(homes=3, devices=2)
+    home = network.top_homes(1)[0][0]
+    network.remove_smart_home(home)
+    home.smart_devices[0].set_energy_consumption(500)
+    assert home not in dict(network.top_homes())
+    assert all(device.home is not home for device, _ in network.top_devices())
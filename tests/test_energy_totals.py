@@ -0,0 +1,57 @@
+import pytest
+import DeviceTable
+import main
+import SmartDevice
+
+
+def walk(home):
+    on = [device for device in home.smart_devices if device.is_on]
+    return len(on), sum(device.energy_consumption for device in on)
+
+
+def change_some_devices(network):
+    home = network.smart_homes[0]
+    home.smart_devices[0].turn_on()
+    home.smart_devices[1].turn_off()
+    home.smart_devices[2].set_energy_consumption(9.25)
+    home.add_smart_device(SmartDevice.SmartLock("Front Lock"))
+    home.smart_devices[-1].turn_on()
+    home.remove_smart_device(home.smart_devices[3])
+    return home
+
+
+def test_totals_follow_every_change(build_network):
+    network = build_network(homes=2, devices=4)
+    home = network.smart_homes[0]
+    home.get_totals()
+    network.get_totals()
+    change_some_devices(network)
+    assert (home.get_totals().active_count, home.get_totals().active_energy) == pytest.approx(walk(home))
+    assert home.get_energy_consumption() == pytest.approx(walk(home)[1])
+    assert network.get_energy_consumption() == pytest.approx(sum(walk(h)[1] for h in network.smart_homes))
+    assert home.get_totals().security_points == 2
+
+
+def test_home_reports_never_scan_the_device_table(build_network, monkeypatch):
+    pytest.importorskip("numpy")
+    network = build_network(homes=2, devices=4)
+    table = DeviceTable.install([network])
+    home = change_some_devices(network)
+    calls = []
+    for name in ("energy_consumption", "active_count", "security"):
+        monkeypatch.setattr(table, name, lambda *args, name=name, **kwargs: calls.append(name))
+    assert home.get_energy_consumption() == pytest.approx(walk(home)[1])
+    home.secure_home()
+    assert calls == []
+
+
+def test_energy_by_home_with_and_without_the_device_table(build_network):
+    pytest.importorskip("numpy")
+    gui = main.GUI()
+    network = build_network(homes=3, devices=4)
+    gui.add_network(network)
+    change_some_devices(network)
+    expected = {home: pytest.approx(walk(home)[1]) for home in network.smart_homes}
+    assert gui.energy_by_home(network) == expected
+    DeviceTable.install([network])
+    assert gui.energy_by_home(network) == expected
@@ -0,0 +1,50 @@
+import gzip
+import pytest
+import Export
+import main
+import SmartDevice
+
+
+def describe(gui):
+    return [(network.ip_address, [(home.name, [(device.serial_number, device.is_on) for device in home.smart_devices])
+                                  for home in network.smart_homes])
+            for network in gui.networks]
+
+
+def make_gui(build_network):
+    gui = main.GUI()
+    gui.add_network(build_network("1", homes=3, devices=5))
+    return gui
+
+
+@pytest.mark.parametrize("name", ["fleet.snap.gz", "fleet.snap.xz", "fleet.snap.bz2", "fleet.snap"])
+def test_export_and_import(tmp_path, build_network, name):
+    gui = make_gui(build_network)
+    path = str(tmp_path / name)
+    assert Export.export(gui, path) > 0
+    SmartDevice.SmartDevice.get_device_ids().reset()
+    assert describe(Export.import_snapshot(path, main.GUI())) == describe(gui)
+    assert not (tmp_path / (name + ".tmp")).exists()
+
+
+def test_compression_is_detected_from_the_content(tmp_path, build_network):
+    path = str(tmp_path / "fleet.bin")
+    Export.export(make_gui(build_network), path, compression="gzip")
+    assert Export.detect_compression(path) == "gzip"
+    with gzip.open(path, "rb") as f:
+        assert f.read(6) == b"SDSNAP"
+
+
+def test_unknown_compression_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        Export.open_compressed(str(tmp_path / "fleet.snap"), "wb", "rar")
+
+
+def test_convert_between_formats(tmp_path, build_network):
+    gui = make_gui(build_network)
+    Export.save_destination(gui, str(tmp_path / "data.pkl"))
+    SmartDevice.SmartDevice.get_device_ids().reset()
+    loaded = Export.load_source(str(tmp_path / "data.pkl"))
+    Export.save_destination(loaded, str(tmp_path / "data.db"))
+    SmartDevice.SmartDevice.get_device_ids().reset()
+    assert describe(Export.load_source(str(tmp_path / "data.db"))) == describe(gui)
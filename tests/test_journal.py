@@ -0,0 +1,111 @@
+import json
+import Journal
+import main
+import Network
+import SmartDevice
+import User
+
+
+def describe(gui):
+    return [(network.ip_address, [(home.home_id, home.name, [(device.serial_number, device.name, device.is_on)
+                                                           for device in home.smart_devices])
+                                  for home in network.smart_homes])
+            for network in gui.networks]
+
+
+def start(tmp_path, **options):
+    gui = main.GUI()
+    journal = Journal.Journal(str(tmp_path / "data.journal"), str(tmp_path / "data.pkl"), **options)
+    journal.attach(gui)
+    gui.journal = journal
+    return gui, journal
+
+
+def restart(tmp_path):
+    SmartDevice.SmartDevice.get_device_ids().reset()
+    SmartDevice.SmartDevice.set_scheduled_operations([])
+    return Journal.Journal(str(tmp_path / "data.journal"), str(tmp_path / "data.pkl")).load(main.GUI)
+
+
+def build(gui):
+    network = Network.Network("1")
+    gui.add_network(network)
+    for h in range(2):
+        home = User.SmartHome(network, f"Home {h}")
+        for d in range(3):
+            home.add_smart_device(SmartDevice.SmartDevice(f"Lamp {h}-{d}", "Light"))
+    return network
+
+
+def test_replay_rebuilds_the_model(tmp_path):
+    gui, journal = start(tmp_path)
+    network = build(gui)
+    network.smart_homes[0].smart_devices[1].toggle()
+    network.smart_homes[1].smart_devices[0].name = "Hall"
+    network.smart_homes[0].remove_smart_device(network.smart_homes[0].smart_devices[2])
+    journal.close()
+    loaded = restart(tmp_path)
+    assert describe(loaded) == describe(gui)
+    # The removed device gave its id back
+    assert SmartDevice.SmartDevice.get_device_ids().get_state() == (6, [2])
+
+
+def test_removed_home_stays_removed(tmp_path):
+    gui, journal = start(tmp_path)
+    network = build(gui)
+    network.remove_smart_home(network.smart_homes[0])
+    journal.close()
+    loaded = restart(tmp_path)
+    assert [home.name for home in loaded.networks[0].smart_homes] == ["Home 1"]
+    assert loaded.networks[0].get_home(0) is None
+
+
+def test_compaction_writes_a_snapshot_and_empties_the_journal(tmp_path):
+    gui, journal = start(tmp_path, compact_every=5)
+    network = build(gui)
+    journal.maybe_compact()
+    assert journal.records == 0
+    assert (tmp_path / "data.pkl").exists()
+    network.smart_homes[0].smart_devices[0].toggle()
+    journal.close()
+    assert len((tmp_path / "data.journal").read_text().splitlines()) == 1
+    loaded = restart(tmp_path)
+    assert describe(loaded) == describe(gui)
+
+
+def test_damaged_last_record_is_skipped(tmp_path):
+    gui, journal = start(tmp_path)
+    build(gui)
+    journal.close()
+    with open(tmp_path / "data.journal", "a") as f:
+        f.write('["set", ["device", "DEV-0"], "na')
+    loaded = restart(tmp_path)
+    assert describe(loaded) == describe(gui)
+
+
+def test_records_are_compact_json_lines(tmp_path):
+    gui, journal = start(tmp_path)
+    build(gui)
+    journal.close()
+    records = [json.loads(line) for line in (tmp_path / "data.journal").read_text().splitlines()]
+    assert ["add_network", "1"] in records
+    assert {record[0] for record in records} <= {"set", "add_network", "add_smart_home", "add_smart_device"}
+
+
+def test_user_connected_before_it_was_added_keeps_its_network(tmp_path):
+    gui, journal = start(tmp_path)
+    network = build(gui)
+    user = User.User("alice")
+    user.connect_to_network(network)
+    gui.add_user(user)
+    journal.close()
+    loaded = restart(tmp_path)
+    assert loaded.users[0].username == "alice"
+    assert loaded.users[0].network is loaded.networks[0]
+
+
+def test_journal_without_user_networks_still_replays(tmp_path):
+    path = tmp_path / "data.journal"
+    path.write_text(json.dumps(["add_network", "1"]) + "\n" + json.dumps(["add_user", 0, "alice"]) + "\n")
+    loaded = restart(tmp_path)
+    assert [(user.username, user.network) for user in loaded.users] == [("alice", None)]
@@ -0,0 +1,95 @@
+import main
+import Network
+import SmartDevice
+import Storage
+import User
+
+
+def saved_fleet(tmp_path, networks=4):
+    gui = main.GUI()
+    for n in range(networks):
+        network = Network.Network(str(n + 1))
+        gui.add_network(network)
+        home = User.SmartHome(network, f"Home {n + 1}")
+        for d in range(2):
+            home.add_smart_device(SmartDevice.SmartDevice(f"Lamp {n + 1}-{d}", "Light"))
+    path = str(tmp_path / "data.db")
+    store = Storage.SQLiteStore(path)
+    store.save_all(gui)
+    store.close()
+    SmartDevice.SmartDevice.get_device_ids().reset()
+    return path
+
+
+def open_lazy(path, max_loaded=None):
+    gui = main.GUI()
+    store = Storage.SQLiteStore(path)
+    gui.store = store
+    store.load_lazy(gui, max_loaded=max_loaded).join()
+    return gui, store
+
+
+def test_homes_are_loaded_on_first_use(tmp_path):
+    gui, store = open_lazy(saved_fleet(tmp_path))
+    try:
+        assert not any(network.is_loaded for network in gui.networks)
+        network = gui.networks[2]
+        assert [home.name for home in network.smart_homes] == ["Home 3"]
+        assert network.is_loaded
+        assert network.smart_homes[0].smart_devices[1].home is network.smart_homes[0]
+        assert [n.is_loaded for n in gui.networks] == [False, False, True, False]
+    finally:
+        store.close()
+
+
+def test_least_recently_used_network_is_evicted(tmp_path):
+    gui, store = open_lazy(saved_fleet(tmp_path), max_loaded=2)
+    first, second, third = gui.networks[:3]
+    try:
+        first.smart_homes
+        second.smart_homes
+        # Using the first network again makes the second one the least recently used
+        assert gui.get_network("1") is first
+        third.smart_homes
+        assert [first.is_loaded, second.is_loaded, third.is_loaded] == [True, False, True]
+    finally:
+        store.close()
+
+
+def test_connected_network_counts_as_used(tmp_path):
+    gui, store = open_lazy(saved_fleet(tmp_path), max_loaded=2)
+    first, second, third = gui.networks[:3]
+    try:
+        first.smart_homes
+        second.smart_homes
+        gui.set_connected_network(first)
+        gui.set_connected_network(None)
+        third.smart_homes
+        assert [first.is_loaded, second.is_loaded] == [True, False]
+    finally:
+        store.close()
+
+
+def test_evicted_network_comes_back_unchanged(tmp_path):
+    gui, store = open_lazy(saved_fleet(tmp_path))
+    network = gui.networks[0]
+    try:
+        network.smart_homes[0].smart_devices[0].toggle()
+        assert store.evict(network)
+        assert not network.is_loaded
+        devices = network.smart_homes[0].smart_devices
+        assert [(device.name, device.is_on) for device in devices] == [("Lamp 1-0", True), ("Lamp 1-1", False)]
+    finally:
+        store.close()
+
+
+def test_network_with_scheduled_operations_is_not_evicted(tmp_path):
+    gui, store = open_lazy(saved_fleet(tmp_path))
+    network = gui.networks[0]
+    try:
+        device = network.smart_homes[0].smart_devices[0]
+        SmartDevice.ScheduledOperation(device.serial_number, "turn_on", 600, False).load(device)
+        assert not store.evict(network)
+        assert network.is_loaded
+    finally:
+        store.close()
@@ -0,0 +1,83 @@
+from datetime import timedelta
+import pytest
+import SmartDevice
+from conftest import START
+
+
+class CountingDevice(SmartDevice.SmartDevice):
+    def __init__(self, name):
+        super().__init__(name, "Counter")
+        self.runs = 0
+
+    def count(self):
+        self.runs += 1
+
+
+def saved_operation(device, target_time, recurring, missed_by, policy=None):
+    operation = SmartDevice.ScheduledOperation(device.serial_number, "count", target_time, recurring)
+    operation.misfire_policy = policy
+    fire_at = START - timedelta(seconds=missed_by)
+    operation.next_fire_at = fire_at.timestamp()
+    operation.anchor_at = fire_at.timestamp()
+    return operation
+
+
+def test_future_fire_time_is_resumed(scheduler):
+    device = CountingDevice("Counter")
+    operation = saved_operation(device, 600, False, -300)
+    assert operation.restore(device, START) == "resumed"
+    scheduler.run_for(299)
+    assert device.runs == 0
+    scheduler.run_for(1)
+    assert device.runs == 1
+
+
+def test_skip_drops_a_missed_one_shot(scheduler):
+    device = CountingDevice("Counter")
+    operation = saved_operation(device, 600, False, 60, SmartDevice.ScheduledOperation.SKIP)
+    assert operation.restore(device, START) == "skipped"
+    assert operation not in SmartDevice.SmartDevice.get_scheduled_operations()
+    scheduler.run_for(3600)
+    assert device.runs == 0
+
+
+def test_grace_runs_late_operations_once(scheduler):
+    device = CountingDevice("Counter")
+    within = saved_operation(device, "every 1m", True, 600, SmartDevice.ScheduledOperation.GRACE)
+    assert within.restore(device, START, grace_seconds=3600) == "caught_up"
+    scheduler.run_for(0)
+    assert device.runs == 1
+
+
+def test_grace_skips_operations_missed_for_too_long(scheduler):
+    device = CountingDevice("Counter")
+    operation = saved_operation(device, "every 10m", True, 7200, SmartDevice.ScheduledOperation.GRACE)
+    assert operation.restore(device, START, grace_seconds=3600) == "skipped"
+    scheduler.run_for(0)
+    assert device.runs == 0
+    # The next run keeps to the planned times
+    assert operation.handle.next_fire_time == START + timedelta(minutes=10)
+
+
+def test_fire_all_catches_up_every_missed_run(scheduler):
+    device = CountingDevice("Counter")
+    operation = saved_operation(device, "every 10m", True, 3600, SmartDevice.ScheduledOperation.FIRE_ALL)
+    assert operation.restore(device, START) == "caught_up"
+    scheduler.run_for(0)
+    # 07:00, 07:10, ... 08:00
+    assert device.runs == 7
+
+
+def test_unknown_policy_is_rejected():
+    device = CountingDevice("Counter")
+    operation = saved_operation(device, 600, False, 60, "sometimes")
+    with pytest.raises(ValueError):
+        operation.restore(device, START)
+
+
+def test_restore_many_reports_what_was_done(scheduler):
+    device = CountingDevice("Counter")
+    saved_operation(device, 600, False, -60)
+    saved_operation(device, 600, False, 60, SmartDevice.ScheduledOperation.SKIP)
+    results = SmartDevice.SmartDevice.restore_scheduled_operations([device])
+    assert results == {"resumed": 1, "skipped": 1}
@@ -0,0 +1,56 @@
+import SmartDevice
+
+
+def test_lookups_follow_added_and_removed_devices(build_network):
+    network = build_network(homes=2, devices=2)
+    home = network.smart_homes[0]
+    lamp = SmartDevice.SmartLight("Lamp")
+    home.add_smart_device(lamp)
+    assert network.get_device(lamp.serial_number) is lamp
+    assert network.get_devices_by_name("Lamp") == [lamp]
+    assert network.get_home_by_name(home.name) is home
+    home.remove_smart_device(lamp)
+    assert network.get_device(lamp.serial_number) is None
+    assert network.get_devices_by_name("Lamp") == []
+    assert len(network.list_smart_devices()) == 4
+
+
+def test_renamed_device_is_found_by_its_new_name(build_network):
+    network = build_network(homes=2, devices=2)
+    device = network.smart_homes[1].smart_devices[0]
+    old_name = device.name
+    # Build the index before the rename, so it has to follow the change
+    assert device in network.get_devices_by_name(old_name)
+    device.name = "Reading Lamp"
+    assert network.get_devices_by_name("Reading Lamp") == [device]
+    assert device not in network.get_devices_by_name(old_name)
+
+
+def test_retyped_device_is_found_by_its_new_type(build_network):
+    network = build_network(homes=1, devices=3)
+    device = network.smart_homes[0].smart_devices[0]
+    assert len(network.get_devices_by_type("Light")) == 3
+    device.device_type = "Lock"
+    assert network.get_devices_by_type("Lock") == [device]
+    assert device not in network.get_devices_by_type("Light")
+    assert network.get_totals().count_by_type("Lock") == 1
+
+
+def test_renamed_home_is_found_by_its_new_name(build_network):
+    network = build_network(homes=2, devices=1)
+    home = network.smart_homes[0]
+    old_name = home.name
+    assert network.get_home_by_name(old_name) is home
+    home.name = old_name + "A"
+    assert network.get_home_by_name(old_name + "A") is home
+    assert network.get_home_by_name(old_name) is None
+
+
+def test_devices_are_listed_home_by_home(build_network):
+    network = build_network(homes=2, devices=2)
+    first, second = network.smart_homes
+    # Build the index, then add a device to the first home after the second home's devices
+    network.get_device(first.smart_devices[0].serial_number)
+    lamp = SmartDevice.SmartLight("Lamp")
+    first.add_smart_device(lamp)
+    assert network.list_smart_devices() == first.smart_devices + second.smart_devices
@@ -0,0 +1,57 @@
+import pytest
+import SmartDevice
+
+
+def schedule(device, delay, recurring=False):
+    operation = SmartDevice.ScheduledOperation(device.serial_number, "toggle", delay, recurring)
+    return operation, operation.load(device)
+
+
+def test_cancel_stops_the_operation_and_unregisters_it(scheduler):
+    device = SmartDevice.SmartDevice("Lamp", "Light")
+    operation, handle = schedule(device, 60)
+    assert operation.handle is handle
+    assert handle.next_fire_time is not None
+    assert handle.cancel()
+    assert not handle.cancel()
+    assert handle.next_fire_time is None
+    assert operation not in SmartDevice.SmartDevice.get_scheduled_operations()
+    scheduler.run_for(120)
+    assert not device.is_on
+
+
+def test_reschedule_moves_the_pending_run(scheduler):
+    device = SmartDevice.SmartDevice("Lamp", "Light")
+    operation, handle = schedule(device, 60)
+    handle.reschedule(300)
+    assert operation.target_time == 300
+    scheduler.run_for(120)
+    assert not device.is_on
+    scheduler.run_for(180)
+    assert device.is_on
+
+
+def test_one_shot_operation_is_removed_after_it_runs(scheduler):
+    device = SmartDevice.SmartDevice("Lamp", "Light")
+    operation, handle = schedule(device, 60)
+    scheduler.run_for(60)
+    assert device.is_on
+    assert handle.cancelled
+    assert operation not in SmartDevice.SmartDevice.get_scheduled_operations()
+
+
+def test_loading_twice_reuses_the_handle(scheduler):
+    device = SmartDevice.SmartDevice("Lamp", "Light")
+    operation, handle = schedule(device, 60)
+    assert operation.load(device) is handle
+    scheduler.run_for(60)
+    # Toggled once, not twice
+    assert device.is_on
+
+
+def test_cancelled_handle_cannot_be_rescheduled():
+    device = SmartDevice.SmartDevice("Lamp", "Light")
+    _, handle = schedule(device, 60)
+    handle.cancel()
+    with pytest.raises(ValueError):
+        handle.reschedule(120)
@@ -0,0 +1,101 @@
+from datetime import datetime
+import pytest
+import Events
+import main
+import Recurrence
+import SmartDevice
+
+MONDAY = datetime(2026, 1, 5, 8, 0)
+
+
+def test_recurrence_is_abstract():
+    with pytest.raises(TypeError):
+        Recurrence.Recurrence("every 1m")
+
+
+def test_interval_counts_from_the_anchor_without_drift():
+    recurrence = Recurrence.parse("every 15m")
+    late = datetime(2026, 1, 5, 8, 16, 40)
+    assert recurrence.next_after(late, MONDAY) == datetime(2026, 1, 5, 8, 30)
+    assert recurrence.count_between(MONDAY, datetime(2026, 1, 5, 9, 0)) == 5
+
+
+def test_daily_times_and_weekdays():
+    recurrence = Recurrence.parse("mon-fri 07:00,19:30")
+    assert recurrence.next_after(MONDAY) == datetime(2026, 1, 5, 19, 30)
+    friday_night = datetime(2026, 1, 9, 20, 0)
+    assert recurrence.next_after(friday_night) == datetime(2026, 1, 12, 7, 0)
+
+
+def test_cron_expression():
+    recurrence = Recurrence.parse("*/20 9-10 * * sat")
+    assert recurrence.upcoming(MONDAY, 3) == [datetime(2026, 1, 10, 9, 0), datetime(2026, 1, 10, 9, 20),
+                                             datetime(2026, 1, 10, 9, 40)]
+
+
+def test_parsed_expressions_are_cached():
+    assert Recurrence.parse("07:00") is Recurrence.parse("07:00")
+
+
+@pytest.mark.parametrize("expression", ["25:00", "every 0m", "sometimes 07:00", "61 * * * *", "every -5s"])
+def test_invalid_expressions_raise(expression):
+    with pytest.raises(ValueError):
+        Recurrence.parse(expression)
+
+
+def test_one_shot_with_zero_delay_runs_straight_away(scheduler):
+    device = SmartDevice.SmartDevice("Lamp", "Light")
+    operation = SmartDevice.ScheduledOperation(device.serial_number, "turn_on", 0, False)
+    handle = operation.load(device)
+    assert handle is not None
+    scheduler.run_for(0)
+    assert device.is_on
+    assert operation not in SmartDevice.SmartDevice.get_scheduled_operations()
+
+
+def test_operation_that_cannot_be_armed_is_not_kept(scheduler):
+    device = SmartDevice.SmartDevice("Lamp", "Light")
+    operation = SmartDevice.ScheduledOperation(device.serial_number, "turn_on", "every 0m", True)
+    assert operation.load(device) is None
+    assert operation not in SmartDevice.SmartDevice.get_scheduled_operations()
+    assert len(scheduler) == 0
+
+
+def test_recurring_operation_keeps_its_planned_times(scheduler):
+    device = SmartDevice.SmartDevice("Lamp", "Light")
+    operation = SmartDevice.ScheduledOperation(device.serial_number, "toggle", "every 10m", True)
+    handle = operation.load(device)
+    scheduler.run_for(35 * 60)
+    assert handle.next_fire_time == datetime(2026, 1, 5, 8, 40)
+    # Three toggles
+    assert device.is_on
+
+
+def schedule_from_menu(build_network, monkeypatch, answers):
+    device = build_network(homes=1, devices=1).smart_homes[0].smart_devices[0]
+    gui = main.GUI()
+    answers = iter(answers)
+    monkeypatch.setattr(gui, "prompt", lambda message: next(answers))
+    gui.schedule_device_operation(device, device.home)
+    return device
+
+
+def test_menu_schedules_a_repeating_operation(build_network, monkeypatch, scheduler, capsys):
+    added = []
+    Events.subscribe(lambda obj, event, data: event == "add_scheduled_operation" and added.append(obj.recurring))
+    device = schedule_from_menu(build_network, monkeypatch, ["every 15m", "yes", "2"])
+    # Stores and the journal record the operation as recurring from the start
+    assert added == [True]
+    operation, = SmartDevice.SmartDevice.get_scheduled_operations()
+    assert operation.recurring
+    scheduler.run_for(30 * 60)
+    assert SmartDevice.SmartDevice.get_scheduled_operations().for_device(device.serial_number) == [operation]
+    assert "(every 15m), next run at" in capsys.readouterr().out
+
+
+def test_menu_schedules_a_one_off_operation(build_network, monkeypatch, scheduler):
+    schedule_from_menu(build_network, monkeypatch, ["every 15m", "no", "1"])
+    operation, = SmartDevice.SmartDevice.get_scheduled_operations()
+    assert not operation.recurring
+    scheduler.run_for(30 * 60)
+    assert len(SmartDevice.SmartDevice.get_scheduled_operations()) == 0
@@ -0,0 +1,43 @@
+import pytest
+import SmartDevice
+
+
+def test_operations_are_indexed_by_id_and_device():
+    registry = SmartDevice.SmartDevice.get_scheduled_operations()
+    first = SmartDevice.ScheduledOperation("DEV-0", "turn_on", 60, False)
+    second = SmartDevice.ScheduledOperation("DEV-0", "turn_off", 120, False)
+    other = SmartDevice.ScheduledOperation("DEV-1", "turn_on", 60, False)
+    assert len(registry) == 3
+    assert registry.get(second.operation_id) is second
+    assert registry.for_device("DEV-0") == [first, second]
+    assert registry.for_device("DEV-1") == [other]
+    assert registry.for_device("DEV-9") == []
+
+
+def test_remove_drops_the_operation_from_both_indexes():
+    registry = SmartDevice.SmartDevice.get_scheduled_operations()
+    operation = SmartDevice.ScheduledOperation("DEV-0", "turn_on", 60, False)
+    registry.remove(operation)
+    assert operation not in registry
+    assert registry.get(operation.operation_id) is None
+    assert registry.for_device("DEV-0") == []
+    with pytest.raises(ValueError):
+        registry.remove(operation)
+
+
+def test_cancel_scheduled_operations_only_touches_one_device():
+    lamp = SmartDevice.SmartDevice("Lamp", "Light")
+    fan = SmartDevice.SmartDevice("Fan", "Fan")
+    SmartDevice.ScheduledOperation(lamp.serial_number, "turn_on", 60, False)
+    kept = SmartDevice.ScheduledOperation(fan.serial_number, "turn_on", 60, False)
+    lamp.cancel_scheduled_operations()
+    assert list(SmartDevice.SmartDevice.get_scheduled_operations()) == [kept]
+
+
+def test_restored_operations_without_ids_get_new_ones():
+    operation = SmartDevice.ScheduledOperation.__new__(SmartDevice.ScheduledOperation)
+    operation.__setstate__({"device_serial_number": "DEV-0", "operation": "turn_on", "target_time": 60,
+                            "recurring": False, "args": (), "kwargs": {}, "handle": None})
+    registry = SmartDevice.ScheduleRegistry([operation])
+    assert operation.operation_id is not None
+    assert registry.get(operation.operation_id) is operation
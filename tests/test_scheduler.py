@@ -0,0 +1,49 @@
+import threading
+import Scheduler
+import SmartDevice
+
+
+def test_callbacks_run_in_due_time_order(scheduler):
+    ran = []
+    for delay in (30, 10, 20):
+        scheduler.schedule(delay, lambda delay=delay: ran.append(delay))
+    assert len(scheduler) == 3
+    assert scheduler.run_for(60) == 3
+    assert ran == [10, 20, 30]
+    assert len(scheduler) == 0
+
+
+def test_cancelled_timer_never_runs(scheduler):
+    ran = []
+    timer = scheduler.schedule(5, lambda: ran.append("cancelled"))
+    scheduler.schedule(10, lambda: ran.append("kept"))
+    assert timer.cancel()
+    assert not timer.cancel()
+    assert len(scheduler) == 1
+    scheduler.run_for(20)
+    assert ran == ["kept"]
+
+
+def test_one_dispatcher_thread_runs_every_operation():
+    before = threading.active_count()
+    scheduler = Scheduler.Scheduler(tick=0, max_workers=2)
+    done = threading.Event()
+    ran = []
+    try:
+        for i in range(200):
+            scheduler.schedule(0.001, lambda i=i: (ran.append(i), len(ran) == 200 and done.set()))
+        assert done.wait(5)
+        # The dispatcher and the two workers, not a thread per operation
+        assert threading.active_count() - before <= 3
+        assert sorted(ran) == list(range(200))
+    finally:
+        scheduler.shutdown()
+
+
+def test_device_operation_runs_when_due(scheduler):
+    device = SmartDevice.SmartDevice("Lamp", "Light")
+    device.schedule_operation("turn_on", 60, False, None)
+    scheduler.run_for(59)
+    assert not device.is_on
+    scheduler.run_for(1)
+    assert device.is_on
@@ -0,0 +1,61 @@
+import random
+import Network
+import SmartDevice
+
+
+def brute_force(network):
+    scores = {}
+    for home in network.smart_homes:
+        secure = [device for device in home.smart_devices if device.device_type in Network.SECURE_TYPES]
+        scores[home] = len(secure) + sum(1 for device in secure if device.is_on)
+    return scores
+
+
+def shuffle_security(network, seed, steps=60):
+    rng = random.Random(seed)
+    makers = (SmartDevice.SmartLock, SmartDevice.SmartCamera, SmartDevice.SmartDoorbell, SmartDevice.SmartDoor)
+    for _ in range(steps):
+        home = rng.choice(network.smart_homes)
+        action = rng.randrange(4)
+        if action == 0 or not home.smart_devices:
+            home.add_smart_device(rng.choice(makers)("Sensor"))
+        elif action == 1:
+            home.remove_smart_device(rng.choice(home.smart_devices))
+        elif action == 2:
+            device = rng.choice(home.smart_devices)
+            device.turn_off() if device.is_on else device.turn_on()
+        else:
+            rng.choice(home.smart_devices).device_type = rng.choice(("Lock", "Light"))
+
+
+def test_scores_match_a_full_rescan(build_network):
+    network = build_network(homes=6, devices=2)
+    audit = network.get_security_audit()
+    for seed in range(3):
+        shuffle_security(network, seed)
+        scores = brute_force(network)
+        assert {home: audit.score(home) for home in network.smart_homes} == scores
+        below = audit.below_threshold(4)
+        assert {home for home, _ in below} == {home for home, score in scores.items() if score < 4}
+        assert [score for _, score in below] == sorted(score for score in scores.values() if score < 4)
+
+
+def test_least_secure_homes_come_first(build_network):
+    network = build_network(homes=5, devices=1)
+    shuffle_security(network, 7)
+    audit = network.get_security_audit()
+    scores = brute_force(network)
+    least = audit.least_secure(3)
+    assert [score for _, score in least] == sorted(scores.values())[:3]
+    assert all(scores[home] == score for home, score in least)
+
+
+def test_removed_homes_leave_the_audit(build_network):
+    network = build_network(homes=3, devices=1)
+    home = network.smart_homes[0]
+    audit = network.get_security_audit()
+    assert home in dict(audit.below_threshold())
+    network.remove_smart_home(home)
+    home.add_smart_device(SmartDevice.SmartLock("Back Lock"))
+    assert home not in dict(audit.below_threshold())
+    assert len(audit) == 2
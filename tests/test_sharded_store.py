@@ -0,0 +1,53 @@
+import os
+import main
+import SmartDevice
+import Storage
+
+
+def describe(gui):
+    return [(network.ip_address, [(home.name, [(device.serial_number, device.is_on) for device in home.smart_devices])
+                                  for home in network.smart_homes])
+            for network in gui.networks]
+
+
+def make_gui(build_network):
+    gui = main.GUI()
+    for ip_address in ("1", "fe80::1"):
+        gui.add_network(build_network(ip_address, homes=2, devices=2))
+    return gui
+
+
+def reload(directory):
+    SmartDevice.SmartDevice.get_device_ids().reset()
+    store = Storage.ShardedStore(directory)
+    try:
+        return store.load(main.GUI())
+    finally:
+        store.close()
+
+
+def test_round_trip(tmp_path, build_network):
+    gui = make_gui(build_network)
+    store = Storage.ShardedStore(str(tmp_path))
+    assert store.save_all(gui) == 3
+    store.close()
+    assert describe(reload(str(tmp_path))) == describe(gui)
+
+
+def test_only_changed_networks_are_written(tmp_path, build_network):
+    gui = make_gui(build_network)
+    store = Storage.ShardedStore(str(tmp_path))
+    store.save_all(gui)
+    assert store.save(gui) == 0
+    gui.networks[1].smart_homes[0].smart_devices[0].toggle()
+    assert store.save(gui) == 2
+    store.close()
+    assert describe(reload(str(tmp_path))) == describe(gui)
+
+
+def test_ipv6_addresses_make_valid_file_names(tmp_path):
+    store = Storage.ShardedStore(str(tmp_path))
+    path = store.shard_path("fe80::1")
+    store.close()
+    assert os.path.dirname(path) == str(tmp_path)
+    assert ":" not in os.path.basename(path)
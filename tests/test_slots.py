@@ -0,0 +1,41 @@
+import pickle
+import pytest
+import Benchmark
+import SmartDevice
+
+
+@pytest.mark.parametrize("cls, args", Benchmark.DEVICE_TYPES)
+def test_devices_have_no_instance_dict(cls, args):
+    device = cls("Device", *args)
+    assert not hasattr(device, "__dict__")
+    with pytest.raises(AttributeError):
+        device.colour_temperature = 4000
+
+
+def test_state_round_trip_through_pickle(build_network):
+    network = build_network(homes=1, devices=1)
+    light = SmartDevice.SmartLight("Desk", brightness=70)
+    network.smart_homes[0].add_smart_device(light)
+    copy = pickle.loads(pickle.dumps(network))
+    copied = copy.smart_homes[0].smart_devices[-1]
+    assert (copied.name, copied.brightness, copied.serial_number) == ("Desk", 70, light.serial_number)
+    assert copied.home is copy.smart_homes[0]
+
+
+def test_state_pickled_before_slots_still_loads():
+    device = SmartDevice.SmartLight.__new__(SmartDevice.SmartLight)
+    device.__setstate__({"name": "Old", "device_type": "Light", "is_on": True, "energy_consumption": 3.5,
+                         "network": None, "home": None, "serial_number": "DEV-4", "brightness": 50,
+                         "colour": "white", "removed_long_ago": 1})
+    assert (device.name, device.brightness, device.device_id) == ("Old", 50, 4)
+
+
+def test_memory_benchmark_leaves_the_device_ids_alone():
+    ids = SmartDevice.SmartDevice.get_device_ids()
+    SmartDevice.SmartDevice("Kept", "Light")
+    results = Benchmark.bench_memory(50)
+    # The templates gave their id back, and the copies never took one
+    assert len(ids) == 1
+    next_id, free = ids.get_state()
+    assert free == list(range(1, next_id))
+    assert all(result["slots_bytes_per_device"] < result["dict_bytes_per_device"] for result in results.values())
@@ -0,0 +1,99 @@
+import io
+from types import SimpleNamespace
+import pytest
+import Events
+import main
+import SmartDevice
+import Snapshot
+import User
+
+
+def describe(gui):
+    return [(network.ip_address, [(home.home_id, home.name, [(type(device).__name__, device.serial_number, device.name,
+                                                              device.is_on, device.energy_consumption)
+                                                             for device in home.smart_devices])
+                                  for home in network.smart_homes])
+            for network in gui.networks]
+
+
+def make_gui(build_network):
+    gui = main.GUI()
+    network = build_network("10.0.0.1", homes=2, devices=3)
+    gui.add_network(network)
+    light = SmartDevice.SmartLight("Desk", brightness=80)
+    network.smart_homes[1].add_smart_device(light)
+    user = User.User("alice")
+    user.connect_to_network(network)
+    gui.add_user(user)
+    SmartDevice.ScheduledOperation(light.serial_number, "set_brightness", "every 1h", True, 40)
+    return gui
+
+
+def reload(data):
+    SmartDevice.SmartDevice.get_device_ids().reset()
+    SmartDevice.SmartDevice.set_scheduled_operations([])
+    return Snapshot.load(io.BytesIO(data), main.GUI())
+
+
+def test_round_trip(build_network):
+    gui = make_gui(build_network)
+    loaded = reload(Snapshot.dumps(gui))
+    assert describe(loaded) == describe(gui)
+    light = loaded.networks[0].smart_homes[1].smart_devices[-1]
+    assert light.brightness == 80
+    assert light.home is loaded.networks[0].smart_homes[1]
+    assert loaded.users[0].network is loaded.networks[0]
+    operation, = loaded.scheduled_operations
+    assert (operation.operation, operation.args, operation.target_time) == ("set_brightness", (40,), "every 1h")
+
+
+def test_device_ids_survive_the_round_trip(build_network):
+    gui = make_gui(build_network)
+    gui.networks[0].smart_homes[0].smart_devices[1].dispose()
+    state = SmartDevice.SmartDevice.get_device_ids().get_state()
+    reload(Snapshot.dumps(gui))
+    assert SmartDevice.SmartDevice.get_device_ids().get_state() == state
+
+
+def test_loading_sets_every_device_quietly(build_network):
+    gui = make_gui(build_network)
+    gui.networks[0].smart_homes[0].smart_devices[1].network = gui.networks[0]
+    data = Snapshot.dumps(gui)
+    events = []
+    Events.subscribe(lambda obj, event, data: events.append(event))
+    loaded = reload(data)
+    assert events == []
+    network = loaded.networks[0]
+    for home in network.smart_homes:
+        assert home.network is network
+        for device in home.smart_devices:
+            assert device.home is home
+            assert device.device_id == SmartDevice.SmartDevice.id_from_serial(device.serial_number)
+    assert [device.network for device in network.smart_homes[0].smart_devices[:2]] == [None, network]
+
+
+def test_one_network_round_trip(build_network):
+    gui = make_gui(build_network)
+    network = gui.networks[0]
+    data = Snapshot.dumps_network(network, list(SmartDevice.SmartDevice.get_scheduled_operations()))
+    loaded, operations = Snapshot.load_network(io.BytesIO(data))
+    assert describe(SimpleNamespace(networks=[loaded])) == describe(gui)
+    assert len(operations) == 1
+
+
+def test_rejects_other_files():
+    with pytest.raises(ValueError):
+        Snapshot.load(io.BytesIO(b"not a snapshot at all"), main.GUI())
+
+
+def test_rejects_newer_formats(build_network):
+    data = bytearray(Snapshot.dumps(make_gui(build_network)))
+    data[len(Snapshot.MAGIC)] = Snapshot.FORMAT_VERSION + 1
+    with pytest.raises(ValueError, match="newer"):
+        Snapshot.load(io.BytesIO(bytes(data)), main.GUI())
+
+
+def test_truncated_file_is_reported(build_network):
+    data = Snapshot.dumps(make_gui(build_network))
+    with pytest.raises(ValueError, match="truncated"):
+        reload(data[:-10])
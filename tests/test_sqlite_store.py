@@ -0,0 +1,95 @@
+import threading
+import main
+import SmartDevice
+import Storage
+import User
+
+
+def make_gui(build_network):
+    gui = main.GUI()
+    network = build_network("1", homes=2, devices=3)
+    gui.add_network(network)
+    user = User.User("alice")
+    user.connect_to_network(network)
+    gui.add_user(user)
+    device = network.smart_homes[0].smart_devices[0]
+    SmartDevice.ScheduledOperation(device.serial_number, "turn_on", "every 1h", True)
+    return gui
+
+
+def reload(path):
+    SmartDevice.SmartDevice.get_device_ids().reset()
+    SmartDevice.SmartDevice.set_scheduled_operations([])
+    store = Storage.SQLiteStore(path)
+    try:
+        return store.load(main.GUI())
+    finally:
+        store.close()
+
+
+def describe(gui):
+    return [(network.ip_address, [(home.home_id, home.name, [(device.serial_number, device.name, device.is_on, device.energy_consumption)
+                                                           for device in home.smart_devices])
+                                  for home in network.smart_homes])
+            for network in gui.networks]
+
+
+def test_round_trip(tmp_path, build_network):
+    gui = make_gui(build_network)
+    store = Storage.SQLiteStore(str(tmp_path / "data.db"))
+    store.save_all(gui)
+    store.close()
+    loaded = reload(str(tmp_path / "data.db"))
+    assert describe(loaded) == describe(gui)
+    assert [user.username for user in loaded.users] == ["alice"]
+    assert loaded.users[0].network is loaded.networks[0]
+    assert [operation.target_time for operation in loaded.scheduled_operations] == ["every 1h"]
+    assert loaded.networks[0].smart_homes[0].smart_devices[0].home is loaded.networks[0].smart_homes[0]
+
+
+def test_save_only_writes_what_changed(tmp_path, build_network):
+    gui = make_gui(build_network)
+    store = Storage.SQLiteStore(str(tmp_path / "data.db"))
+    store.save_all(gui)
+    assert not store.has_changes
+    device = gui.networks[0].smart_homes[1].smart_devices[2]
+    device.toggle()
+    assert store.save() == 1
+    home = gui.networks[0].smart_homes[0]
+    gui.networks[0].remove_smart_home(home)
+    # The home, its three devices and the operation of its first device
+    assert store.save() == 5
+    store.close()
+    loaded = reload(str(tmp_path / "data.db"))
+    assert describe(loaded) == describe(gui)
+    assert loaded.scheduled_operations == []
+
+
+def test_changes_made_while_loading_are_saved(tmp_path, build_network):
+    gui = make_gui(build_network)
+    path = str(tmp_path / "data.db")
+    store = Storage.SQLiteStore(path)
+    store.save_all(gui)
+    device = gui.networks[0].smart_homes[0].smart_devices[0]
+    # Another thread changes a device while the store is in the middle of a load
+    to_operation = store._to_operation
+    changed = threading.Event()
+    threads = []
+    def rename():
+        device.name = "Renamed"
+        changed.set()
+    def load_and_rename(row):
+        thread = threading.Thread(target=rename)
+        thread.start()
+        threads.append(thread)
+        # The rename waits for the store's lock, so give it a moment rather than waiting for it
+        changed.wait(0.2)
+        return to_operation(row)
+    store._to_operation = load_and_rename
+    store.load(main.GUI())
+    threads[0].join()
+    assert store.has_changes
+    store.save()
+    store.close()
+    loaded = reload(path)
+    assert loaded.networks[0].smart_homes[0].smart_devices[0].name == "Renamed"
@@ -0,0 +1,61 @@
+from datetime import timedelta
+import pytest
+import Clock
+import Scheduler
+import SmartDevice
+from conftest import START
+
+
+def test_virtual_clock_only_moves_forward():
+    clock = Clock.VirtualClock(START)
+    assert clock.now() == START
+    clock.advance(90)
+    assert clock.now() == START + timedelta(seconds=90)
+    clock.set_time(30)
+    assert clock.time() == 90
+    with pytest.raises(ValueError):
+        clock.advance(-1)
+
+
+def test_a_week_of_schedules_runs_in_virtual_time(scheduler):
+    device = SmartDevice.SmartDevice("Lamp", "Light")
+    SmartDevice.ScheduledOperation(device.serial_number, "turn_on", "mon-fri 07:00", True).load(device)
+    SmartDevice.ScheduledOperation(device.serial_number, "turn_off", "mon-fri 19:00", True).load(device)
+    runs = scheduler.run_for(7 * 86400)
+    # This Monday's 07:00 had passed, next Monday's has not: 5 mornings and 5 evenings
+    assert runs == 10
+    assert device.is_on
+    assert SmartDevice.SmartDevice.get_clock().now() == START + timedelta(days=7)
+
+
+def test_run_until_needs_a_virtual_clock():
+    scheduler = Scheduler.Scheduler()
+    with pytest.raises(RuntimeError):
+        scheduler.run_until(10)
+    scheduler.shutdown()
+
+
+def test_async_scheduler_rejects_a_virtual_clock():
+    with pytest.raises(ValueError):
+        Scheduler.AsyncScheduler(clock=Clock.VirtualClock())
+    assert Scheduler.AsyncScheduler(clock=Clock.SystemClock()).clock.realtime
+
+
+class FailingLight(SmartDevice.SmartLight):
+    def fail(self):
+        raise RuntimeError("bulb blew")
+
+
+def test_quiet_simulation_prints_only_errors(scheduler, capsys):
+    device = FailingLight("Lamp")
+    SmartDevice.ScheduledOperation(device.serial_number, "turn_on", "07:00", True).load(device)
+    SmartDevice.ScheduledOperation(device.serial_number, "fail", "every 12h", True).load(device)
+    capsys.readouterr()
+    SmartDevice.SmartDevice.set_verbose(False)
+    assert scheduler.run_for(2 * 86400) == 6
+    out = capsys.readouterr().out
+    assert out.count("Error during fail for Lamp: bulb blew") == 4
+    assert "Lamp is now ON" not in out and "Rescheduling" not in out
+    SmartDevice.SmartDevice.set_verbose(True)
+    scheduler.run_for(86400)
+    assert "Rescheduling turn_on for Lamp (07:00)" in capsys.readouterr().out
@@ -0,0 +1,107 @@
+import threading
+import time
+import pytest
+import Network
+import Scheduler
+
+
+def run_batches(scheduler, groups, per_group, work):
+    done = threading.Event()
+    remaining = [len(groups) * per_group]
+    lock = threading.Lock()
+    def callback(group):
+        try:
+            work(group)
+        finally:
+            with lock:
+                remaining[0] -= 1
+                if not remaining[0]:
+                    done.set()
+    for i in range(per_group):
+        for group in groups:
+            # A different tick each time, so every callback is its own batch
+            scheduler.schedule(0.002 * i, lambda group=group: callback(group), group)
+    assert done.wait(10)
+
+
+def test_one_batch_per_group_at_a_time():
+    scheduler = Scheduler.Scheduler(tick=0.001, max_workers=4)
+    groups = [Network.Network(str(i)) for i in range(3)]
+    running = {group: 0 for group in groups}
+    overlap = []
+    lock = threading.Lock()
+    def work(group):
+        with lock:
+            running[group] += 1
+            overlap.append(running[group])
+        time.sleep(0.003)
+        with lock:
+            running[group] -= 1
+    try:
+        run_batches(scheduler, groups, 10, work)
+    finally:
+        scheduler.shutdown()
+    assert max(overlap) == 1
+
+
+def test_failing_operation_does_not_stop_the_others():
+    scheduler = Scheduler.Scheduler(tick=0.001, max_workers=2)
+    ran = []
+    def work(group):
+        ran.append(group)
+        raise RuntimeError("broken device")
+    try:
+        run_batches(scheduler, [Network.Network("1")], 5, work)
+    finally:
+        scheduler.shutdown()
+    assert len(ran) == 5
+
+
+def test_group_lock_is_shared_per_group():
+    scheduler = Scheduler.Scheduler(max_per_group=2)
+    group = Network.Network("1")
+    assert scheduler.group_lock(group) is scheduler.group_lock(group)
+    assert scheduler.group_lock(group) is not scheduler.group_lock(Network.Network("2"))
+    scheduler.shutdown()
+
+
+def test_limits_must_be_positive():
+    with pytest.raises(ValueError):
+        Scheduler.Scheduler(max_queue=0)
+
+
+def test_groups_that_cannot_be_weakly_referenced():
+    scheduler = Scheduler.Scheduler(tick=0.001)
+    ran = []
+    try:
+        groups = ["home-1", 2, ("home", 3)]
+        run_batches(scheduler, groups, 2, ran.append)
+        assert sorted(ran, key=str) == sorted(groups * 2, key=str)
+        assert scheduler.group_lock("home-1") is scheduler.group_lock("home-1")
+    finally:
+        scheduler.shutdown()
+
+
+def test_a_failed_batch_does_not_block_its_group(monkeypatch):
+    scheduler = Scheduler.Scheduler(tick=0.001)
+    dispatch = scheduler._dispatch
+    failed = []
+    def flaky_dispatch(group, callbacks):
+        if not failed:
+            failed.append(group)
+            raise RuntimeError("dispatch failed")
+        dispatch(group, callbacks)
+    monkeypatch.setattr(scheduler, "_dispatch", flaky_dispatch)
+    group = Network.Network("1")
+    ran = threading.Event()
+    try:
+        scheduler.schedule(0, lambda: None, group)
+        deadline = time.monotonic() + 5
+        while not failed and time.monotonic() < deadline:
+            time.sleep(0.001)
+        scheduler.schedule(0.01, ran.set, group)
+        assert ran.wait(5)
+        time.sleep(0.01)
+        assert scheduler._group_active == {} and scheduler._group_backlog == {}
+    finally:
+        scheduler.shutdown()